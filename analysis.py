@@ -0,0 +1,221 @@
+"""
+Annotates the games of a PGN file with the engine's evaluation of every
+position, so that large archives of games can be analysed in one go.
+
+Games are read from the file one at a time as they are needed, and each is
+searched by one of a pool of worker processes, position by position, to a
+fixed depth or for a fixed time per position. A worker analyses a whole game
+so that the transposition table of one position helps with the next.
+
+The games are written back in the order they were read, either as PGN with
+an [%eval] comment after every move and the engine's choice as a variation
+wherever it differs from the move played, or as json lines with one line per
+position. At most --window games are held in memory at once: once that many
+are waiting to be analysed or written, no more are read until the oldest is
+written.
+
+Run with python analysis.py --help for the available options.
+"""
+import argparse
+import collections
+import json
+import multiprocessing
+import sys
+import time
+
+import chess
+import chess.pgn
+
+import resources
+from analysis_cache import AnalysisCache
+from engine import Engine
+
+# Games held in memory per worker, either being analysed or waiting to be
+# written, when no window is given
+WINDOW_PER_WORKER = 4
+
+
+def read_games(pgn_file):
+    """ Yields every game of an open PGN file, reading one at a time. """
+    while True:
+        game = chess.pgn.read_game(pgn_file)
+        if game is None:
+            return
+        yield game
+
+
+def analyse_game(task):
+    """
+    Analyses every position of a game in a worker process.
+    The task is a (game index, starting FEN, moves in UCI, depth, seconds per
+    position, transposition table size in MB, analysis cache path or None)
+    tuple.
+    Returns the game index and, for every position from the start of the game
+    to the end, None if the game is over there and otherwise a dictionary of
+    the engine's best move, its value in pawns from white's point of view,
+    the depth reached and the nodes searched.
+    """
+    game_index, fen, moves, depth, time_limit, tt_size_mb, cache_path = task
+    board = chess.Board(fen)
+    analysis_cache = AnalysisCache(cache_path) if cache_path is not None else None
+    # One engine per side, since the values in each engine's transposition
+    # table are from its own point of view
+    engines = {
+        color: Engine(board, color, tt_size_mb=tt_size_mb, verbose=False,
+                      analysis_cache=analysis_cache)
+        for color in chess.COLORS
+    }
+
+    analyses = []
+    for move_string in moves + [None]:
+        if board.is_game_over():
+            analyses.append(None)
+        else:
+            engine = engines[board.turn]
+            best_move, value, depth_reached, _, stats = engine.cached_search(
+                depth, time_limit, board=board
+            )
+            analyses.append({
+                'best': best_move.uci(),
+                'value': value if board.turn == chess.WHITE else -value,
+                'depth': depth_reached,
+                'nodes': stats.nodes,
+            })
+        if move_string is not None:
+            board.push_uci(move_string)
+
+    for engine in engines.values():
+        engine.close()
+    if analysis_cache is not None:
+        analysis_cache.close()
+    return game_index, analyses
+
+
+def create_task(game_index, game, depth, time_limit, tt_size_mb, cache_path=None):
+    """ Returns the task analysing the main line of a game. """
+    moves = [move.uci() for move in game.mainline_moves()]
+    return (game_index, game.board().fen(), moves, depth, time_limit, tt_size_mb,
+            cache_path)
+
+
+def annotate_game(game, analyses):
+    """
+    Adds the analyses of the positions of the game to it, as an [%eval]
+    comment after every move and a variation wherever the engine's best move
+    is not the move played.
+    """
+    node = game
+    for index, child in enumerate(game.mainline()):
+        analysis = analyses[index]
+        if analysis is not None and analysis['best'] != child.move.uci():
+            node.add_variation(chess.Move.from_uci(analysis['best']))
+        after = analyses[index + 1]
+        if after is not None:
+            evaluation = '[%eval {:.2f}]'.format(after['value'])
+            child.comment = (child.comment + ' ' + evaluation).strip()
+        node = child
+    return game
+
+
+def position_lines(game_index, game, analyses):
+    """ Returns the json lines describing the analysis of every position. """
+    lines = []
+    board = game.board()
+    moves = list(game.mainline_moves()) + [None]
+    for ply, (move, analysis) in enumerate(zip(moves, analyses)):
+        if analysis is not None:
+            lines.append(json.dumps(dict(
+                analysis, game=game_index, ply=ply, fen=board.fen(),
+                move=move.uci() if move is not None else None,
+            )))
+        if move is not None:
+            board.push(move)
+    return lines
+
+
+def run_analysis(input_file, output_file, workers=1, depth=2, time_limit=None,
+                 output_format='pgn', window=None, tt_size_mb=4, verbose=True,
+                 cache_path=None):
+    """
+    Analyses every game read from the input file and writes it to the output
+    file in input order, holding at most window games at once.
+    Positions are looked up in, and their results stored to, the analysis
+    cache at cache_path if one is given.
+    Returns the number of games and positions analysed.
+    """
+    if window is None:
+        window = workers * WINDOW_PER_WORKER
+    # Load the shared resources before forking, so every worker inherits them
+    resources.preload()
+    pool = multiprocessing.Pool(workers)
+    # The games being analysed, oldest first, with their pending results
+    pending = collections.deque()
+    games = positions = 0
+    start_time = time.time()
+
+    def write_oldest():
+        nonlocal games, positions
+        game_index, game, result = pending.popleft()
+        _, analyses = result.get()
+        if output_format == 'json':
+            for line in position_lines(game_index, game, analyses):
+                output_file.write(line + '\n')
+        else:
+            output_file.write(str(annotate_game(game, analyses)) + '\n\n')
+        output_file.flush()
+        games += 1
+        positions += sum(analysis is not None for analysis in analyses)
+        if verbose:
+            duration = time.time() - start_time
+            print('Games {:>6}  positions {:>8}  {:.1f} positions/s'.format(
+                games, positions, positions / duration if duration else 0),
+                file=sys.stderr)
+
+    try:
+        for game_index, game in enumerate(read_games(input_file)):
+            if len(pending) >= window:
+                write_oldest()
+            task = create_task(game_index, game, depth, time_limit, tt_size_mb, cache_path)
+            pending.append((game_index, game, pool.apply_async(analyse_game, (task,))))
+        while pending:
+            write_oldest()
+    finally:
+        pool.terminate()
+        pool.join()
+    return games, positions
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('pgn', help='PGN file of the games to analyse')
+    parser.add_argument('--output', help='file to write to, instead of standard output')
+    parser.add_argument('--format', choices=('pgn', 'json'), default='pgn',
+                        help='annotated PGN, or json lines with one line per position')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(),
+                        help='number of worker processes')
+    parser.add_argument('--depth', type=float, default=2,
+                        help='greatest depth each position is searched to')
+    parser.add_argument('--time', type=float,
+                        help='seconds each position may be searched for')
+    parser.add_argument('--window', type=int,
+                        help='most games to hold in memory at once')
+    parser.add_argument('--hash', type=int, default=4,
+                        help='size of each engine\'s transposition table in MB')
+    parser.add_argument('--cache', help='SQLite file of earlier results to reuse and add to')
+    arguments = parser.parse_args(arguments)
+
+    output_file = open(arguments.output, 'w') if arguments.output else sys.stdout
+    try:
+        with open(arguments.pgn, 'r') as input_file:
+            run_analysis(input_file, output_file, arguments.workers, arguments.depth,
+                         arguments.time, arguments.format, arguments.window,
+                         arguments.hash, cache_path=arguments.cache)
+    finally:
+        if output_file is not sys.stdout:
+            output_file.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,148 @@
+import sqlite3
+import time
+
+import chess
+import chess.polyglot
+
+
+def depends_on_history(board, depth):
+    """
+    Returns whether a search of the board to the given depth could give a
+    different result in another game reaching the same position, which is the
+    case if the search could reach the fifty move rule, or if any position
+    since the last capture or pawn move has already occurred, since the
+    search scores repetitions as draws.
+    """
+    if board.halfmove_clock + depth * 2 >= 100:
+        return True
+    board = board.copy()
+    keys = {chess.polyglot.zobrist_hash(board)}
+    for _ in range(min(board.halfmove_clock, len(board.move_stack))):
+        board.pop()
+        key = chess.polyglot.zobrist_hash(board)
+        if key in keys:
+            return True
+        keys.add(key)
+    return False
+
+
+class AnalysisCache:
+    """
+    Remembers the results of searches on disk, so that positions which come
+    up again in later games, or in other processes, do not have to be
+    searched again.
+
+    Results are stored in an SQLite database, keyed by the Zobrist hash of the
+    position, as the best move, its value in pawns from white's point of view
+    (so that engines of either color can share them) and the depth searched.
+    A result only replaces the stored one if it is at least as deep.
+    Results which may depend on the moves that led to the position (see
+    depends_on_history) are neither stored nor looked up.
+
+    The database is opened in write-ahead logging mode, which lets any number
+    of processes read it while one writes, and each process must open its
+    own AnalysisCache. It holds at most max_entries results: once it has more,
+    those used least recently are removed.
+    """
+    # Stores between checks of whether there are too many results
+    EVICTION_INTERVAL = 100
+    # Seconds to wait for another process to finish writing
+    TIMEOUT = 30
+
+    def __init__(self, path, max_entries=1000000):
+        self.path = path
+        self.max_entries = max_entries
+        self.connection = sqlite3.connect(path, timeout=self.TIMEOUT,
+                                          isolation_level=None,
+                                          check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS positions ('
+            'key INTEGER PRIMARY KEY, move TEXT NOT NULL, score REAL NOT NULL, '
+            'depth REAL NOT NULL, last_used REAL NOT NULL)'
+        )
+        self.connection.execute(
+            'CREATE INDEX IF NOT EXISTS positions_last_used ON positions (last_used)'
+        )
+        self.stores_since_eviction = 0
+
+        self.probes = 0
+        self.hits = 0
+
+    @staticmethod
+    def key(board):
+        """
+        Returns the Zobrist hash of the board as a signed 64 bit integer, which
+        is what SQLite stores.
+        """
+        key = chess.polyglot.zobrist_hash(board)
+        return key - (1 << 64) if key >= 1 << 63 else key
+
+    def probe(self, board, depth=0):
+        """
+        Returns the stored (best move, value, depth) of the board, or None if it
+        has not been stored at least depth deep, or its move is not legal on
+        the board (since different positions may share a hash).
+        Returns None without looking if the result of searching the board may
+        depend on its history.
+        """
+        if depends_on_history(board, depth):
+            return None
+        self.probes += 1
+        key = self.key(board)
+        row = self.connection.execute(
+            'SELECT move, score, depth FROM positions WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None or row[2] < depth:
+            return None
+        move = chess.Move.from_uci(row[0])
+        if not board.is_legal(move):
+            return None
+        self.connection.execute(
+            'UPDATE positions SET last_used = ? WHERE key = ?', (time.time(), key)
+        )
+        self.hits += 1
+        return move, row[1], row[2]
+
+    def store(self, board, move, score, depth):
+        """
+        Stores the result of a search of the board, unless a deeper one has
+        already been stored or the result may depend on the board's history.
+        """
+        if depends_on_history(board, depth):
+            return
+        self.connection.execute(
+            'INSERT INTO positions (key, move, score, depth, last_used) '
+            'VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET move = excluded.move, '
+            'score = excluded.score, depth = excluded.depth, last_used = excluded.last_used '
+            'WHERE excluded.depth >= positions.depth',
+            (self.key(board), move.uci(), score, depth, time.time())
+        )
+        self.stores_since_eviction += 1
+        if self.stores_since_eviction >= self.EVICTION_INTERVAL:
+            self.evict()
+
+    def evict(self):
+        """ Removes the least recently used results beyond max_entries. """
+        self.stores_since_eviction = 0
+        count = self.connection.execute('SELECT COUNT(*) FROM positions').fetchone()[0]
+        if count > self.max_entries:
+            self.connection.execute(
+                'DELETE FROM positions WHERE key IN '
+                '(SELECT key FROM positions ORDER BY last_used LIMIT ?)',
+                (count - self.max_entries,)
+            )
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM positions').fetchone()[0]
+
+    def hit_rate(self):
+        """ Returns the fraction of probes that found a stored result. """
+        if self.probes == 0:
+            return 0.0
+        return self.hits / self.probes
+
+    def close(self):
+        self.connection.close()
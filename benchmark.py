@@ -0,0 +1,246 @@
+"""
+Benchmarks move generation and search, so that changes to the engine can be
+checked for speed regressions.
+
+Run with python benchmark.py --help for the available options.
+The results can be saved as json with --output and compared against a saved
+run with --baseline, in which case the exit status is 1 if anything got worse
+by more than the threshold.
+"""
+import argparse
+import json
+import sys
+import time
+
+import chess
+
+from engine import Engine
+
+# Positions with known move generation node counts, by depth
+PERFT_POSITIONS = [
+    ('start', chess.STARTING_FEN,
+     {1: 20, 2: 400, 3: 8902, 4: 197281}),
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+     {1: 48, 2: 2039, 3: 97862}),
+    ('position3', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+     {1: 14, 2: 191, 3: 2812, 4: 43238}),
+    ('position4', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+     {1: 6, 2: 264, 3: 9467}),
+    ('position5', 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+     {1: 44, 2: 1486, 3: 62379}),
+]
+
+
+def perft(board, depth):
+    """ Returns the number of legal move sequences of the given length. """
+    if depth == 0:
+        return 1
+    if depth == 1:
+        return board.legal_moves.count()
+
+    nodes = 0
+    for move in board.legal_moves:
+        board.push(move)
+        nodes += perft(board, depth - 1)
+        board.pop()
+    return nodes
+
+
+def run_perft(max_depth):
+    """
+    Runs perft on every position in PERFT_POSITIONS up to max_depth, and
+    returns a list of result dictionaries.
+    """
+    results = []
+    for name, fen, expected_counts in PERFT_POSITIONS:
+        board = chess.Board(fen)
+        for depth in sorted(expected_counts):
+            if depth > max_depth:
+                break
+            start_time = time.time()
+            nodes = perft(board, depth)
+            duration = time.time() - start_time
+            results.append({
+                'position': name,
+                'depth': depth,
+                'nodes': nodes,
+                'expected': expected_counts[depth],
+                'correct': nodes == expected_counts[depth],
+                'time': round(duration, 4),
+                'nodes_per_second': round(nodes / duration) if duration else None,
+            })
+    return results
+
+
+def load_epd(path):
+    """ Returns a list of (id, board, operations) tuples from an EPD file. """
+    positions = []
+    with open(path, 'r') as epd_file:
+        for line_number, line in enumerate(epd_file, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            board, operations = chess.Board.from_epd(line)
+            position_id = operations.get('id', str(line_number))
+            positions.append((position_id, board, operations))
+    return positions
+
+
+def run_search(epd_path, depth, seed, settings=None):
+    """
+    Searches every position of the EPD file to the given depth, and returns a
+    list of result dictionaries.
+    settings maps Engine attributes, such as use_null_move, to the values to
+    set them to before searching.
+    """
+    results = []
+    for position_id, board, operations in load_epd(epd_path):
+        engine = Engine(board, board.turn, seed=seed, verbose=False)
+        for name, value in (settings or {}).items():
+            setattr(engine, name, value)
+        start_time = time.time()
+        best_move, best_move_val, depth_reached, _, stats = \
+            engine.iterative_deepening(depth, float('inf'))
+        duration = time.time() - start_time
+
+        result = {
+            'position': position_id,
+            'depth': depth_reached,
+            'nodes': stats.nodes,
+            'leaf_evals': stats.leaf_evals,
+            'first_move_cutoff_ratio': round(stats.first_move_cutoff_ratio(), 4),
+            'tt_hit_rate': round(stats.tt_hit_rate(), 4),
+            'pawn_hit_rate': round(stats.pawn_hit_rate(), 4),
+            'null_move_cutoffs': stats.null_move_cutoffs,
+            'reductions': stats.reductions,
+            're_searches': stats.re_searches,
+            'aspiration_fails': stats.aspiration_fails,
+            'time': round(duration, 4),
+            'nodes_per_second': round(stats.nodes / duration) if duration else None,
+            'time_to_depth': {
+                str(iteration_depth): iteration_duration
+                for iteration_depth, _, _, iteration_duration in engine.iterations
+            },
+            'best_move': board.san(best_move) if best_move else None,
+            'value': best_move_val,
+        }
+        if 'bm' in operations:
+            result['expected_moves'] = [board.san(move) for move in operations['bm']]
+        results.append(result)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Returns a list of descriptions of every regression of the results against
+    the baseline, where a regression is a wrong perft count, or more nodes,
+    fewer nodes per second or a longer total search time than the baseline by
+    more than the threshold (as a fraction).
+    """
+    regressions = []
+
+    for result in results.get('perft', []):
+        if not result['correct']:
+            regressions.append('perft {position} depth {depth}: {nodes} nodes, '
+                               'expected {expected}'.format(**result))
+
+    baseline_searches = {
+        result['position']: result for result in baseline.get('search', [])
+    }
+    for result in results.get('search', []):
+        old = baseline_searches.get(result['position'])
+        if old is None or old['depth'] != result['depth']:
+            continue
+        name = 'search ' + result['position']
+        if result['nodes'] > old['nodes'] * (1 + threshold):
+            regressions.append('{}: {} nodes, baseline {}'.format(
+                name, result['nodes'], old['nodes']))
+        if old['nodes_per_second'] and result['nodes_per_second'] and \
+                result['nodes_per_second'] < old['nodes_per_second'] * (1 - threshold):
+            regressions.append('{}: {} nodes/s, baseline {}'.format(
+                name, result['nodes_per_second'], old['nodes_per_second']))
+
+    total = sum(result['time'] for result in results.get('search', []))
+    old_total = sum(result['time'] for result in baseline.get('search', []))
+    if old_total and total > old_total * (1 + threshold):
+        regressions.append('total search time: {}s, baseline {}s'.format(
+            round(total, 2), round(old_total, 2)))
+
+    return regressions
+
+
+def print_results(results):
+    for result in results.get('perft', []):
+        print('perft {:<10} depth {} {:>9} nodes {:>8.3f}s {}'.format(
+            result['position'], result['depth'], result['nodes'], result['time'],
+            'ok' if result['correct'] else 'WRONG, expected ' + str(result['expected'])))
+    for result in results.get('search', []):
+        print('search {:<14} depth {:<4} {:>8} nodes {:>8.3f}s {:>7} nodes/s  {}'.format(
+            result['position'], result['depth'], result['nodes'], result['time'],
+            result['nodes_per_second'], result['best_move']))
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--perft-depth', type=int, default=3,
+                        help='deepest perft to run, or 0 to skip perft')
+    parser.add_argument('--depth', type=float, default=1,
+                        help='depth to search each EPD position to, or 0 to skip searching')
+    parser.add_argument('--epd', default='benchmark.epd',
+                        help='EPD file of positions to search')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed for the engine\'s random choices')
+    parser.add_argument('--no-quiescence', action='store_true',
+                        help='search without quiescence search')
+    parser.add_argument('--no-null-move', action='store_true',
+                        help='search without null move pruning')
+    parser.add_argument('--no-lmr', action='store_true',
+                        help='search without late move reductions')
+    parser.add_argument('--no-pvs', action='store_true',
+                        help='search without principal variation search')
+    parser.add_argument('--no-aspiration', action='store_true',
+                        help='search without aspiration windows')
+    parser.add_argument('--no-pawn-structure', action='store_true',
+                        help='evaluate without the pawn structure terms')
+    parser.add_argument('--output', help='file to save the results to as json')
+    parser.add_argument('--baseline', help='json results to compare against')
+    parser.add_argument('--threshold', type=float, default=.1,
+                        help='fraction by which a result may be worse than the baseline')
+    arguments = parser.parse_args(arguments)
+
+    settings = {
+        'use_quiescence': not arguments.no_quiescence,
+        'use_null_move': not arguments.no_null_move,
+        'use_late_move_reductions': not arguments.no_lmr,
+        'use_principal_variation_search': not arguments.no_pvs,
+        'use_aspiration_windows': not arguments.no_aspiration,
+        'use_pawn_structure': not arguments.no_pawn_structure,
+    }
+    results = {'seed': arguments.seed, 'settings': settings}
+    if arguments.perft_depth > 0:
+        results['perft'] = run_perft(arguments.perft_depth)
+    if arguments.depth > 0:
+        results['search'] = run_search(
+            arguments.epd, arguments.depth, arguments.seed, settings
+        )
+    print_results(results)
+
+    if arguments.output:
+        with open(arguments.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+
+    regressions = []
+    if arguments.baseline:
+        with open(arguments.baseline, 'r') as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(results, baseline, arguments.threshold)
+    else:
+        regressions = compare(results, {}, arguments.threshold)
+
+    for regression in regressions:
+        print('REGRESSION: ' + regression)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
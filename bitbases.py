@@ -0,0 +1,383 @@
+"""
+Builds and probes endgame bitbases, which tell exactly whether the side with
+the extra piece wins a king and pawn, king and rook or king and queen against
+king (KPK, KRK and KQK) endgame, whatever the search depth.
+
+Each bitbase holds one bit for every arrangement of the side to move, the
+strong king, the weak king and the strong side's piece, which is set if the
+strong side wins. Every other position is a draw, since the lone king can
+never win. Positions with black as the strong side are looked up with the
+board flipped.
+
+The bitbases are built by retrograde analysis: starting from the positions in
+which the lone king is checkmated, the moves are played backwards to find
+every position from which the strong side can force one of them. Run
+python bitbases.py to build them into the bitbases directory.
+"""
+import argparse
+import os
+import sys
+import time
+
+import chess
+
+BITBASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bitbases')
+# Bitbases in the order they have to be built, since KPK looks up the
+# positions after promotions in the others
+PIECE_TYPES = {
+    'KQK': chess.QUEEN,
+    'KRK': chess.ROOK,
+    'KPK': chess.PAWN,
+}
+
+# Positions in each bitbase, by side to move and the squares of the strong
+# king, the weak king and the piece
+SIZE = 2 * 64 * 64 * 64
+STRONG_TO_MOVE = 0
+WEAK_TO_MOVE = 1
+
+KING_MOVES = [list(chess.scan_forward(chess.BB_KING_ATTACKS[square]))
+              for square in chess.SQUARES]
+ROOK_DIRECTIONS = [(0, 1), (0, -1), (1, 0), (-1, 0)]
+QUEEN_DIRECTIONS = ROOK_DIRECTIONS + [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+
+
+def build_rays(directions):
+    """ Returns, for every square, the squares in each direction from it in order. """
+    rays = []
+    for square in chess.SQUARES:
+        square_rays = []
+        for file_step, rank_step in directions:
+            ray = []
+            file = chess.square_file(square) + file_step
+            rank = chess.square_rank(square) + rank_step
+            while 0 <= file < 8 and 0 <= rank < 8:
+                ray.append(chess.square(file, rank))
+                file += file_step
+                rank += rank_step
+            if ray:
+                square_rays.append(ray)
+        rays.append(square_rays)
+    return rays
+
+
+RAYS = {
+    chess.ROOK: build_rays(ROOK_DIRECTIONS),
+    chess.QUEEN: build_rays(QUEEN_DIRECTIONS),
+}
+
+
+def position_index(turn, strong_king, weak_king, piece):
+    """ Returns the index of a position in a bitbase. """
+    return ((turn * 64 + strong_king) * 64 + weak_king) * 64 + piece
+
+
+def is_adjacent(square, other):
+    return chess.square_distance(square, other) <= 1
+
+
+def piece_attacks(piece_type, piece, target, blocker):
+    """
+    Returns whether the strong side's piece attacks the target square, with
+    only the blocker square (the strong king) in its way.
+    """
+    if piece_type == chess.PAWN:
+        return bool(chess.BB_PAWN_ATTACKS[chess.WHITE][piece] & chess.BB_SQUARES[target])
+    for ray in RAYS[piece_type][piece]:
+        for square in ray:
+            if square == target:
+                return True
+            if square == blocker:
+                break
+    return False
+
+
+def is_legal(piece_type, turn, strong_king, weak_king, piece):
+    """
+    Returns whether the position can occur: the three pieces stand on
+    different squares, the kings are not next to each other, pawns are not on
+    the first or last rank, and the side not to move is not in check.
+    """
+    if strong_king == weak_king or piece == strong_king or piece == weak_king:
+        return False
+    if is_adjacent(strong_king, weak_king):
+        return False
+    if piece_type == chess.PAWN and chess.square_rank(piece) in (0, 7):
+        return False
+    if turn == STRONG_TO_MOVE and piece_attacks(piece_type, piece, weak_king, strong_king):
+        return False
+    return True
+
+
+def weak_moves(piece_type, strong_king, weak_king, piece):
+    """
+    Yields every square the weak king can move to, including that of the
+    piece if it can take it.
+    """
+    for square in KING_MOVES[weak_king]:
+        if square == strong_king or is_adjacent(square, strong_king):
+            continue
+        if square != piece and piece_attacks(piece_type, piece, square, strong_king):
+            continue
+        yield square
+
+
+def strong_piece_moves(piece_type, strong_king, weak_king, piece):
+    """
+    Yields every square the strong side's piece can move to, and for pawns
+    the piece it promotes to (or None).
+    """
+    if piece_type == chess.PAWN:
+        forward = piece + 8
+        if forward == strong_king or forward == weak_king:
+            return
+        yield forward, None if forward < 56 else chess.QUEEN
+        if forward >= 56:
+            yield forward, chess.ROOK
+        if chess.square_rank(piece) == 1:
+            double = piece + 16
+            if double != strong_king and double != weak_king:
+                yield double, None
+        return
+    for ray in RAYS[piece_type][piece]:
+        for square in ray:
+            if square == strong_king or square == weak_king:
+                break
+            yield square, None
+
+
+def piece_unmoves(piece_type, strong_king, weak_king, piece):
+    """ Yields every square the strong side's piece could have moved from. """
+    if piece_type == chess.PAWN:
+        back = piece - 8
+        if back < 8 or back == strong_king or back == weak_king:
+            return
+        yield back
+        if chess.square_rank(piece) == 3:
+            double = piece - 16
+            if double != strong_king and double != weak_king:
+                yield double
+        return
+    # Sliding moves are their own reverse
+    for square, _ in strong_piece_moves(piece_type, strong_king, weak_king, piece):
+        yield square
+
+
+def generate(piece_type, promotions=None):
+    """
+    Returns the bitbase for the strong side's piece as a bytearray of packed
+    bits, by retrograde analysis.
+    promotions maps the piece types a pawn can promote to to their already
+    built bitbases, and is needed for KPK.
+    """
+    won = bytearray(SIZE)
+    # Legal moves of the weak king not yet shown to lose, for every position
+    # with the weak side to move
+    remaining = bytearray(SIZE)
+    queue = []
+
+    squares = range(64)
+    for strong_king in squares:
+        for weak_king in squares:
+            for piece in squares:
+                index = position_index(WEAK_TO_MOVE, strong_king, weak_king, piece)
+                if is_legal(piece_type, WEAK_TO_MOVE, strong_king, weak_king, piece):
+                    count = sum(1 for _ in weak_moves(piece_type, strong_king, weak_king, piece))
+                    remaining[index] = count
+                    if count == 0 and piece_attacks(piece_type, piece, weak_king, strong_king):
+                        # Checkmate
+                        won[index] = 1
+                        queue.append(index)
+
+                if piece_type != chess.PAWN or chess.square_rank(piece) != 6:
+                    continue
+                # A pawn that promotes wins if the new piece does
+                if not is_legal(piece_type, STRONG_TO_MOVE, strong_king, weak_king, piece):
+                    continue
+                for to_square, promotion in strong_piece_moves(
+                        piece_type, strong_king, weak_king, piece):
+                    if promotion and probe_bits(promotions[promotion], position_index(
+                            WEAK_TO_MOVE, strong_king, weak_king, to_square)):
+                        index = position_index(STRONG_TO_MOVE, strong_king, weak_king, piece)
+                        if not won[index]:
+                            won[index] = 1
+                            queue.append(index)
+                        break
+
+    while queue:
+        index = queue.pop()
+        turn, rest = divmod(index, 64 * 64 * 64)
+        strong_king, rest = divmod(rest, 64 * 64)
+        weak_king, piece = divmod(rest, 64)
+
+        if turn == WEAK_TO_MOVE:
+            # Every position from which the strong side could have moved here
+            # is won
+            predecessors = [
+                position_index(STRONG_TO_MOVE, square, weak_king, piece)
+                for square in KING_MOVES[strong_king]
+                if square != piece and square != weak_king
+                and not is_adjacent(square, weak_king)
+            ] + [
+                position_index(STRONG_TO_MOVE, strong_king, weak_king, square)
+                for square in piece_unmoves(piece_type, strong_king, weak_king, piece)
+            ]
+            for predecessor in predecessors:
+                if not won[predecessor] and is_legal(
+                        piece_type, STRONG_TO_MOVE, *unpack(predecessor)[1:]):
+                    won[predecessor] = 1
+                    queue.append(predecessor)
+        else:
+            # A position from which the weak king could have moved here is
+            # lost once every one of its moves is
+            for square in KING_MOVES[weak_king]:
+                if square == strong_king or square == piece or is_adjacent(square, strong_king):
+                    continue
+                predecessor = position_index(WEAK_TO_MOVE, strong_king, square, piece)
+                if won[predecessor] or not remaining[predecessor]:
+                    continue
+                if not is_legal(piece_type, WEAK_TO_MOVE, strong_king, square, piece):
+                    continue
+                remaining[predecessor] -= 1
+                if remaining[predecessor] == 0:
+                    won[predecessor] = 1
+                    queue.append(predecessor)
+
+    return pack(won)
+
+
+def unpack(index):
+    """ Returns the side to move and squares of the position at the index. """
+    turn, rest = divmod(index, 64 * 64 * 64)
+    strong_king, rest = divmod(rest, 64 * 64)
+    weak_king, piece = divmod(rest, 64)
+    return turn, strong_king, weak_king, piece
+
+
+def pack(values):
+    """ Returns a list of 0 and 1 values packed into bytes, 8 to a byte. """
+    packed = bytearray(len(values) // 8)
+    for index in range(0, len(values), 8):
+        byte = 0
+        for bit in range(8):
+            if values[index + bit]:
+                byte |= 1 << bit
+        packed[index >> 3] = byte
+    return packed
+
+
+def probe_bits(bits, index):
+    """ Returns whether the bit at the index of a packed bitbase is set. """
+    return (bits[index >> 3] >> (index & 7)) & 1
+
+
+def bitbase_path(name, directory=BITBASE_DIR):
+    return os.path.join(directory, name + '.bin')
+
+
+def load(directory=BITBASE_DIR):
+    """
+    Returns the packed bitbases found in the directory, by the piece type of
+    the strong side. Bitbases which have not been built are left out.
+    """
+    bitbases = {}
+    for name, piece_type in PIECE_TYPES.items():
+        path = bitbase_path(name, directory)
+        if os.path.exists(path):
+            with open(path, 'rb') as bitbase_file:
+                bitbases[piece_type] = bitbase_file.read()
+    return bitbases
+
+
+def probe(bitbases, board):
+    """
+    Returns, for a board with only the two kings and one queen, rook or pawn,
+    1 if white wins with best play, -1 if black wins and 0 if it is a draw.
+    Returns None if the board is not covered by the bitbases.
+    """
+    if chess.popcount(board.occupied) != 3 or board.castling_rights:
+        return None
+    piece_mask = board.occupied & ~board.kings
+    piece = chess.lsb(piece_mask)
+    bits = bitbases.get(board.piece_type_at(piece))
+    if bits is None:
+        return None
+
+    strong = chess.WHITE if piece_mask & board.occupied_co[chess.WHITE] else chess.BLACK
+    strong_king = board.king(strong)
+    weak_king = board.king(not strong)
+    if strong == chess.BLACK:
+        # Flip the board, so that the strong side's pawns move up it
+        strong_king ^= 56
+        weak_king ^= 56
+        piece ^= 56
+    turn = STRONG_TO_MOVE if board.turn == strong else WEAK_TO_MOVE
+    if not probe_bits(bits, position_index(turn, strong_king, weak_king, piece)):
+        return 0
+    return 1 if strong == chess.WHITE else -1
+
+
+def center_distance(square):
+    """ Returns how many files and ranks the square is from the center. """
+    file = chess.square_file(square)
+    rank = chess.square_rank(square)
+    return max(3 - file, file - 4) + max(3 - rank, rank - 4)
+
+
+def confinement(king, piece):
+    """
+    Returns the number of squares in the box the piece's file and rank shut
+    the king into.
+    """
+    king_file, king_rank = chess.square_file(king), chess.square_rank(king)
+    piece_file, piece_rank = chess.square_file(piece), chess.square_rank(piece)
+    files = 8 if king_file == piece_file else \
+        piece_file if king_file < piece_file else 7 - piece_file
+    ranks = 8 if king_rank == piece_rank else \
+        piece_rank if king_rank < piece_rank else 7 - piece_rank
+    return files * ranks
+
+
+def mop_up(board, strong):
+    """
+    Returns a bonus, in hundredths of a pawn, for the strong side making
+    progress in a won bitbase position, since the bitbases only say that the
+    position is won and not how far it is from being won.
+    A pawn should advance with its king close by, and a queen or rook should
+    shut the lone king into as small a box as possible, towards the edge,
+    with the strong king close by.
+    """
+    strong_king = board.king(strong)
+    weak_king = board.king(not strong)
+    piece = chess.lsb(board.occupied & ~board.kings)
+    if board.pawns:
+        rank = chess.square_rank(piece)
+        return 10 * (rank if strong == chess.WHITE else 7 - rank) \
+            - 2 * chess.square_distance(strong_king, piece)
+    return (64 - confinement(weak_king, piece)) \
+        + 10 * center_distance(weak_king) \
+        + 4 * (14 - chess.square_manhattan_distance(strong_king, weak_king))
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', default=BITBASE_DIR,
+                        help='directory to write the bitbases to')
+    arguments = parser.parse_args(arguments)
+
+    os.makedirs(arguments.output, exist_ok=True)
+    built = {}
+    for name, piece_type in PIECE_TYPES.items():
+        start_time = time.time()
+        built[piece_type] = generate(piece_type, built)
+        with open(bitbase_path(name, arguments.output), 'wb') as bitbase_file:
+            bitbase_file.write(built[piece_type])
+        print('{}: {} positions won, {:.1f}s'.format(
+            name, sum(bin(byte).count('1') for byte in built[piece_type]),
+            time.time() - start_time))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
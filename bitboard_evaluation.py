@@ -0,0 +1,66 @@
+import chess
+
+# NumPy is only needed to score many boards at once with evaluate_many
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class BitboardEvaluator:
+    """
+    Scores positions from the bitboards of each piece type and color, rather
+    than going through the Piece objects of board.piece_map.
+
+    Scores are in hundredths of a pawn from white's point of view, the same as
+    SearchBoard.score, and use the table built by
+    SearchBoard.build_square_values, in which black's values are already
+    flipped to black's side of the board.
+    """
+    def __init__(self, square_values):
+        # One table per color and piece type, with black's values negated so
+        # that the score is a single sum over every table
+        self.tables = []
+        for color in chess.COLORS:
+            for piece_type in chess.PIECE_TYPES:
+                values = square_values[color][piece_type]
+                if color == chess.BLACK:
+                    values = [-value for value in values]
+                self.tables.append((piece_type, color, values))
+
+        self.table_array = None
+        if np is not None:
+            self.table_array = np.array(
+                [values for _, _, values in self.tables], dtype=np.int64
+            )
+
+    def masks(self, board):
+        """ Returns the bitboard of every table's piece type and color. """
+        return [board.pieces_mask(piece_type, color)
+                for piece_type, color, _ in self.tables]
+
+    def evaluate(self, board):
+        """ Returns the score of a single board. """
+        score = 0
+        for piece_type, color, values in self.tables:
+            for square in chess.scan_forward(board.pieces_mask(piece_type, color)):
+                score += values[square]
+        return score
+
+    def evaluate_many(self, boards):
+        """
+        Returns a NumPy array of the scores of every given board, worked out
+        with a single vectorised calculation over all of their bitboards.
+        """
+        if np is None:
+            raise ImportError('evaluate_many requires NumPy')
+
+        masks = np.array([self.masks(board) for board in boards], dtype=np.uint64)
+        if len(masks) == 0:
+            return np.zeros(0, dtype=np.int64)
+        # Split every bitboard into its 64 squares, square 0 first
+        squares = np.unpackbits(
+            masks.astype('<u8').view(np.uint8).reshape(len(boards), len(self.tables), 8),
+            axis=2, bitorder='little',
+        )
+        return np.einsum('bts,ts->b', squares.astype(np.int64), self.table_array)
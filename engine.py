@@ -1,8 +1,25 @@
 import chess
+import chess.polyglot
 import random
 import time
-import json
-import multiprocessing.dummy
+import threading
+import resources
+import bitbases
+from transposition_table import TranspositionTable
+from pawn_structure import PawnHashTable, evaluate_pawn_structure
+from move_ordering import MoveOrderer, static_exchange_evaluation
+from search_board import SearchBoard
+from principal_variation import PrincipalVariationTable
+from parallel_search import ParallelSearch
+from search_stats import SearchStats
+from time_manager import TimeManager
+
+__all__ = ['Player', 'Human', 'Engine', 'SearchAborted']
+
+
+class SearchAborted(Exception):
+    """ Raised inside a search to unwind it once it has been told to stop. """
+
 
 class Player:
     """
@@ -75,103 +92,143 @@ class Human(Player):
 
 class Engine(Player):
     """ Represents a Player played by the computer. """
-    def __init__(self, board, color):
+    # How much more than the captured piece a capture could gain through
+    # piece square values, used to skip captures in quiescence search
+    DELTA_MARGIN = 2
+    # Width of the window used to test whether a move is better than a bound,
+    # the smallest difference between two scores
+    NULL_WINDOW = .01
+    # How much shallower the search after a null move is, besides the half
+    # move the null move itself takes
+    NULL_MOVE_REDUCTION = 1
+    # Quiet moves ordered after this many others are searched half a move
+    # shallower, and only searched again at full depth if they turn out better
+    LATE_MOVE_INDEX = 3
+    # Half the width of the window around the value of the previous iteration
+    # that each iteration of iterative deepening is first searched with
+    ASPIRATION_WINDOW = .5
+    # Value of a position the endgame bitbases show to be won, to which a
+    # bonus for making progress is added, kept well clear of checkmate
+    BITBASE_WIN = 500
+    # Positions covered by the bitbases are searched no deeper than this,
+    # since the bitbases already give their exact result
+    BITBASE_SEARCH_DEPTH = 3
+    # Pondering searches this deep, which it is never given the time to
+    # reach, so that it carries on until the opponent moves
+    PONDER_DEPTH = 64
+    # Seconds between checks of whether the search continued after a ponder
+    # hit has reached the depth asked for
+    PONDER_POLL_INTERVAL = .01
+    # Attributes which change how a search is made, which worker processes
+    # searching for this engine must share
+    SEARCH_SETTINGS = (
+        'use_quiescence', 'use_null_move', 'use_late_move_reductions',
+        'use_principal_variation_search', 'use_aspiration_windows',
+        'use_pawn_structure', 'use_bitbases', 'search_depth',
+    )
+
+    def __init__(self, board, color, tt_size_mb=16, workers=1, seed=None,
+                 trace=None, verbose=True, ponder=False, analysis_cache=None):
         super().__init__(board, color)
 
+        # All random choices are made with this generator, so that giving a
+        # seed makes every search and book move repeatable
+        self.seed = seed
+        self.random = random.Random(seed)
+
+        # Counts of what the current search has done
+        self.stats = SearchStats()
+        # An optional function which is called with a dictionary describing
+        # every completed iteration and search, such as a JsonLinesTracer
+        self.trace = trace
+        # Whether generate_move prints the moves and statistics of its searches
+        self.verbose = verbose
+
+        # How deep, and for how many seconds, generate_move searches
+        self.search_depth = 2
+        self.time_limit = 15
+
+        # The time left on the engine's clock and its increment, in seconds,
+        # which when set are used instead of time_limit
+        self.remaining_time = None
+        self.increment = 0
+        # The TimeManager of the current search, once it may be stopped
+        self.time_manager = None
+
+        # Setting this from another thread makes the current search stop
+        self.abort_search = False
+        # Whether to search on the opponent's time, while a Human is thinking
+        self.ponder = ponder
+        self.ponder_move = None
+        self.ponder_thread = None
+        self.ponder_result = None
+        self.ponder_start_time = None
+        # Left by the last search, as the first move of the expected reply
+        self.principal_variation = []
+        # The result of the search made by the last call to generate_move
+        self.last_result = None
+
+        # Results of positions that have already been searched, so that
+        # transpositions are not searched again
+        self.transposition_table = TranspositionTable(tt_size_mb)
+        # Values of pawn structures that have already been evaluated, which
+        # rarely change from one position of a search to the next
+        self.pawn_hash_table = PawnHashTable()
+        # Moves of the principal variation of the last completed iteration,
+        # keyed by the Zobrist hash of the position they are played from
+        self.pv_moves = {}
+        # The best line found from the position at every ply of the search
+        self.principal_variation_table = PrincipalVariationTable(MoveOrderer.MAX_PLY)
+        # Killer moves and history scores used to search good moves first
+        self.move_orderer = MoveOrderer()
+        # An optional AnalysisCache of results of earlier searches, which may
+        # be shared with other engines and processes
+        self.analysis_cache = analysis_cache
+
+        # Keep searching captures at the end of the search until the position
+        # is quiet
+        self.use_quiescence = True
+        # Skip searching positions in which even passing the move would be too
+        # good for the side to move (null move pruning)
+        self.use_null_move = True
+        # Search quiet moves ordered late less deeply (late move reductions)
+        self.use_late_move_reductions = True
+        # Search every move but the first with a null window, only to show
+        # that it is no better than the best move so far (principal variation
+        # search)
+        self.use_principal_variation_search = True
+        # Search each iteration with a window around the previous iteration's
+        # value, widening it only if the value falls outside
+        self.use_aspiration_windows = True
+        # Count doubled, isolated and passed pawns in the evaluation
+        self.use_pawn_structure = True
+        # Look up positions with only a queen, rook or pawn left in the endgame
+        # bitbases instead of evaluating them
+        self.use_bitbases = True
+
+        # With more than one worker, the root moves of each search are split
+        # between that many worker processes
+        self.workers = workers
+        self.parallel_search = None
+        if workers > 1:
+            self.parallel_search = ParallelSearch(workers, color, tt_size_mb, seed)
+
         # Since game is just starting, we are in the opening and not middle_game
         self.is_opening = True
         self.is_middle_game = False
 
-        # Set the piece values to some generally accepted constants
-        self.PIECE_VALUES = {
-            chess.PAWN: 1,
-            chess.KNIGHT: 3,
-            chess.BISHOP: 3.2,
-            chess.ROOK: 5,
-            chess.QUEEN: 9,
-            chess.KING: 200,
-        }
-
-        # Load the openings, which are stored in a json file
-        # Note: openings are stored as a list of dictionaries
-        with open('json/openings.json', 'r') as openings_file:
-            self.openings = json.load(openings_file)
-
-        # Create a square value matrix for each piece type
-
-        # This will encourage certain generally strong tactics to be played,
-        # such as keeping the knights in the center and taking control of the
-        # center with the pawns
-
-        # Each matrix is stored as a single-dimensional list, since the Board
-        # class of chess refers to each square using a single integer
-        self.PIECE_SQUARES = {
-            chess.PAWN: [
-                 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0,
-                 0.5, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5,
-                 0.1, 0.1, 0.2, 0.3, 0.3, 0.2, 0.1, 0.1,
-                 .05, .05, 0.1, .25, .25, 0.1, .05, .05,
-                 0.0, 0.0, 0.0, 0.2, 0.2, 0.0, 0.0, 0.0,
-                 .05,-.05,-0.1, 0.0, 0.0,-0.1,-.05, .05,
-                 .05, 0.1, 0.1,-0.2,-0.2, 0.1, 0.1, .05,
-                 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0
-            ],
-            chess.KNIGHT: [
-                -0.5,-0.4,-0.3,-0.3,-0.3,-0.3,-0.4,-0.5,
-                -0.4,-0.2, 0.0, 0.0, 0.0, 0.0,-0.2,-0.4,
-                -0.3, 0.0, 0.1, .15, .15, 0.1, 0.0,-0.3,
-                -0.3, .05, .15, 0.2, 0.2, .15, .05,-0.3,
-                -0.3, 0.0, .15, 0.2, 0.2, .15, 0.0,-0.3,
-                -0.3, .05, 0.1, .15, .15, 0.1, .05,-0.3,
-                -0.4,-0.2, 0.0, .05, .05, 0.0,-0.2,-0.4,
-                -0.5,-0.4,-0.3,-0.3,-0.3,-0.3,-0.4,-0.5,
-            ],
-            chess.BISHOP: [
-                -0.2,-0.1,-0.1,-0.1,-0.1,-0.1,-0.1,-0.2,
-                -0.1, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0,-0.1,
-                -0.1, 0.0, .05, 0.1, 0.1, .05, 0.0,-0.1,
-                -0.1, .05, .05, 0.1, 0.1, .05, .05,-0.1,
-                -0.1, 0.0, 0.1, 0.1, 0.1, 0.1, 0.0,-0.1,
-                -0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1,-0.1,
-                -0.1, .05, 0.0, 0.0, 0.0, 0.0, .05,-0.1,
-                -0.2,-0.1,-0.1,-0.1,-0.1,-0.1,-0.1,-0.2,
-            ],
-            chess.ROOK: [
-                 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0,
-                 .05, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, .05,
-                -.05, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0,-.05,
-                -.05, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0,-.05,
-                -.05, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0,-.05,
-                -.05, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0,-.05,
-                -.05, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0,-.05,
-                 0.0, 0.0, 0.0, .05, .05, 0.0, 0.0, 0.0,
-            ],
-            chess.QUEEN: [
-                -0.2,-0.1,-0.1,-.05,-.05,-0.1,-0.1,-0.2,
-                -0.1, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0,-0.1,
-                -0.1, 0.0, .05, .05, .05, .05, 0.0,-0.1,
-                -.05, 0.0, .05, .05, .05, .05, 0.0,-.05,
-                 0.0, 0.0, .05, .05, .05, .05, 0.0,-.05,
-                -0.1, .05, .05, .05, .05, .05, 0.0,-0.1,
-                -0.1, 0.0, .05, 0.0, 0.0, 0.0, 0.0,-0.1,
-                -0.2,-0.1,-0.1,-.05,-.05,-0.1,-0.1,-0.2,
-            ],
-            chess.KING: [
-                -0.3,-0.4,-0.4,-0.5,-0.5,-0.4,-0.4,-0.3,
-                -0.3,-0.4,-0.4,-0.5,-0.5,-0.4,-0.4,-0.3,
-                -0.3,-0.4,-0.4,-0.5,-0.5,-0.4,-0.4,-0.3,
-                -0.3,-0.4,-0.4,-0.5,-0.5,-0.4,-0.4,-0.3,
-                -0.2,-0.3,-0.3,-0.4,-0.4,-0.3,-0.3,-0.1,
-                -0.1,-0.2,-0.2,-0.2,-0.2,-0.2,-0.2,-0.1,
-                 0.2, 0.2, 0.0, 0.0, 0.0, 0.0, 0.2, 0.2,
-                 0.2, 0.3, 0.1, 0.0, 0.0, 0.1, 0.3, 0.2,
-            ],
-        }
-
-        # Reverse every matrix so that the bottom right corner of each matrix is
-        # indexed as 0 and the top left corner is indexed as 63
-        for piece_square_matrix in self.PIECE_SQUARES.values():
-            piece_square_matrix.reverse()
+        # The piece values, tables and opening book are loaded once and
+        # shared by every Engine in the process
+        self.PIECE_VALUES = resources.PIECE_VALUES
+        self.PIECE_SQUARES = resources.piece_squares()
+        self.square_values = resources.square_values()
+        self.bitboard_evaluator = resources.bitboard_evaluator()
+        self.opening_book = resources.opening_book()
+        self.endgame_bitbases = resources.endgame_bitbases()
+
+    def search_settings(self):
+        """ Returns the value of every attribute in SEARCH_SETTINGS by name. """
+        return {name: getattr(self, name) for name in self.SEARCH_SETTINGS}
 
     def get_move_history(self, board=None):
         """
@@ -199,33 +256,14 @@ class Engine(Player):
             board.push(move)
         return move_history
 
-    def is_possible_opening(self, opening, move_history):
-        try:
-            opening_move_history = opening['m'][:len(move_history)]
-        except:
-            return False
-        return opening_move_history == move_history and len(opening['m']) > len(move_history)
-
     def generate_opening_move(self):
-        move_history = self.get_move_history()
-        move_history = [str(move) for move in move_history]
-
-        possible_openings = []
-        for opening in self.openings:
-            if self.is_possible_opening(opening, move_history):
-                possible_openings.append(opening)
-
-        if not possible_openings:
-            return False
-        else:
-            random.shuffle(possible_openings)
-            fewest_moves = min([len(opening['m']) for opening in possible_openings])
-            closest_possible_openings = []
-            for possible_opening in possible_openings:
-                if len(possible_opening['m']) == fewest_moves:
-                    closest_possible_openings.append(possible_opening)
-            chosen_opening = random.choice(closest_possible_openings)
-            return chosen_opening, chosen_opening['m'][len(move_history)]
+        """
+        Returns a (opening, move string) pair for a randomly chosen book move
+        from the current position, where the move string is the move in UCI,
+        or False if the position is not in the opening book.
+        The opening is None if the book does not store openings by name.
+        """
+        return self.opening_book.choose_move(self.board, self.random)
 
     def invert_index(self, index):
         row = index // 8
@@ -251,194 +289,926 @@ class Engine(Player):
         if board is None:
             board = self.board
 
-        threefold_repetition = board.can_claim_threefold_repetition()
-        if board.is_game_over():
-            result = board.result()
-            if result == '1-0':
-                winner = chess.WHITE
-            elif result == '0-1':
-                winner = chess.BLACK
-            elif result == '1/2-1/2' or three_fold_repetition:
-                winner = None
-
-            if winner == None:
-                return 0
-            elif winner == self.color:
-                return 999
-            elif winner != self.color:
-                return -999
+        # Draws by threefold repetition and the fifty move rule count as soon
+        # as they can be claimed
+        outcome = board.outcome(claim_draw=True)
+        if outcome is None:
+            return self.evaluate_position(board)
+        if outcome.winner is None:
+            return 0
+        elif outcome.winner == self.color:
+            return 999
         else:
-            piece_map = board.piece_map()
-            own_piece_values = self.piece_values(self.color, piece_map, board)
-            opponent_color = chess.WHITE if self.color == chess.BLACK else chess.BLACK
-            opponent_piece_values = self.piece_values(opponent_color, piece_map)
-            return own_piece_values - opponent_piece_values
+            return -999
 
-    def minimax(self, depth, maximizing=True, alpha=-1000, beta=1000):
-        self.calls_to_minimax += 1
-        if self.calls_to_minimax % 1000 == 0:
-            print(self.calls_to_minimax)
+    def evaluate_material(self, board):
+        """
+        Returns the value of this engine's pieces and the squares they stand on
+        less that of the opponent's, without checking whether the game is over.
+        """
+        if isinstance(board, SearchBoard):
+            # The score is kept up to date as moves are made during a search,
+            # so it only has to be converted to this engine's point of view
+            score = board.score / 100
+        else:
+            score = self.bitboard_evaluator.evaluate(board) / 100
+        return score if self.color == chess.WHITE else -score
+
+    def evaluate_pawn_structure(self, board):
+        """
+        Returns the value of the pawn structure of the board in pawns from
+        this engine's point of view, from the pawn hash table if it has
+        already been evaluated.
+        """
+        pawns = board.pawns
+        white_pawns = pawns & board.occupied_co[chess.WHITE]
+        black_pawns = pawns & board.occupied_co[chess.BLACK]
+        self.stats.pawn_probes += 1
+        score = self.pawn_hash_table.probe(white_pawns, black_pawns)
+        if score is None:
+            score = evaluate_pawn_structure(white_pawns, black_pawns)
+            self.pawn_hash_table.store(white_pawns, black_pawns, score)
+        else:
+            self.stats.pawn_hits += 1
+        score /= 100
+        return score if self.color == chess.WHITE else -score
+
+    def evaluate_bitbase(self, board):
+        """
+        Returns the value of the board from the endgame bitbases, which is 0 for
+        a draw and BITBASE_WIN plus a bonus for progress towards the win for a
+        win, from this engine's point of view, or None if the board is not
+        covered by the bitbases.
+        """
+        result = bitbases.probe(self.endgame_bitbases, board)
+        if result is None or result == 0:
+            return result
+        strong = chess.WHITE if result > 0 else chess.BLACK
+        value = self.BITBASE_WIN + bitbases.mop_up(board, strong) / 100
+        return value if strong == self.color else -value
+
+    def evaluate_position(self, board):
+        """
+        Returns the static evaluation of the board used by the search: its
+        material value together with its pawn structure, or its value from
+        the endgame bitbases if it is covered by them, without checking
+        whether the game is over.
+        """
+        if self.use_bitbases and chess.popcount(board.occupied) == 3:
+            value = self.evaluate_bitbase(board)
+            if value is not None:
+                return value
+        if self.use_pawn_structure:
+            return self.evaluate_material(board) + self.evaluate_pawn_structure(board)
+        return self.evaluate_material(board)
 
+    def evaluate_many(self, boards):
+        """
+        Returns a list of the material values, as given by evaluate_material,
+        of every given board, scored together in one vectorised call.
+        Requires NumPy.
+        """
+        scores = self.bitboard_evaluator.evaluate_many(boards) / 100
+        if self.color == chess.BLACK:
+            scores = -scores
+        return scores.tolist()
+
+    def minimax(self, depth, maximizing=True, alpha=-1000, beta=1000):
+        self.stats.nodes += 1
         if depth == 0 or self.board.is_game_over():
-            self.board_evaluations += 1
+            self.stats.leaf_evals += 1
             return (None, self.evaluate_board())
 
+        # Moves of equal value are each kept with an even chance
         if maximizing:
-            best_move = (None, -1000)
-            possible_moves = [move for move in self.board.legal_moves]
-            for move in possible_moves:
+            best_move, best_value = None, -1000
+            for move in list(self.board.generate_legal_moves()):
                 self.board.push(move)
                 move_value = self.minimax(depth-.5, not maximizing)[1]
                 self.board.pop()
 
-                if move_value > best_move[1]:
-                    best_move = (move, move_value)
-                elif move_value == best_move[1]:
-                    best_move = random.choice([best_move, (move, move_value)])
+                if move_value > best_value or (
+                        move_value == best_value and self.random.random() < .5):
+                    best_move, best_value = move, move_value
 
         elif not maximizing:
-            best_move = (None, 1000)
-            possible_moves = [move for move in self.board.legal_moves]
-            for move in possible_moves:
+            best_move, best_value = None, 1000
+            for move in list(self.board.generate_legal_moves()):
                 self.board.push(move)
                 move_value = self.minimax(depth-.5, not maximizing)[1]
                 self.board.pop()
 
-                if move_value < best_move[1]:
-                    best_move = (move, move_value)
-                elif move_value == best_move[1]:
-                    best_move = random.choice([best_move, (move, move_value)])
+                if move_value < best_value or (
+                        move_value == best_value and self.random.random() < .5):
+                    best_move, best_value = move, move_value
 
-        print(str(self.board_evaluations) + 'evaluations')
-        print(str(self.calls_to_minimax) + ' calls to minimax')
-        return best_move
+        return best_move, best_value
 
-    def evaluate_branch_of_root(self, data):
-        move, depth, board = data
-        board.push(move)
-        return move, self.alpha_beta_minimax(depth-.5, False, board=board)
+    def create_search_board(self, board=None):
+        """
+        Returns a copy of the given board, or self.board if none is given,
+        which keeps its score up to date as moves are pushed and popped, to be
+        used for searching.
+        """
+        if board is None:
+            board = self.board
+        return SearchBoard.from_board(board, self.square_values)
 
-    def alpha_beta_minimax_from_root(self, depth):
+    def alpha_beta_minimax_from_root(self, depth, deadline=None, first_move=None,
+                                     board=None, alpha=-1000, beta=1000):
+        """
+        Searches every legal move from the given board, or self.board if none
+        is given, to the given depth and returns the best move, its value, the
+        depth, the duration of the search and its SearchStats.
+        If first_move is given it is searched before every other move.
+        If the value is outside the window given by alpha and beta, it is only
+        a bound on the true value, as in alpha_beta_minimax.
+        If a deadline (as given by time.time()) is given and it passes before
+        every move has been searched, None is returned instead.
+        """
         start_time = time.time()
-        self.static_evals = 0
-        possible_moves = [move for move in self.board.legal_moves]
-        random.shuffle(possible_moves)
+        self.stats = SearchStats()
+        self.transposition_table.new_search()
+        board = self.create_search_board(board)
+        principal_variation_table = self.principal_variation_table
+        principal_variation_table.clear(0)
+        possible_moves = list(board.generate_legal_moves())
+        # Shuffle first so that moves the orderer scores equally are still
+        # played in varying order from game to game
+        self.random.shuffle(possible_moves)
+        possible_moves = self.move_orderer.order_moves(
+            board, possible_moves, 0, first_move
+        )
         best_move = None
         best_move_val = -1000
 
         for move in possible_moves:
-            self.board.push(move)
-            move_val = self.alpha_beta_minimax(depth-.5, False)
-            self.board.pop()
-            if move_val > best_move_val:
+            if deadline is not None and time.time() > deadline:
+                return None
+            if self.abort_search:
+                raise SearchAborted()
+
+            board.push(move)
+            if best_move is not None and self.use_principal_variation_search:
+                move_val = self.search_later_move(
+                    board, depth, True, max(alpha, best_move_val), beta, 0, False
+                )
+            else:
+                move_val = self.alpha_beta_minimax(
+                    depth-.5, False, max(alpha, best_move_val), beta, board
+                )
+            board.pop()
+            if best_move is None or move_val > best_move_val:
                 best_move = move
                 best_move_val = move_val
+                principal_variation_table.update(0, move)
+            if best_move_val >= beta:
+                break
+
+        # Store the root so that the principal variation can be read back
+        # from the transposition table
+        key = board.key
+        self.store_transposition(key, depth, best_move_val, alpha, beta, best_move)
 
         end_time = time.time()
         duration = round(end_time - start_time, 2)
-        return best_move, best_move_val, depth, duration
+        return best_move, best_move_val, depth, duration, self.stats
+
+    def aspiration_search(self, depth, deadline, first_move, board, previous_val):
+        """
+        Searches the root in the same way as alpha_beta_minimax_from_root, but
+        with a narrow window around the value of the previous iteration, which
+        cuts off far more of the tree.
+        If the value falls outside the window, the root is searched again with
+        the window widened on that side, until the value falls inside it.
+        """
+        stats = SearchStats()
+        duration = 0
+        alpha_margin = beta_margin = self.ASPIRATION_WINDOW
+        while True:
+            alpha = max(-1000, previous_val - alpha_margin)
+            beta = min(1000, previous_val + beta_margin)
+            result = self.alpha_beta_minimax_from_root(
+                depth, deadline, first_move, board, alpha, beta
+            )
+            stats.merge(self.stats)
+            self.stats = stats
+            if result is None:
+                return None
+
+            best_move, best_move_val, _, search_duration, _ = result
+            duration += search_duration
+            if best_move_val <= alpha and alpha > -1000:
+                alpha_margin *= 4
+            elif best_move_val >= beta and beta < 1000:
+                beta_margin *= 4
+                first_move = best_move
+            else:
+                return best_move, best_move_val, depth, round(duration, 2), stats
+            stats.aspiration_fails += 1
+
+    def get_principal_variation(self, depth, board=None):
+        """
+        Returns the expected line of play from the given board, which must be
+        the root of the last search: the line the search collected in
+        self.principal_variation_table, continued by following the best moves
+        stored in the transposition table wherever it stops short.
+        The line is at most depth full moves long.
+        """
+        if board is None:
+            board = self.board
+        board = board.copy()
+
+        principal_variation = []
+        seen_keys = set()
+        collected = self.principal_variation_table.line(0)
+        while len(principal_variation) < depth * 2:
+            key = chess.polyglot.zobrist_hash(board)
+            if len(principal_variation) < len(collected):
+                move = collected[len(principal_variation)]
+            else:
+                entry = self.transposition_table.probe(key)
+                move = entry.move if entry is not None else None
+            # Stop at positions that were never searched, and at repetitions
+            if move is None or key in seen_keys or not board.is_legal(move):
+                break
+            seen_keys.add(key)
+            principal_variation.append(move)
+            board.push(move)
 
-    def alpha_beta_minimax_with_multithreading(self, depth):
+        return principal_variation
+
+    def alpha_beta_minimax_with_multiprocessing(self, depth, deadline=None,
+                                                first_move=None, board=None):
+        """
+        Works the same way as alpha_beta_minimax_from_root, but searches every
+        root move after the first one in the worker processes of
+        self.parallel_search.
+        """
         start_time = time.time()
-        self.static_evals = 0
-        possible_moves = [move for move in self.board.legal_moves]
-        random.shuffle(possible_moves)
+        self.stats = SearchStats()
+        self.transposition_table.new_search()
+        board = self.create_search_board(board)
+        # The lines found in the workers are not collected
+        self.principal_variation_table.clear(0)
+        possible_moves = list(board.generate_legal_moves())
+        self.random.shuffle(possible_moves)
+        possible_moves = self.move_orderer.order_moves(
+            board, possible_moves, 0, first_move
+        )
+        if not possible_moves:
+            return None, -1000, depth, 0, self.stats
 
-        thread_pool = multiprocessing.dummy.Pool()
-        inputs = [(move, depth, self.board.copy()) for move in possible_moves]
-        results = thread_pool.map(self.evaluate_branch_of_root, inputs)
+        # Search the first move here, so that the workers start with its value
+        # as a bound for every other move
+        best_move = possible_moves[0]
+        board.push(best_move)
+        best_move_val = self.alpha_beta_minimax(depth-.5, False, board=board)
+        board.pop()
 
-        best_move = None
-        best_move_val = -1000
-        for move, move_val in results:
-            if move_val > best_move_val:
-                best_move, best_move_val = move, move_val
+        results = self.parallel_search.search_moves(
+            board, possible_moves[1:], depth, best_move_val, deadline,
+            self.search_settings()
+        )
+        if results is None:
+            return None
+
+        for move, move_val, exact, stats in results:
+            self.stats.merge(stats)
+            # The results arrive in any order, so a bound may come before the
+            # exact value of the move that set it, and is never taken as better
+            if exact and move_val > best_move_val:
+                best_move = move
+                best_move_val = move_val
+
+        key = board.key
+        self.transposition_table.store(
+            key, depth, best_move_val, TranspositionTable.EXACT, best_move
+        )
 
         end_time = time.time()
         duration = round(end_time - start_time, 2)
-        return best_move, best_move_val, depth, duration
+        return best_move, best_move_val, depth, duration, self.stats
 
     def alpha_beta_minimax(self, depth, maximizing, alpha=-1000, beta=1000,
-                           board=None):
+                           board=None, ply=1):
+        # ply is the number of half moves from the root of the search, which is
+        # 1 for the positions directly after each root move
         if board is None:
-            board = self.board
+            board = self.create_search_board()
+
+        if self.abort_search:
+            raise SearchAborted()
+        if self.time_manager is not None and self.time_manager.out_of_time():
+            raise SearchAborted()
+        stats = self.stats
+        stats.nodes += 1
+        principal_variation_table = self.principal_variation_table
+        principal_variation_table.clear(ply)
+        # Draws which do not depend on the moves available are found from the
+        # key history and counters the board keeps, rather than is_game_over
+        if board.is_repeated(ply) or board.is_insufficient_material():
+            return 0
+        if board.halfmove_clock >= 100 and not board.is_checkmate():
+            return 0
+        # Searching a position the bitbases show to be drawn cannot change
+        # its value, while won positions are still searched to find the mate
+        if (self.use_bitbases and chess.popcount(board.occupied) == 3
+                and bitbases.probe(self.endgame_bitbases, board) == 0):
+            return 0
 
-        if depth == 0 or board.is_game_over():
-            self.static_evals += 1
-            return self.evaluate_board(board)
+        # Rather than stopping dead, keep searching captures until the
+        # position is quiet, so that pieces left hanging are not missed
+        if depth == 0:
+            if self.use_quiescence:
+                return self.quiescence(maximizing, alpha, beta, board, ply)
+            stats.leaf_evals += 1
+            return self.evaluate_position(board)
 
-        possible_moves = [move for move in board.legal_moves]
+        # If this position has already been searched at least as deep, the
+        # stored result can be used instead of searching it again
+        key = board.key
+        table = self.transposition_table
+        index = table.find(key)
+        hash_move = self.pv_moves.get(key)
+        stats.tt_probes += 1
+        if index >= 0:
+            stats.tt_hits += 1
+            if hash_move is None:
+                hash_move = table.move_at(index)
+            if table.depths[index] >= depth:
+                bound = table.bounds[index]
+                score = table.scores[index]
+                if bound == TranspositionTable.EXACT:
+                    return score
+                elif bound == TranspositionTable.LOWER_BOUND and score >= beta:
+                    return score
+                elif bound == TranspositionTable.UPPER_BOUND and score <= alpha:
+                    return score
+
+        # Checkmate and stalemate are found by looking for a single legal move,
+        # which stops as soon as one is found
+        in_check = board.is_check()
+        if not any(board.generate_legal_moves()):
+            stats.leaf_evals += 1
+            if not in_check:
+                return 0
+            return -999 if maximizing else 999
+
+        if (self.use_null_move and self.can_try_null_move(board, depth, in_check)
+                and self.static_eval_passes(board, maximizing, alpha, beta)):
+            # Let the opponent move twice in a row. If the side to move still
+            # reaches beta, a real move would almost certainly do so too
+            null_depth = max(0, depth - .5 - self.NULL_MOVE_REDUCTION)
+            board.push(chess.Move.null())
+            if maximizing:
+                null_val = self.alpha_beta_minimax(
+                    null_depth, False, beta - self.NULL_WINDOW, beta, board, ply+1
+                )
+            else:
+                null_val = self.alpha_beta_minimax(
+                    null_depth, True, alpha, alpha + self.NULL_WINDOW, board, ply+1
+                )
+            board.pop()
+            if maximizing and null_val >= beta:
+                stats.null_move_cutoffs += 1
+                return beta
+            if not maximizing and null_val <= alpha:
+                stats.null_move_cutoffs += 1
+                return alpha
+
+        original_alpha, original_beta = alpha, beta
+        # The best move from the previous search of this position, or the move
+        # of the principal variation, is searched first. The rest are only
+        # generated as they are needed, so a cutoff saves generating them
+        possible_moves = self.move_orderer.staged_moves(board, ply, hash_move)
+
+        best_move = None
         if maximizing:
-            for move in possible_moves:
+            for move_index, move in enumerate(possible_moves):
+                reduce = self.can_reduce(board, move, move_index, depth, ply, in_check)
                 board.push(move)
-                move_val = self.alpha_beta_minimax(depth-.5, False, alpha, beta, board)
+                reduce = reduce and not board.is_check()
+                if move_index > 0 and (reduce or self.use_principal_variation_search):
+                    move_val = self.search_later_move(
+                        board, depth, True, alpha, beta, ply, reduce
+                    )
+                else:
+                    move_val = self.alpha_beta_minimax(depth-.5, False, alpha, beta, board, ply+1)
                 board.pop()
 
-                alpha = max(move_val, alpha)
+                if move_val > alpha:
+                    alpha = move_val
+                    best_move = move
+                    principal_variation_table.update(ply, move)
                 if alpha >= beta:
-                    return alpha
+                    stats.beta_cutoffs += 1
+                    if move_index == 0:
+                        stats.first_move_cutoffs += 1
+                    self.move_orderer.record_cutoff(board, move, ply, depth, move_index)
+                    break
 
-            return alpha
+            value = alpha
 
         elif not maximizing:
-            for move in possible_moves:
+            for move_index, move in enumerate(possible_moves):
+                reduce = self.can_reduce(board, move, move_index, depth, ply, in_check)
                 board.push(move)
-                move_val = self.alpha_beta_minimax(depth-.5, True, alpha, beta, board)
+                reduce = reduce and not board.is_check()
+                if move_index > 0 and (reduce or self.use_principal_variation_search):
+                    move_val = self.search_later_move(
+                        board, depth, False, alpha, beta, ply, reduce
+                    )
+                else:
+                    move_val = self.alpha_beta_minimax(depth-.5, True, alpha, beta, board, ply+1)
                 board.pop()
 
-                beta = min(move_val, beta)
+                if move_val < beta:
+                    beta = move_val
+                    best_move = move
+                    principal_variation_table.update(ply, move)
                 if beta <= alpha:
-                    return beta
+                    stats.beta_cutoffs += 1
+                    if move_index == 0:
+                        stats.first_move_cutoffs += 1
+                    self.move_orderer.record_cutoff(board, move, ply, depth, move_index)
+                    break
 
-            return beta
+            value = beta
 
-    def alpha_beta_minimax_with_time_limit(self, depth, time_limit):
-        start_time = time.time()
-        insurance_move, insurance_val, _, _ = self.alpha_beta_minimax_from_root(depth-.5)
-        self.static_evals = 0
-        possible_moves = [move for move in self.board.legal_moves]
-        random.shuffle(possible_moves)
-        best_move = None
-        best_move_val = -1000
+        self.store_transposition(key, depth, value, original_alpha, original_beta, best_move)
+        return value
+
+    def search_later_move(self, board, depth, maximizing, alpha, beta, ply, reduce):
+        """
+        Searches a move other than the first of a position, which must already
+        have been pushed to the board, and returns its value.
+        depth, alpha, beta and ply are those of the position the move was
+        played from, and maximizing is whether the side that played it is the
+        maximizing side.
+        The move is first searched with a null window, only to show that it is
+        no better than the best move so far, and half a move shallower if
+        reduce is set. Only if it turns out better is it searched again at full
+        depth, and then with the full window.
+        """
+        stats = self.stats
+        if maximizing:
+            null_alpha, null_beta = alpha, alpha + self.NULL_WINDOW
+        else:
+            null_alpha, null_beta = beta - self.NULL_WINDOW, beta
+
+        if reduce:
+            stats.reductions += 1
+            move_val = self.alpha_beta_minimax(
+                depth-1, not maximizing, null_alpha, null_beta, board, ply+1
+            )
+            if (move_val <= alpha) if maximizing else (move_val >= beta):
+                return move_val
+            stats.re_searches += 1
+
+        if self.use_principal_variation_search:
+            move_val = self.alpha_beta_minimax(
+                depth-.5, not maximizing, null_alpha, null_beta, board, ply+1
+            )
+            if (move_val <= alpha) if maximizing else (move_val >= beta):
+                return move_val
+            # Searching with the full window would give the same result
+            if beta - alpha < 2 * self.NULL_WINDOW:
+                return move_val
+            stats.re_searches += 1
+
+        return self.alpha_beta_minimax(depth-.5, not maximizing, alpha, beta, board, ply+1)
+
+    def can_try_null_move(self, board, depth, in_check):
+        """
+        Returns whether a null move may be tried from the given board.
+        Passing is never allowed in check, twice in a row, or when the side to
+        move has only its king and pawns left, since those are the positions
+        where every real move may be worse than passing (zugzwang) and the
+        null move would give a wrong result.
+        """
+        if in_check or depth < 1.5:
+            return False
+        if board.move_stack and not board.peek():
+            return False
+        non_pawn_material = 0
+        for piece_type in (chess.KNIGHT, chess.BISHOP, chess.ROOK, chess.QUEEN):
+            piece_count = chess.popcount(board.pieces_mask(piece_type, board.turn))
+            non_pawn_material += piece_count * self.PIECE_VALUES[piece_type]
+        return non_pawn_material >= self.PIECE_VALUES[chess.ROOK]
+
+    def static_eval_passes(self, board, maximizing, alpha, beta):
+        """
+        Returns whether the static evaluation of the board is already at least
+        beta for the maximizing side, or at most alpha for the minimizing side,
+        without which a null move is unlikely to cause a cutoff.
+        """
+        evaluation = self.evaluate_position(board)
+        return evaluation >= beta if maximizing else evaluation <= alpha
+
+    def can_reduce(self, board, move, move_index, depth, ply, in_check):
+        """
+        Returns whether the move may be searched at a reduced depth, which is
+        the case for quiet moves ordered late that are not killer moves.
+        Must be called before the move is pushed to the board.
+        """
+        if not self.use_late_move_reductions or in_check:
+            return False
+        if move_index < self.LATE_MOVE_INDEX or depth < 1.5:
+            return False
+        if move.promotion or board.is_capture(move):
+            return False
+        if ply < MoveOrderer.MAX_PLY and move in self.move_orderer.killers[ply]:
+            return False
+        return True
+
+    def quiescence(self, maximizing, alpha, beta, board, ply):
+        """
+        Searches only captures and promotions from the given board until the
+        position is quiet, and returns its value.
+        The side to move may always choose not to capture (stand pat), so the
+        static evaluation is a bound on the value unless the side is in check,
+        in which case every move is searched.
+        Captures which lose material according to static exchange evaluation,
+        and captures which could not bring the score back to the window even
+        if the captured piece were won for free (delta pruning), are skipped.
+        """
+        if self.time_manager is not None and self.time_manager.out_of_time():
+            raise SearchAborted()
+        stats = self.stats
+        stats.nodes += 1
+        stats.quiescence_nodes += 1
+        stats.leaf_evals += 1
+        in_check = board.is_check()
+
+        if in_check:
+            possible_moves = list(board.generate_legal_moves())
+            if not possible_moves:
+                return -999 if maximizing else 999
+            stand_pat = None
+        else:
+            stand_pat = self.evaluate_position(board)
+            if ply >= MoveOrderer.MAX_PLY:
+                return stand_pat
+
+            # A side with no legal moves is stalemated rather than standing
+            # pat, which is only checked where the stand pat score is used
+            if maximizing:
+                if stand_pat >= beta:
+                    return stand_pat if board.has_legal_move() else 0
+                alpha = max(alpha, stand_pat)
+            else:
+                if stand_pat <= alpha:
+                    return stand_pat if board.has_legal_move() else 0
+                beta = min(beta, stand_pat)
+
+            # Legality is only checked for the moves that survive pruning
+            possible_moves = list(board.generate_pseudo_legal_captures())
+            # Only pawns one step from the last rank can promote without capturing
+            promoting_pawns = board.pawns & board.occupied_co[board.turn] & (
+                chess.BB_RANK_7 if board.turn == chess.WHITE else chess.BB_RANK_2
+            )
+            if promoting_pawns:
+                possible_moves += board.generate_pseudo_legal_moves(
+                    promoting_pawns, chess.BB_BACKRANKS & ~board.occupied
+                )
+
+        possible_moves = self.move_orderer.order_moves(board, possible_moves, ply)
+        searched = False
         for move in possible_moves:
-            current_time = time.time()
-            duration = current_time - start_time
-            if duration > time_limit:
-                return insurance_move, insurance_val, depth - .5, round(duration, 2)
-
-            self.board.push(move)
-            move_val = self.alpha_beta_minimax(depth-.5, False)
-            self.board.pop()
-            if move_val > best_move_val:
-                best_move = move
-                best_move_val = move_val
+            if stand_pat is not None:
+                if not move.promotion:
+                    # Skip the capture if even winning the captured piece
+                    # outright could not reach the window
+                    if board.is_en_passant(move):
+                        captured_value = self.PIECE_VALUES[chess.PAWN]
+                    else:
+                        captured_value = self.PIECE_VALUES[board.piece_type_at(move.to_square)]
+                    if maximizing and stand_pat + captured_value + self.DELTA_MARGIN <= alpha:
+                        continue
+                    if not maximizing and stand_pat - captured_value - self.DELTA_MARGIN >= beta:
+                        continue
+                if static_exchange_evaluation(board, move) < 0:
+                    continue
+                if board.is_into_check(move):
+                    continue
 
-        end_time = time.time()
-        duration = round(end_time - start_time, 2)
-        return best_move, best_move_val, depth, round(duration, 2)
+            board.push(move)
+            move_val = self.quiescence(not maximizing, alpha, beta, board, ply+1)
+            board.pop()
+            searched = True
 
-    def generate_move(self):
+            if maximizing:
+                if move_val > alpha:
+                    alpha = move_val
+                if alpha >= beta:
+                    return alpha
+            else:
+                if move_val < beta:
+                    beta = move_val
+                if beta <= alpha:
+                    return beta
+
+        if stand_pat is not None and not searched and not board.has_legal_move():
+            return 0
+        return alpha if maximizing else beta
+
+    def store_transposition(self, key, depth, value, alpha, beta, best_move):
+        """
+        Stores the result of searching a position in the transposition table.
+        alpha and beta must be the window the position was searched with, which
+        determines whether value is exact or only a bound.
+        """
+        if value <= alpha:
+            bound = TranspositionTable.UPPER_BOUND
+        elif value >= beta:
+            bound = TranspositionTable.LOWER_BOUND
+        else:
+            bound = TranspositionTable.EXACT
+        self.transposition_table.store(key, depth, value, bound, best_move)
+
+    def iterative_deepening(self, max_depth, time_limit=None, board=None,
+                            time_manager=None):
+        """
+        Searches the given board, or self.board if none is given, to depth .5,
+        then 1, then 1.5 and so on up to max_depth,
+        searching the best move of each iteration first in the next one, so
+        that the transposition table entries left behind by the shallower
+        searches make the deeper ones faster.
+        The time is managed by the given TimeManager, or one allowing
+        time_limit seconds (or no limit, if time_limit is None). No iteration
+        is started after its soft limit, and the search is stopped wherever it
+        is at its hard limit or once self.abort_search is set, except that the
+        first iteration always finishes so that there is a move to return.
+        Returns the result of the deepest completed iteration as the best
+        move, its value, the depth reached, the total duration and the
+        SearchStats of every iteration combined.
+        If the engine has more than one worker, each iteration is searched by
+        alpha_beta_minimax_with_multiprocessing.
+        The principal variation and the (depth, best move, value, duration) of
+        every completed iteration are left in self.principal_variation and
+        self.iterations.
+        """
+        if board is None:
+            board = self.board
+        if time_manager is None:
+            time_manager = TimeManager(move_time=time_limit)
+        time_manager.start()
+        start_time = time_manager.start_time
+        # Only checked by the search once the first iteration has finished
+        self.time_manager = None
+        deadline = None
+        self.iterations = []
+        self.principal_variation = []
+        self.pv_moves = {}
+        self.move_orderer.new_search()
+        total_stats = SearchStats()
+
+        # The bitbases give the result of the root position exactly, so a deep
+        # search would only find the same result more slowly
+        if self.use_bitbases and bitbases.probe(self.endgame_bitbases, board) is not None:
+            max_depth = min(max_depth, self.BITBASE_SEARCH_DEPTH)
+
+        best_move, best_move_val, depth_reached = None, None, 0
+        depth = .5
+        while depth <= max_depth:
+            if best_move is not None and not time_manager.can_start_iteration():
+                break
+            try:
+                if self.parallel_search is not None:
+                    result = self.alpha_beta_minimax_with_multiprocessing(
+                        depth, deadline, best_move, board
+                    )
+                elif self.use_aspiration_windows and best_move_val is not None:
+                    result = self.aspiration_search(
+                        depth, deadline, best_move, board, best_move_val
+                    )
+                else:
+                    result = self.alpha_beta_minimax_from_root(
+                        depth, deadline, best_move, board
+                    )
+            except SearchAborted:
+                result = None
+            total_stats.merge(self.stats)
+            # Ran out of time part of the way through this depth
+            if result is None:
+                break
+
+            best_move, best_move_val, depth_reached, duration, stats = result
+            self.iterations.append((depth, best_move, best_move_val, duration))
+            time_manager.record_iteration(best_move)
+            self.time_manager = time_manager
+            deadline = time_manager.hard_deadline
+            total_stats.depth_times[depth] = duration
+            total_stats.depth_nodes[depth] = stats.nodes
+            self.principal_variation = self.get_principal_variation(depth, board)
+
+            # Remember the position before every move of the principal
+            # variation, so that the next iteration searches it first even if
+            # its transposition table entry has been replaced
+            self.pv_moves = {}
+            pv_board = board.copy()
+            for move in self.principal_variation:
+                self.pv_moves[chess.polyglot.zobrist_hash(pv_board)] = move
+                pv_board.push(move)
+
+            if self.trace is not None:
+                self.trace({
+                    'event': 'iteration',
+                    'depth': depth,
+                    'move': best_move.uci() if best_move else None,
+                    'value': best_move_val,
+                    'time': duration,
+                    'nodes': stats.nodes,
+                    'pv': [move.uci() for move in self.principal_variation],
+                })
+
+            depth += .5
+
+        self.time_manager = None
+        self.stats = total_stats
+        duration = round(time.time() - start_time, 2)
+        if self.trace is not None:
+            event = {
+                'event': 'search',
+                'fen': board.fen(),
+                'move': best_move.uci() if best_move else None,
+                'value': best_move_val,
+                'depth': depth_reached,
+                'time': duration,
+            }
+            event.update(total_stats.as_dict())
+            self.trace(event)
+        return best_move, best_move_val, depth_reached, duration, total_stats
+
+    def start_pondering(self):
+        """
+        Starts searching, in a background thread, the position after the reply
+        the opponent is expected to play to this engine's last move, which is
+        the second move of the principal variation of the last search.
+        Does nothing if there is no expected reply, such as after book moves.
+        """
+        if len(self.principal_variation) < 2 or not self.board.move_stack:
+            return
+        if self.board.peek() != self.principal_variation[0]:
+            return
+        expected_reply = self.principal_variation[1]
+        if not self.board.is_legal(expected_reply):
+            return
+
+        self.ponder_move = expected_reply
+        self.ponder_result = None
+        self.abort_search = False
+        # Cleared here so that the iterations of the last search are not
+        # taken for the ponder search's
+        self.iterations = []
+        self.ponder_start_time = time.time()
+        ponder_board = self.board.copy()
+        ponder_board.push(expected_reply)
+        self.ponder_thread = threading.Thread(
+            target=self.ponder_search, args=(ponder_board,), daemon=True
+        )
+        self.ponder_thread.start()
+
+    def ponder_search(self, board):
+        """ Runs in the ponder thread, searching until told to stop. """
+        self.ponder_result = self.iterative_deepening(self.PONDER_DEPTH, None, board)
+
+    def stop_pondering(self, opponent_move):
+        """
+        Must be called once the opponent has moved while the engine was
+        pondering.
+        If the opponent played the expected reply (a ponder hit), the search is
+        left running so that generate_move can carry on with it.
+        Otherwise (a miss) the search is stopped and thrown away.
+        """
+        if self.ponder_thread is None:
+            return
+        if opponent_move != self.ponder_move:
+            self.abort_search = True
+            self.ponder_thread.join()
+            self.abort_search = False
+            self.ponder_thread = None
+            self.ponder_result = None
+
+    def finish_pondering(self, time_limit, depth):
+        """
+        Lets the search started on a ponder hit carry on until it has
+        completed the given depth, or until it has taken time_limit seconds
+        (if time_limit is not None) since pondering started, then returns its result in the same form as
+        iterative_deepening, or None if it found no move.
+        """
+        deadline = None
+        if time_limit is not None:
+            deadline = self.ponder_start_time + time_limit
+        while self.ponder_thread.is_alive():
+            if self.iterations and self.iterations[-1][0] >= depth:
+                break
+            if deadline is None:
+                self.ponder_thread.join(self.PONDER_POLL_INTERVAL)
+            elif time.time() < deadline:
+                self.ponder_thread.join(min(self.PONDER_POLL_INTERVAL,
+                                            deadline - time.time()))
+            else:
+                break
+        if self.ponder_thread.is_alive():
+            self.abort_search = True
+            self.ponder_thread.join()
+            self.abort_search = False
+        self.ponder_thread = None
+
+        result = self.ponder_result
+        self.ponder_result = None
+        if result is None or result[0] is None:
+            return None
+        return result
+
+    def cached_search(self, max_depth, time_limit=None, board=None, time_manager=None):
+        """
+        Returns the result of the board from the analysis cache if it has been
+        searched at least max_depth deep before, and otherwise searches it
+        with iterative_deepening and stores the result in the cache.
+        Positions whose result may depend on the moves that led to them, such
+        as repetitions, are always searched.
+        A result from the cache has a duration of 0 and empty SearchStats.
+        """
+        if board is None:
+            board = self.board
+        if self.analysis_cache is None:
+            return self.iterative_deepening(max_depth, time_limit, board, time_manager)
+
+        cached = self.analysis_cache.probe(board, max_depth)
+        if cached is not None:
+            move, score, depth = cached
+            self.iterations = []
+            self.principal_variation = [move]
+            value = score if self.color == chess.WHITE else -score
+            return move, value, depth, 0, SearchStats()
+
+        result = self.iterative_deepening(max_depth, time_limit, board, time_manager)
+        best_move, best_move_val, depth_reached, _, _ = result
+        if best_move is not None:
+            score = best_move_val if self.color == chess.WHITE else -best_move_val
+            self.analysis_cache.store(board, best_move, score, depth_reached)
+        return result
+
+    def close(self):
+        """ Shuts down the worker processes used for searching, if any. """
+        if self.parallel_search is not None:
+            self.parallel_search.close()
+
+    def generate_move(self, time_manager=None, depth=None):
+        """
+        Returns the move to play, from the opening book while the game is in
+        it, and otherwise found by iterative_deepening to the given depth, or
+        self.search_depth if none is given, whose result is left in
+        self.last_result (which is None after a book move).
+        The search is timed by the given TimeManager, or otherwise by one
+        made from the engine's clock or time_limit.
+        """
+        if depth is None:
+            depth = self.search_depth
+        self.last_result = None
         if self.is_opening:
             opening_move = self.generate_opening_move()
             if opening_move:
                 opening, move_string = opening_move
-                from_square = move_string[:2]
-                from_square_num = chess.SQUARE_NAMES.index(from_square)
-                to_square = move_string[2:]
-                to_square_num = chess.SQUARE_NAMES.index(to_square)
-                best_move = chess.Move(from_square_num, to_square_num)
-                print(opening['n'])
-                print('Move: ' + self.board.san(best_move))
+                best_move = chess.Move.from_uci(move_string)
+                if self.verbose:
+                    if opening is not None:
+                        print(opening['n'])
+                    print('Move: ' + self.board.san(best_move))
             else:
                 self.is_opening = False
                 self.is_middle_game = True
 
         if self.is_middle_game:
-            result = self.alpha_beta_minimax_with_time_limit(2, 15)
-            best_move, best_move_val, depth_reached, duration = result
-            print('Move: ' + self.board.san(best_move))
-            print('Expected move value: ' + str(best_move_val))
-            print('Depth reached: ' + str(depth_reached))
-            print('Time elapsed: ' + str(duration) + 's')
-            print('Static evaluations: ' + str(self.static_evals))
+            if time_manager is None and self.remaining_time is not None:
+                time_manager = TimeManager(remaining=self.remaining_time,
+                                           increment=self.increment)
+            elif time_manager is None:
+                time_manager = TimeManager(move_time=self.time_limit)
+            result = None
+            # Carry on with the search started on the opponent's time if the
+            # opponent played the expected move
+            if self.ponder_thread is not None:
+                result = self.finish_pondering(time_manager.soft_limit, depth)
+            if result is None:
+                result = self.cached_search(
+                    depth, board=self.board, time_manager=time_manager
+                )
+            self.last_result = result
+            best_move, best_move_val, depth_reached, duration, stats = result
+            if self.verbose:
+                print('Move: ' + self.board.san(best_move))
+                print('Expected move value: ' + str(best_move_val))
+                print('Depth reached: ' + str(depth_reached))
+                for iteration_depth, _, _, iteration_duration in self.iterations:
+                    print('  Depth ' + str(iteration_depth) + ': '
+                          + str(iteration_duration) + 's')
+                print('Time elapsed: ' + str(duration) + 's')
+                print('Nodes: ' + str(stats.nodes))
+                print('Static evaluations: ' + str(stats.leaf_evals))
+                print('First move cutoff rate: '
+                      + str(round(stats.first_move_cutoff_ratio(), 2)))
         return best_move
@@ -3,11 +3,21 @@ import chess
 from engine import *
 
 class GameRunner():
-    """ Object to be created to run the game and store data. """
-    def __init__(self):
-        # Sets the board to a default board and sets the first turn to white
-        self.board = chess.Board()
-        self.whose_turn = chess.WHITE
+    """
+    Object to be created to run the game and store data.
+    The board and both players may be given, in which case the game can be
+    run without asking the user anything, and verbose can be turned off so
+    that nothing is printed either.
+    """
+    def __init__(self, board=None, white_player=None, black_player=None,
+                 verbose=True):
+        # Sets the board to a default board unless one is given, and sets the
+        # first turn to the side to move
+        self.board = board if board is not None else chess.Board()
+        self.whose_turn = self.board.turn
+        self.white_player = white_player
+        self.black_player = black_player
+        self.verbose = verbose
 
     def print_board(self):
         print('\n     BLACK')
@@ -48,10 +58,22 @@ class GameRunner():
         else:
             self.black_player = Engine(self.board, chess.BLACK)
 
+        # An engine playing against a human searches while the human thinks
+        for player, opponent in ((self.white_player, self.black_player),
+                                 (self.black_player, self.white_player)):
+            if isinstance(player, Engine) and isinstance(opponent, Human):
+                player.ponder = True
+
     def run_half_turn(self):
         """ Runs a half turn, or a single player's move. """
         if self.whose_turn == chess.WHITE:
-            print('\n\nWHITE TURN:')
+            player, opponent = self.white_player, self.black_player
+        else:
+            player, opponent = self.black_player, self.white_player
+
+        if self.whose_turn == chess.WHITE:
+            if self.verbose:
+                print('\n\nWHITE TURN:')
             # Call the make move method of white_player, whether it is an Engine
             # or Human
             self.white_player.make_move()
@@ -59,14 +81,24 @@ class GameRunner():
             self.whose_turn = chess.BLACK
 
         elif self.whose_turn == chess.BLACK:
-            print('\n\nBLACK TURN:')
+            if self.verbose:
+                print('\n\nBLACK TURN:')
             # Call the make move method of black_player, whether it is an Engine
             # or Human
             self.black_player.make_move()
             # Set whos_turn to the other player to prepare for the next turn
             self.whose_turn = chess.WHITE
 
-        self.print_board()
+        # Let a pondering engine know whether the human played the reply it
+        # was searching, or start it pondering on the human's time
+        if isinstance(opponent, Engine) and opponent.ponder:
+            if isinstance(player, Human):
+                opponent.stop_pondering(self.board.peek())
+        if isinstance(player, Engine) and player.ponder and not self.board.is_game_over():
+            player.start_pondering()
+
+        if self.verbose:
+            self.print_board()
 
     def run_game(self):
         """
@@ -75,9 +107,11 @@ class GameRunner():
         It will not cease execution until the game has been completed.
         """
         # Determine the types of each player (Human or Engine) before starting
-        # the game
-        self.determine_player_types()
-        self.print_board()
+        # the game, unless they were given
+        if self.white_player is None or self.black_player is None:
+            self.determine_player_types()
+        if self.verbose:
+            self.print_board()
 
         # As long as the game is not over (a checkmate, stalemate or draw has
         # not happened), run a half turn of the game
@@ -86,13 +120,15 @@ class GameRunner():
 
         # If the game is over, print the result and the winner
         result = self.board.result()
-        print()
-        if result == '1-0':
-            print('WHITE VICTORY')
-        elif result == '0-1':
-            print('BLACK VICTORY')
-        elif result == '1/2-1/2':
-            print('DRAW')
+        if self.verbose:
+            print()
+            if result == '1-0':
+                print('WHITE VICTORY')
+            elif result == '0-1':
+                print('BLACK VICTORY')
+            elif result == '1/2-1/2':
+                print('DRAW')
+        return result
 
 
 if __name__ == '__main__':
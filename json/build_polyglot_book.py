@@ -0,0 +1,26 @@
+"""
+Compiles an opening book into the binary Polyglot format read by the engine.
+
+Usage: python json/build_polyglot_book.py [source] [destination]
+The source may be a json file in the format of json/openings.json or a PGN
+file, and defaults to json/openings.json.
+The destination defaults to json/openings.bin.
+"""
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from opening_book import read_pgn_openings, write_polyglot_book
+
+source = sys.argv[1] if len(sys.argv) > 1 else 'json/openings.json'
+destination = sys.argv[2] if len(sys.argv) > 2 else 'json/openings.bin'
+
+if source.endswith('.pgn'):
+    openings = read_pgn_openings(source)
+else:
+    with open(source, 'r') as openings_file:
+        openings = json.load(openings_file)
+
+num_entries = write_polyglot_book(openings, destination)
+print(str(num_entries) + ' entries written to ' + destination)
@@ -0,0 +1,270 @@
+import chess
+
+
+class MoveOrderer:
+    """
+    Sorts the moves of a position so that the moves most likely to be best are
+    searched first, which lets alpha-beta pruning cut off far more of the tree.
+
+    Moves are searched in this order:
+    the hash move (the best move found by an earlier search of the position),
+    captures from most valuable victim and least valuable attacker down,
+    the killer moves of the ply (quiet moves that caused a cutoff in a sibling
+    position), and finally the remaining quiet moves by their history score
+    (how often they have caused cutoffs anywhere in the tree).
+    """
+    # Value of each piece type when ordering captures
+    VICTIM_VALUES = {
+        chess.PAWN: 1,
+        chess.KNIGHT: 3,
+        chess.BISHOP: 3,
+        chess.ROOK: 5,
+        chess.QUEEN: 9,
+        chess.KING: 20,
+    }
+
+    HASH_MOVE_SCORE = 1000000
+    CAPTURE_SCORE = 100000
+    KILLER_SCORES = (90000, 80000)
+    # History scores are halved once they pass this value, so that quiet moves
+    # never get ordered ahead of killers
+    MAX_HISTORY = 50000
+
+    MAX_PLY = 128
+
+    def __init__(self):
+        self.killers = [[None, None] for _ in range(self.MAX_PLY)]
+        # Indexed by color, then by from_square * 64 + to_square
+        self.history = [[0] * 4096, [0] * 4096]
+
+        # Counters used to check how well the moves are being ordered
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+
+    def new_search(self):
+        """
+        Prepares for a search of a new position, forgetting the killer moves
+        and fading out the history of previous searches.
+        """
+        self.killers = [[None, None] for _ in range(self.MAX_PLY)]
+        for color_history in self.history:
+            for index in range(4096):
+                color_history[index] //= 2
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+
+    def capture_score(self, board, move):
+        """ Returns the most valuable victim, least valuable attacker score of a capture. """
+        if board.is_en_passant(move):
+            victim = chess.PAWN
+        else:
+            victim = board.piece_type_at(move.to_square)
+        attacker = board.piece_type_at(move.from_square)
+        return self.VICTIM_VALUES[victim] * 100 - self.VICTIM_VALUES[attacker]
+
+    def score_move(self, board, move, ply, hash_move=None):
+        """ Returns the sort key of a move, higher scores being searched first. """
+        if move == hash_move:
+            return self.HASH_MOVE_SCORE
+
+        if board.is_capture(move):
+            score = self.CAPTURE_SCORE + self.capture_score(board, move)
+            if move.promotion:
+                score += self.VICTIM_VALUES[move.promotion] * 100
+            return score
+        if move.promotion:
+            return self.CAPTURE_SCORE + self.VICTIM_VALUES[move.promotion] * 100
+
+        if ply < self.MAX_PLY:
+            killers = self.killers[ply]
+            if move == killers[0]:
+                return self.KILLER_SCORES[0]
+            if move == killers[1]:
+                return self.KILLER_SCORES[1]
+
+        return self.history[board.turn][move.from_square * 64 + move.to_square]
+
+    def order_moves(self, board, moves, ply, hash_move=None):
+        """
+        Returns the given moves sorted best first.
+        The sort is stable, so moves with equal scores keep their given order.
+        """
+        return sorted(
+            moves,
+            key=lambda move: self.score_move(board, move, ply, hash_move),
+            reverse=True,
+        )
+
+    def staged_moves(self, board, ply, hash_move=None):
+        """
+        Yields the legal moves of the board in the same order as order_moves,
+        but a stage at a time: the hash move, then captures and promotions,
+        then killer moves, then the remaining quiet moves.
+        Each stage is only generated once every move of the previous stage has
+        been searched, and each move is only checked for legality just before
+        it is yielded, so that a cutoff on an early move saves generating and
+        checking the rest.
+        The board must be back in the same position every time the next move
+        is asked for.
+        """
+        # Few moves get out of check, so they are simply all ordered at once
+        if board.is_check():
+            yield from self.order_moves(board, list(board.generate_legal_moves()),
+                                        ply, hash_move)
+            return
+
+        if hash_move is not None and board.is_pseudo_legal(hash_move) \
+                and not board.is_into_check(hash_move):
+            yield hash_move
+        else:
+            hash_move = None
+
+        captures = [move for move in board.generate_pseudo_legal_captures()
+                    if move != hash_move]
+        # Only pawns one step from the last rank can promote without capturing
+        promoting_pawns = board.pawns & board.occupied_co[board.turn] & (
+            chess.BB_RANK_7 if board.turn == chess.WHITE else chess.BB_RANK_2
+        )
+        if promoting_pawns:
+            captures += [
+                move for move in board.generate_pseudo_legal_moves(
+                    promoting_pawns, chess.BB_BACKRANKS & ~board.occupied
+                ) if move != hash_move
+            ]
+        captures.sort(key=lambda move: self.score_move(board, move, ply), reverse=True)
+        for move in captures:
+            if not board.is_into_check(move):
+                yield move
+
+        killers = []
+        if ply < self.MAX_PLY:
+            for killer in self.killers[ply]:
+                if killer is not None and killer != hash_move and killer not in killers \
+                        and board.is_pseudo_legal(killer) \
+                        and not board.is_capture(killer) and not killer.promotion:
+                    killers.append(killer)
+                    if not board.is_into_check(killer):
+                        yield killer
+
+        color_history = self.history[board.turn]
+        quiets = [
+            move for move in board.generate_pseudo_legal_moves(
+                chess.BB_ALL, ~board.occupied_co[not board.turn]
+            )
+            if move != hash_move and move not in killers
+            and not move.promotion and not board.is_en_passant(move)
+        ]
+        quiets.sort(key=lambda move: color_history[move.from_square * 64 + move.to_square],
+                    reverse=True)
+        for move in quiets:
+            if not board.is_into_check(move):
+                yield move
+
+    def record_cutoff(self, board, move, ply, depth, move_index):
+        """
+        Records that the move caused a beta cutoff at the given ply and depth,
+        after move_index other moves had already been searched.
+        Must be called before the move is pushed to the board.
+        """
+        self.cutoffs += 1
+        if move_index == 0:
+            self.first_move_cutoffs += 1
+
+        # Captures and promotions are already ordered well without help
+        if board.is_capture(move) or move.promotion:
+            return
+
+        if ply < self.MAX_PLY:
+            killers = self.killers[ply]
+            if move != killers[0]:
+                killers[1] = killers[0]
+                killers[0] = move
+
+        color_history = self.history[board.turn]
+        index = move.from_square * 64 + move.to_square
+        # Cutoffs deep in the tree save more work, so they count for more
+        color_history[index] += int(depth * 2) ** 2
+        if color_history[index] > self.MAX_HISTORY:
+            for i in range(4096):
+                color_history[i] //= 2
+
+    def first_move_cutoff_rate(self):
+        """
+        Returns the fraction of cutoffs that were caused by the first move
+        searched. The closer this is to 1, the better the ordering.
+        """
+        if self.cutoffs == 0:
+            return 0.0
+        return self.first_move_cutoffs / self.cutoffs
+
+
+# Piece values in hundredths of a pawn used by static_exchange_evaluation
+SEE_VALUES = {
+    chess.PAWN: 100,
+    chess.KNIGHT: 300,
+    chess.BISHOP: 320,
+    chess.ROOK: 500,
+    chess.QUEEN: 900,
+    chess.KING: 20000,
+}
+
+
+def static_exchange_evaluation(board, move):
+    """
+    Returns the material the side to move can expect to win, in hundredths of
+    a pawn, by making the given capture and then letting both sides keep
+    recapturing on the same square with their least valuable piece for as long
+    as it pays off.
+    A negative result means the capture loses material.
+    """
+    to_square = move.to_square
+    from_square = move.from_square
+    occupied = board.occupied ^ chess.BB_SQUARES[from_square]
+
+    if board.is_en_passant(move):
+        captured_value = SEE_VALUES[chess.PAWN]
+        captured_square = to_square - 8 if board.turn == chess.WHITE else to_square + 8
+        occupied ^= chess.BB_SQUARES[captured_square]
+    else:
+        captured_type = board.piece_type_at(to_square)
+        captured_value = SEE_VALUES[captured_type] if captured_type else 0
+
+    attacker_type = board.piece_type_at(from_square)
+    gains = [captured_value]
+    if move.promotion:
+        gains[0] += SEE_VALUES[move.promotion] - SEE_VALUES[chess.PAWN]
+        attacker_type = move.promotion
+
+    color = not board.turn
+    while True:
+        attackers = board.attackers_mask(color, to_square, occupied) & occupied
+        if not attackers:
+            break
+
+        # Recapture with the least valuable piece
+        for piece_type in chess.PIECE_TYPES:
+            piece_attackers = attackers & board.pieces_mask(piece_type, color)
+            if piece_attackers:
+                break
+
+        # The king can only recapture if the square is no longer defended
+        if piece_type == chess.KING and (
+                board.attackers_mask(not color, to_square, occupied) & occupied):
+            break
+
+        # What is gained by recapturing is the value of the piece that took
+        # last, less whatever was gained before
+        gains.append(SEE_VALUES[attacker_type] - gains[-1])
+        if max(-gains[-2], gains[-1]) < 0:
+            # Neither side would choose to continue from here
+            break
+
+        occupied ^= piece_attackers & -piece_attackers
+        attacker_type = piece_type
+        color = not color
+
+    # Each side may instead stop recapturing, whenever that is better for it
+    while len(gains) > 1:
+        gain = gains.pop()
+        gains[-1] = -max(-gains[-1], gain)
+    return gains[0]
@@ -0,0 +1,254 @@
+import json
+import random
+import struct
+
+import chess
+import chess.pgn
+import chess.polyglot
+
+
+class OpeningBookNode:
+    """
+    A single position in the opening tree, reached by playing the moves on the
+    path from the root of the tree.
+    """
+    __slots__ = ('children', 'openings', 'depth')
+
+    def __init__(self, depth):
+        # Maps the UCI string of each book move from this position to the node
+        # of the position it leads to
+        self.children = {}
+        # The openings with the fewest moves which continue past this position
+        self.openings = []
+        # The number of half moves played to reach this position
+        self.depth = depth
+
+
+class OpeningBook:
+    """
+    Looks up the openings which continue from a position.
+
+    The move sequences of every opening are stored in a tree, so that a game
+    can be looked up by walking its moves from the root of the tree.
+    Positions that are reached through a different move order than any
+    opening's are found through an index of every position in the tree by
+    Zobrist hash, which is only built the first time it is needed.
+    """
+    def __init__(self, openings):
+        self.openings = openings
+        self.root = OpeningBookNode(0)
+        self.positions = None
+
+        for opening in openings:
+            moves = opening.get('m')
+            if not moves:
+                continue
+            node = self.root
+            for depth, move_string in enumerate(moves):
+                self.add_opening(node, opening)
+                child = node.children.get(move_string)
+                if child is None:
+                    child = OpeningBookNode(depth + 1)
+                    node.children[move_string] = child
+                node = child
+
+    @classmethod
+    def load(cls, path):
+        """ Returns the OpeningBook of the openings stored in a json file. """
+        with open(path, 'r') as openings_file:
+            return cls(json.load(openings_file))
+
+    def add_opening(self, node, opening):
+        """
+        Adds an opening continuing past the node, if it has no more moves than
+        the openings already stored there.
+        """
+        if not node.openings or len(opening['m']) == len(node.openings[0]['m']):
+            node.openings.append(opening)
+        elif len(opening['m']) < len(node.openings[0]['m']):
+            node.openings = [opening]
+
+    def build_position_index(self):
+        """
+        Indexes every node of the tree by the Zobrist hash of its position.
+        """
+        self.positions = {}
+        board = chess.Board()
+        # Walk the tree depth first, pushing and popping each move on the way
+        stack = [(self.root, iter(self.root.children.items()))]
+        self.positions.setdefault(chess.polyglot.zobrist_hash(board), []).append(self.root)
+        while stack:
+            node, children = stack[-1]
+            child_item = next(children, None)
+            if child_item is None:
+                stack.pop()
+                if stack:
+                    board.pop()
+                continue
+
+            move_string, child = child_item
+            board.push_uci(move_string)
+            key = chess.polyglot.zobrist_hash(board)
+            self.positions.setdefault(key, []).append(child)
+            stack.append((child, iter(child.children.items())))
+
+    def find_node(self, board):
+        """
+        Returns the node reached by playing the moves of the given board from
+        the root of the tree, or None if the game has left the tree.
+        """
+        node = self.root
+        for move in board.move_stack:
+            node = node.children.get(move.uci())
+            if node is None:
+                return None
+        return node
+
+    def find_openings(self, board):
+        """
+        Returns a list of (opening, move string) pairs for the openings with
+        the fewest moves which continue from the position of the board, where
+        the move string is the next move of the opening in UCI.
+        """
+        node = self.find_node(board)
+        if node is not None and node.openings:
+            return [(opening, opening['m'][node.depth]) for opening in node.openings]
+
+        # The moves were not played in the order of any opening, but the
+        # position may still have been reached by a different order
+        if self.positions is None:
+            self.build_position_index()
+        nodes = self.positions.get(chess.polyglot.zobrist_hash(board), [])
+
+        candidates = []
+        for node in nodes:
+            for opening in node.openings:
+                move_string = opening['m'][node.depth]
+                if chess.Move.from_uci(move_string) in board.legal_moves:
+                    candidates.append((opening, move_string))
+        if not candidates:
+            return []
+        fewest_moves = min(len(opening['m']) for opening, _ in candidates)
+        return [(opening, move_string) for opening, move_string in candidates
+                if len(opening['m']) == fewest_moves]
+
+    def choose_move(self, board, random_generator=random):
+        """
+        Returns a randomly chosen (opening, move string) pair out of those
+        found by find_openings, or False if the position is not in the book.
+        """
+        candidates = self.find_openings(board)
+        if not candidates:
+            return False
+        return random_generator.choice(candidates)
+
+
+class PolyglotBook:
+    """
+    Looks up book moves in an opening book stored in the binary Polyglot
+    format, as written by write_polyglot_book.
+
+    The file is memory mapped and binary searched by Zobrist hash, so nothing
+    is parsed when the book is opened and only the entries of the positions
+    looked up are ever read.
+    Polyglot books do not store the names of openings.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.reader = chess.polyglot.open_reader(path)
+
+    def find_openings(self, board):
+        """
+        Returns a list of (None, move string) pairs of every book move from the
+        position of the board, in the same form as OpeningBook.find_openings.
+        """
+        return [(None, entry.move.uci()) for entry in self.reader.find_all(board)]
+
+    def choose_move(self, board, random_generator=random):
+        """
+        Returns a (None, move string) pair for a book move chosen at random,
+        weighted by how many openings play it, or False if the position is not
+        in the book.
+        """
+        try:
+            entry = self.reader.weighted_choice(board, random=random_generator)
+        except IndexError:
+            return False
+        return None, entry.move.uci()
+
+    def close(self):
+        """ Closes the book file. """
+        self.reader.close()
+
+
+# Each Polyglot entry is a 64 bit key, a 16 bit move, a 16 bit weight and a
+# 32 bit learn value, all big-endian
+POLYGLOT_ENTRY = struct.Struct('>QHHI')
+
+POLYGLOT_PROMOTIONS = {
+    None: 0,
+    chess.KNIGHT: 1,
+    chess.BISHOP: 2,
+    chess.ROOK: 3,
+    chess.QUEEN: 4,
+}
+
+
+def polyglot_move(board, move):
+    """ Returns the 16 bit Polyglot encoding of a move from the given board. """
+    to_square = move.to_square
+    # Polyglot stores castling as the king moving onto its own rook
+    if board.is_castling(move):
+        rook_file = 7 if board.is_kingside_castling(move) else 0
+        to_square = chess.square(rook_file, chess.square_rank(move.from_square))
+    return (chess.square_file(to_square)
+            | chess.square_rank(to_square) << 3
+            | chess.square_file(move.from_square) << 6
+            | chess.square_rank(move.from_square) << 9
+            | POLYGLOT_PROMOTIONS[move.promotion] << 12)
+
+
+def write_polyglot_book(openings, path):
+    """
+    Writes every position and move of the given openings (dictionaries with
+    the moves in UCI under 'm', as in json/openings.json) to a Polyglot book
+    at the given path.
+    The weight of each move is the number of openings which play it from that
+    position.
+    Returns the number of entries written.
+    """
+    weights = {}
+    for opening in openings:
+        board = chess.Board()
+        played = set()
+        for move_string in opening.get('m', []):
+            move = chess.Move.from_uci(move_string)
+            entry = (chess.polyglot.zobrist_hash(board), polyglot_move(board, move))
+            # Count each opening only once, even if it repeats a position
+            if entry not in played:
+                played.add(entry)
+                weights[entry] = weights.get(entry, 0) + 1
+            board.push(move)
+
+    with open(path, 'wb') as book_file:
+        for key, raw_move in sorted(weights):
+            weight = min(weights[key, raw_move], 0xFFFF)
+            book_file.write(POLYGLOT_ENTRY.pack(key, raw_move, weight, 0))
+    return len(weights)
+
+
+def read_pgn_openings(path, max_plies=20):
+    """
+    Returns the first max_plies moves of the main line of every game in a PGN
+    file, as opening dictionaries in the same form as json/openings.json.
+    """
+    openings = []
+    with open(path, 'r') as pgn_file:
+        while True:
+            game = chess.pgn.read_game(pgn_file)
+            if game is None:
+                break
+            moves = [move.uci() for move in game.mainline_moves()][:max_plies]
+            name = game.headers.get('Opening', game.headers.get('Event', ''))
+            openings.append({'n': name, 'm': moves})
+    return openings
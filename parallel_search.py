@@ -0,0 +1,177 @@
+import multiprocessing
+import time
+
+import chess
+
+import resources
+from search_stats import SearchStats
+
+# State of each worker process, set up by init_worker
+worker_engine = None
+shared_alpha = None
+current_search = None
+last_search = None
+
+
+def init_worker(color, tt_size_mb, alpha, search_id, seed, settings):
+    """
+    Runs once in every worker process, creating the Engine that searches the
+    root moves sent to this worker, with the seed and search settings (as
+    given by Engine.search_settings) of the engine it searches for.
+    The engine is kept between searches so that its transposition table,
+    killer moves and history carry over from one search to the next.
+    """
+    # Imported here since engine imports this module
+    from engine import Engine
+
+    global worker_engine, shared_alpha, current_search
+    worker_engine = Engine(chess.Board(), color, tt_size_mb=tt_size_mb, seed=seed,
+                           verbose=False)
+    apply_settings(settings)
+    shared_alpha = alpha
+    current_search = search_id
+
+
+def apply_settings(settings):
+    """ Sets the search settings of the worker's engine. """
+    for name, value in settings.items():
+        setattr(worker_engine, name, value)
+
+
+def search_root_move(task):
+    """
+    Searches a single root move in a worker process.
+    The task is a (search id, root FEN, UCI moves played since the root,
+    UCI move to search, depth, search settings) tuple, the settings being
+    sent with every task since they may have changed since the worker started.
+    Returns the move, its value, whether that value is exact and the
+    SearchStats of its search, or None if the search the task belongs to has
+    already been stopped. A value which is not exact is no greater than the
+    bound the move was searched with, so only shows that the move is no
+    better than a move some worker had already found.
+    """
+    search_id, root_fen, move_history, move_string, depth, settings = task
+    if search_id != current_search.value:
+        return None
+    apply_settings(settings)
+
+    board = chess.Board(root_fen)
+    for history_move in move_history:
+        board.push_uci(history_move)
+    worker_engine.board = board
+    search_board = worker_engine.create_search_board()
+
+    # Start from the best value any worker has found so far, so that moves
+    # which cannot beat it are cut off as early as possible
+    alpha = shared_alpha.value
+    worker_engine.stats = SearchStats()
+    global last_search
+    if search_id != last_search:
+        worker_engine.transposition_table.new_search()
+        worker_engine.move_orderer.new_search()
+        last_search = search_id
+    search_board.push(chess.Move.from_uci(move_string))
+    move_val = worker_engine.alpha_beta_minimax(depth-.5, False, alpha, 1000, search_board)
+
+    with shared_alpha.get_lock():
+        if move_val > shared_alpha.value:
+            shared_alpha.value = move_val
+
+    return move_string, move_val, move_val > alpha, worker_engine.stats
+
+
+class ParallelSearch:
+    """
+    Splits the moves at the root of a search between a pool of worker
+    processes, each of which searches its moves with its own Engine.
+
+    All workers share the best value found so far at the root, which they use
+    as the lower bound of their search windows.
+    The pool is started the first time it is used and should be shut down with
+    close once it is no longer needed.
+    """
+    def __init__(self, workers, color, tt_size_mb=16, seed=None):
+        self.workers = workers
+        self.color = color
+        self.tt_size_mb = tt_size_mb
+        self.seed = seed
+        self.pool = None
+
+        self.alpha = multiprocessing.Value('d', -1000.0)
+        # Tasks from any search other than the current one are skipped, so
+        # that stopping a search does not leave its moves queued in the pool
+        self.search_id = multiprocessing.Value('i', 0)
+
+    def start(self, settings=None):
+        """
+        Starts the worker processes, with the given search settings, if they
+        are not already running.
+        """
+        if self.pool is None:
+            # Load the shared resources before forking, so every worker
+            # inherits them
+            resources.preload()
+            self.pool = multiprocessing.Pool(
+                self.workers, init_worker,
+                (self.color, self.tt_size_mb, self.alpha, self.search_id,
+                 self.seed, settings or {}),
+            )
+
+    def close(self):
+        """ Shuts down the worker processes. """
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    def search_moves(self, board, moves, depth, alpha, deadline=None, settings=None):
+        """
+        Searches each of the given moves from the position of the board to the
+        given depth, with alpha as the initial lower bound, using the given
+        search settings (as given by Engine.search_settings) if any.
+        Returns a list of (move, value, exact, SearchStats) tuples, where
+        values which are not exact only show that the move is no better than
+        another.
+        If a deadline (as given by time.time()) is given and it passes before
+        every move has been searched, or the search is stopped, None is
+        returned instead.
+        """
+        settings = settings or {}
+        self.start(settings)
+        with self.search_id.get_lock():
+            self.search_id.value += 1
+            search_id = self.search_id.value
+        with self.alpha.get_lock():
+            self.alpha.value = alpha
+
+        root_fen = board.root().fen()
+        move_history = [move.uci() for move in board.move_stack]
+        tasks = [
+            (search_id, root_fen, move_history, move.uci(), depth, settings)
+            for move in moves
+        ]
+
+        results = []
+        iterator = self.pool.imap_unordered(search_root_move, tasks)
+        for _ in tasks:
+            try:
+                if deadline is None:
+                    result = next(iterator)
+                else:
+                    result = iterator.next(max(0, deadline - time.time()))
+            except multiprocessing.TimeoutError:
+                self.stop()
+                return None
+            # The search was stopped before the worker got to this move
+            if result is None:
+                self.stop()
+                return None
+            move_string, move_val, exact, stats = result
+            results.append((chess.Move.from_uci(move_string), move_val, exact, stats))
+
+        return results
+
+    def stop(self):
+        """ Makes the workers skip every task of the current search. """
+        with self.search_id.get_lock():
+            self.search_id.value += 1
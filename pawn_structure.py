@@ -0,0 +1,146 @@
+import chess
+
+# Penalties, in hundredths of a pawn, for every pawn on a file beyond the
+# first, and for every pawn with no pawns of its own color on either
+# neighbouring file
+DOUBLED_PAWN_PENALTY = 15
+ISOLATED_PAWN_PENALTY = 12
+# Bonus, in hundredths of a pawn, for a pawn which no enemy pawn can stop,
+# by how many ranks it has advanced from its own side of the board
+PASSED_PAWN_BONUSES = (0, 5, 10, 20, 35, 60, 100, 0)
+
+
+def build_passed_pawn_masks():
+    """
+    Returns, for each color and square, the mask of the squares in front of a
+    pawn of that color on that square, on its own and both neighbouring
+    files, which must hold no enemy pawn for the pawn to be passed.
+    """
+    masks = [[0] * 64, [0] * 64]
+    for square in chess.SQUARES:
+        file = chess.square_file(square)
+        rank = chess.square_rank(square)
+        files = 0
+        for neighbour in (file - 1, file, file + 1):
+            if 0 <= neighbour < 8:
+                files |= chess.BB_FILES[neighbour]
+        ahead = 0
+        for other_rank in range(rank + 1, 8):
+            ahead |= chess.BB_RANKS[other_rank]
+        behind = 0
+        for other_rank in range(rank):
+            behind |= chess.BB_RANKS[other_rank]
+        masks[chess.WHITE][square] = files & ahead
+        masks[chess.BLACK][square] = files & behind
+    return masks
+
+
+PASSED_PAWN_MASKS = build_passed_pawn_masks()
+
+# The files next to each file, whose pawns keep a pawn from being isolated
+NEIGHBOURING_FILES = [
+    (chess.BB_FILES[file - 1] if file > 0 else 0)
+    | (chess.BB_FILES[file + 1] if file < 7 else 0)
+    for file in range(8)
+]
+
+
+def side_pawn_structure(pawns, enemy_pawns, color):
+    """
+    Returns the value, in hundredths of a pawn, of the structure of one
+    side's pawns, counting doubled and isolated pawns against it and its
+    passed pawns for it.
+    """
+    score = 0
+    for file in range(8):
+        count = chess.popcount(pawns & chess.BB_FILES[file])
+        if not count:
+            continue
+        if count > 1:
+            score -= (count - 1) * DOUBLED_PAWN_PENALTY
+        if not pawns & NEIGHBOURING_FILES[file]:
+            score -= count * ISOLATED_PAWN_PENALTY
+
+    # Of doubled pawns only the front one counts as passed
+    passed_pawn_masks = PASSED_PAWN_MASKS[color]
+    for square in chess.scan_forward(pawns):
+        mask = passed_pawn_masks[square]
+        if not enemy_pawns & mask and not pawns & mask & chess.BB_FILES[chess.square_file(square)]:
+            rank = chess.square_rank(square)
+            score += PASSED_PAWN_BONUSES[rank if color == chess.WHITE else 7 - rank]
+    return score
+
+
+def evaluate_pawn_structure(white_pawns, black_pawns):
+    """
+    Returns the value of the pawn structure given by the masks of each side's
+    pawns, in hundredths of a pawn from white's point of view.
+    """
+    return (side_pawn_structure(white_pawns, black_pawns, chess.WHITE)
+            - side_pawn_structure(black_pawns, white_pawns, chess.BLACK))
+
+
+class PawnHashTable:
+    """
+    Remembers the value of every pawn structure that has been evaluated, since
+    the pawns change far less often than the rest of the position during a
+    search.
+
+    Entries are keyed by the masks of both sides' pawns themselves, so two
+    structures can never be mistaken for each other. The entries are kept in
+    two generations of at most half the table's size each: new entries go
+    into the newer one, and once it is full the older generation is dropped
+    and the newer one takes its place. Entries found in the older generation
+    are moved back into the newer one, so structures still in use are kept.
+    """
+    # Rough number of bytes used by one stored entry, including its slot in
+    # the dictionary and its key and value
+    ENTRY_SIZE = 200
+
+    def __init__(self, size_mb=1):
+        self.size_mb = size_mb
+        self.generation_size = max(1, int(size_mb * 1024 * 1024) // self.ENTRY_SIZE // 2)
+        # Values by (white pawns, black pawns)
+        self.entries = {}
+        self.old_entries = {}
+
+        self.probes = 0
+        self.hits = 0
+
+    def clear(self):
+        """ Removes every stored entry. """
+        self.entries = {}
+        self.old_entries = {}
+
+    def probe(self, white_pawns, black_pawns):
+        """
+        Returns the value stored for the pawn structure, or None if it has not
+        been stored.
+        """
+        self.probes += 1
+        key = (white_pawns, black_pawns)
+        score = self.entries.get(key)
+        if score is None:
+            score = self.old_entries.pop(key, None)
+            if score is None:
+                return None
+            self.store(white_pawns, black_pawns, score)
+        self.hits += 1
+        return score
+
+    def store(self, white_pawns, black_pawns, score):
+        """ Stores the value of the pawn structure. """
+        if len(self.entries) >= self.generation_size:
+            self.old_entries = self.entries
+            self.entries = {}
+        self.entries[(white_pawns, black_pawns)] = score
+
+    def hit_rate(self):
+        """ Returns the fraction of probes that found a stored entry. """
+        if self.probes == 0:
+            return 0.0
+        return self.hits / self.probes
+
+    def usage(self):
+        """ Returns the fraction of the entries the table may hold that it holds. """
+        return (len(self.entries) + len(self.old_entries)) / (self.generation_size * 2)
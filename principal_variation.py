@@ -0,0 +1,50 @@
+from array import array
+
+from search_board import decode_move, encode_move
+
+
+class PrincipalVariationTable:
+    """
+    Collects the principal variation as the search finds it, one line per ply.
+
+    The line at each ply is the best line found so far from the position
+    being searched at that ply: whenever a move becomes the best of its
+    position, the line at its ply becomes that move followed by the line just
+    left at the next ply by searching it. The line at ply 0 is then the
+    principal variation of the whole search.
+
+    Unlike the best moves of the transposition table, these lines cannot be
+    overwritten by the rest of the search. The lines are kept as move codes
+    (see search_board.encode_move) in one array allocated up front, row by
+    ply, so that updating them creates no objects.
+    """
+    __slots__ = ('max_ply', 'moves', 'lengths')
+
+    def __init__(self, max_ply=128):
+        self.max_ply = max_ply
+        self.moves = array('H', [0]) * (max_ply * max_ply)
+        self.lengths = array('H', [0]) * (max_ply + 1)
+
+    def clear(self, ply):
+        """ Empties the line at the given ply, which must be done on entering every node. """
+        if ply < self.max_ply:
+            self.lengths[ply] = 0
+
+    def update(self, ply, move):
+        """ Makes the line at the given ply the move followed by the line at the next ply. """
+        if ply >= self.max_ply:
+            return
+        start = ply * self.max_ply
+        self.moves[start] = encode_move(move)
+        # The line past the last ply is never filled in, so is always empty
+        length = min(self.lengths[ply + 1], self.max_ply - 1)
+        if length:
+            child_start = start + self.max_ply
+            self.moves[start + 1:start + 1 + length] = \
+                self.moves[child_start:child_start + length]
+        self.lengths[ply] = length + 1
+
+    def line(self, ply=0):
+        """ Returns the moves of the line at the given ply. """
+        start = ply * self.max_ply
+        return [decode_move(code) for code in self.moves[start:start + self.lengths[ply]]]
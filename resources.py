@@ -0,0 +1,171 @@
+"""
+The data every Engine shares: piece values, piece square tables, the tables
+built from them, the opening book and the endgame bitbases.
+
+Everything but the constants is only built or opened the first time it is
+asked for, and then kept for the life of the process, so creating an Engine
+costs next to nothing and every Engine in a process uses the same objects.
+None of them may be changed once built.
+Calling preload before starting worker processes lets the workers inherit
+the loaded resources instead of loading them again.
+"""
+import functools
+import json
+import os
+
+import chess
+
+import bitbases
+from bitboard_evaluation import BitboardEvaluator
+from opening_book import OpeningBook, PolyglotBook
+from search_board import SearchBoard
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+POLYGLOT_BOOK_PATH = os.path.join(PACKAGE_DIR, 'json', 'openings.bin')
+JSON_BOOK_PATH = os.path.join(PACKAGE_DIR, 'json', 'openings.json')
+
+# Set the piece values to some generally accepted constants
+PIECE_VALUES = {
+    chess.PAWN: 1,
+    chess.KNIGHT: 3,
+    chess.BISHOP: 3.2,
+    chess.ROOK: 5,
+    chess.QUEEN: 9,
+    chess.KING: 200,
+}
+
+# Create a square value matrix for each piece type
+
+# This will encourage certain generally strong tactics to be played,
+# such as keeping the knights in the center and taking control of the
+# center with the pawns
+
+# Each matrix is stored as a single-dimensional list, since the Board
+# class of chess refers to each square using a single integer
+# The matrices are written as the board is seen from white's side, with the
+# top left corner first, so piece_squares reverses them to the order of
+# chess.SQUARES
+PIECE_SQUARE_MATRICES = {
+    chess.PAWN: [
+         0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0,
+         0.5, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5, 0.5,
+         0.1, 0.1, 0.2, 0.3, 0.3, 0.2, 0.1, 0.1,
+         .05, .05, 0.1, .25, .25, 0.1, .05, .05,
+         0.0, 0.0, 0.0, 0.2, 0.2, 0.0, 0.0, 0.0,
+         .05,-.05,-0.1, 0.0, 0.0,-0.1,-.05, .05,
+         .05, 0.1, 0.1,-0.2,-0.2, 0.1, 0.1, .05,
+         0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0
+    ],
+    chess.KNIGHT: [
+        -0.5,-0.4,-0.3,-0.3,-0.3,-0.3,-0.4,-0.5,
+        -0.4,-0.2, 0.0, 0.0, 0.0, 0.0,-0.2,-0.4,
+        -0.3, 0.0, 0.1, .15, .15, 0.1, 0.0,-0.3,
+        -0.3, .05, .15, 0.2, 0.2, .15, .05,-0.3,
+        -0.3, 0.0, .15, 0.2, 0.2, .15, 0.0,-0.3,
+        -0.3, .05, 0.1, .15, .15, 0.1, .05,-0.3,
+        -0.4,-0.2, 0.0, .05, .05, 0.0,-0.2,-0.4,
+        -0.5,-0.4,-0.3,-0.3,-0.3,-0.3,-0.4,-0.5,
+    ],
+    chess.BISHOP: [
+        -0.2,-0.1,-0.1,-0.1,-0.1,-0.1,-0.1,-0.2,
+        -0.1, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0,-0.1,
+        -0.1, 0.0, .05, 0.1, 0.1, .05, 0.0,-0.1,
+        -0.1, .05, .05, 0.1, 0.1, .05, .05,-0.1,
+        -0.1, 0.0, 0.1, 0.1, 0.1, 0.1, 0.0,-0.1,
+        -0.1, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1,-0.1,
+        -0.1, .05, 0.0, 0.0, 0.0, 0.0, .05,-0.1,
+        -0.2,-0.1,-0.1,-0.1,-0.1,-0.1,-0.1,-0.2,
+    ],
+    chess.ROOK: [
+         0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0,
+         .05, 0.1, 0.1, 0.1, 0.1, 0.1, 0.1, .05,
+        -.05, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0,-.05,
+        -.05, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0,-.05,
+        -.05, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0,-.05,
+        -.05, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0,-.05,
+        -.05, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0,-.05,
+         0.0, 0.0, 0.0, .05, .05, 0.0, 0.0, 0.0,
+    ],
+    chess.QUEEN: [
+        -0.2,-0.1,-0.1,-.05,-.05,-0.1,-0.1,-0.2,
+        -0.1, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0,-0.1,
+        -0.1, 0.0, .05, .05, .05, .05, 0.0,-0.1,
+        -.05, 0.0, .05, .05, .05, .05, 0.0,-.05,
+         0.0, 0.0, .05, .05, .05, .05, 0.0,-.05,
+        -0.1, .05, .05, .05, .05, .05, 0.0,-0.1,
+        -0.1, 0.0, .05, 0.0, 0.0, 0.0, 0.0,-0.1,
+        -0.2,-0.1,-0.1,-.05,-.05,-0.1,-0.1,-0.2,
+    ],
+    chess.KING: [
+        -0.3,-0.4,-0.4,-0.5,-0.5,-0.4,-0.4,-0.3,
+        -0.3,-0.4,-0.4,-0.5,-0.5,-0.4,-0.4,-0.3,
+        -0.3,-0.4,-0.4,-0.5,-0.5,-0.4,-0.4,-0.3,
+        -0.3,-0.4,-0.4,-0.5,-0.5,-0.4,-0.4,-0.3,
+        -0.2,-0.3,-0.3,-0.4,-0.4,-0.3,-0.3,-0.1,
+        -0.1,-0.2,-0.2,-0.2,-0.2,-0.2,-0.2,-0.1,
+         0.2, 0.2, 0.0, 0.0, 0.0, 0.0, 0.2, 0.2,
+         0.2, 0.3, 0.1, 0.0, 0.0, 0.1, 0.3, 0.2,
+    ],
+}
+
+
+@functools.lru_cache(maxsize=None)
+def piece_squares():
+    """
+    Returns the piece square matrices reversed so that the bottom right corner
+    of each matrix is indexed as 0 and the top left corner is indexed as 63.
+    """
+    return {piece_type: tuple(reversed(matrix))
+            for piece_type, matrix in PIECE_SQUARE_MATRICES.items()}
+
+
+@functools.lru_cache(maxsize=None)
+def square_values():
+    """
+    Returns the piece values and matrices combined into one table, used by
+    SearchBoard to keep the score up to date as moves are made.
+    """
+    return SearchBoard.build_square_values(PIECE_VALUES, piece_squares())
+
+
+@functools.lru_cache(maxsize=None)
+def bitboard_evaluator():
+    """ Returns the evaluator which scores boards that are not SearchBoards. """
+    return BitboardEvaluator(square_values())
+
+
+@functools.lru_cache(maxsize=None)
+def opening_book():
+    """
+    Returns the opening book. The compiled book is used if it has been built
+    with json/build_polyglot_book.py, since it is memory mapped rather than
+    parsed and so costs nothing to open. Otherwise the openings are loaded
+    from the json file and indexed as an OpeningBook.
+    """
+    if os.path.exists(POLYGLOT_BOOK_PATH):
+        return PolyglotBook(POLYGLOT_BOOK_PATH)
+    return OpeningBook.load(JSON_BOOK_PATH)
+
+
+@functools.lru_cache(maxsize=None)
+def endgame_bitbases():
+    """
+    Returns the KPK, KRK and KQK bitbases built by bitbases.py, by the piece
+    type of the strong side, leaving out any that have not been built.
+    """
+    return bitbases.load()
+
+
+def openings():
+    """ Returns the list of openings stored in the json file. """
+    with open(JSON_BOOK_PATH, 'r') as openings_file:
+        return json.load(openings_file)
+
+
+def preload():
+    """ Loads every resource, so that processes forked afterwards share them. """
+    piece_squares()
+    square_values()
+    bitboard_evaluator()
+    opening_book()
+    endgame_bitbases()
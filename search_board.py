@@ -0,0 +1,259 @@
+from array import array
+
+import chess
+import chess.polyglot
+
+ZOBRIST_ARRAY = chess.polyglot.POLYGLOT_RANDOM_ARRAY
+
+# The code of no move at all, which fits in an unsigned short like every
+# real move's code
+NO_MOVE = 0xFFFF
+# Every Move decoded so far, by its code, so that each is only created once
+MOVES = [None] * (1 << 15)
+
+
+def piece_key(piece_type, color, square):
+    """ Returns the Zobrist key of a piece standing on a square. """
+    return ZOBRIST_ARRAY[64 * ((piece_type - 1) * 2 + color) + square]
+
+
+def encode_move(move):
+    """
+    Returns a move as a single integer below 2 ** 15: the from square, the to
+    square shifted by 6 bits and the promotion piece type shifted by 12 bits.
+    """
+    return move.from_square | move.to_square << 6 | (move.promotion or 0) << 12
+
+
+def decode_move(code):
+    """
+    Returns the Move with the given code, which is the same object every time,
+    so that decoding moves costs no allocations once each has been seen.
+    """
+    move = MOVES[code]
+    if move is None:
+        move = MOVES[code] = chess.Move(code & 63, code >> 6 & 63, code >> 12 or None)
+    return move
+
+
+class SearchBoard(chess.Board):
+    """
+    A Board used by the engine while searching, which keeps its material and
+    piece square score up to date as moves are pushed and popped, so that the
+    score of a position never has to be worked out from every piece again.
+
+    The score is stored in hundredths of a pawn, from white's point of view
+    (white's total minus black's total), as an integer so that adding and
+    removing the same values always returns exactly to the previous score.
+
+    The Zobrist hash of the position, the same as chess.polyglot.zobrist_hash
+    gives, is kept up to date in the same way as key, along with the keys of
+    every earlier position of the game, so that repetitions can be found
+    without replaying the move stack.
+
+    Only push and pop keep the score and key up to date, so the board should
+    not be changed in any other way (such as set_fen) during a search without
+    calling refresh afterwards.
+    """
+    def __init__(self, fen=chess.STARTING_FEN, *, chess960=False,
+                 square_values=None):
+        super().__init__(fen, chess960=chess960)
+        self.square_values = square_values
+        # The score and key before every move, kept as machine integers
+        self.score_stack = array('q')
+        self.score = 0
+        self.key_stack = array('Q')
+        self.key = chess.polyglot.zobrist_hash(self)
+        if square_values is not None:
+            self.refresh()
+
+    @staticmethod
+    def build_square_values(piece_values, piece_squares):
+        """
+        Combines the piece values and the piece square matrices used by Engine
+        into a single table, indexed by color, then piece type, then square,
+        of the value in hundredths of a pawn of that piece standing on that
+        square.
+        """
+        square_values = [None, None]
+        for color in chess.COLORS:
+            color_values = [None]
+            for piece_type in chess.PIECE_TYPES:
+                piece_square_values = []
+                for square in chess.SQUARES:
+                    # The matrices are stored from white's side of the board,
+                    # so black looks them up from the opposite corner
+                    index = square if color == chess.WHITE else 63 - square
+                    value = piece_values[piece_type] + piece_squares[piece_type][index]
+                    piece_square_values.append(round(value * 100))
+                color_values.append(piece_square_values)
+            square_values[color] = color_values
+        return square_values
+
+    @classmethod
+    def from_board(cls, board, square_values):
+        """
+        Returns a SearchBoard in the same position as the given board, with the
+        same move history.
+        """
+        search_board = cls(board.root().fen(), chess960=board.chess960,
+                           square_values=square_values)
+        for move in board.move_stack:
+            search_board.push(move)
+        return search_board
+
+    def refresh(self):
+        """ Works out the score and key again from every piece on the board. """
+        self.key = chess.polyglot.zobrist_hash(self)
+        score = 0
+        for square, piece in self.piece_map().items():
+            value = self.square_values[piece.color][piece.piece_type][square]
+            score += value if piece.color == chess.WHITE else -value
+        self.score = score
+
+    def castling_and_en_passant_key(self):
+        """
+        Returns the part of the Zobrist key given by the castling rights, the
+        en passant square and the side to move.
+        """
+        key = 0
+        castling_rights = self.castling_rights
+        if castling_rights & chess.BB_H1:
+            key ^= ZOBRIST_ARRAY[768]
+        if castling_rights & chess.BB_A1:
+            key ^= ZOBRIST_ARRAY[769]
+        if castling_rights & chess.BB_H8:
+            key ^= ZOBRIST_ARRAY[770]
+        if castling_rights & chess.BB_A8:
+            key ^= ZOBRIST_ARRAY[771]
+        if self.ep_square is not None:
+            # Polyglot only counts the en passant square if a pawn is ready to
+            # take on it
+            if self.pawns & self.occupied_co[self.turn] & \
+                    chess.BB_PAWN_ATTACKS[not self.turn][self.ep_square]:
+                key ^= ZOBRIST_ARRAY[772 + chess.square_file(self.ep_square)]
+        if self.turn == chess.WHITE:
+            key ^= ZOBRIST_ARRAY[780]
+        return key
+
+    def has_legal_move(self):
+        """
+        Returns whether the side to move has a legal move, stopping at the
+        first one found, which tells stalemate apart from a quiet position.
+        """
+        if self.is_check():
+            return any(self.generate_legal_moves())
+        # Most often the king can simply step to a square nothing attacks
+        king = self.king(self.turn)
+        if king is not None:
+            occupied = self.occupied ^ chess.BB_SQUARES[king]
+            for square in chess.scan_forward(
+                    chess.BB_KING_ATTACKS[king] & ~self.occupied_co[self.turn]):
+                if not self.attackers_mask(not self.turn, square, occupied):
+                    return True
+        for move in self.generate_pseudo_legal_moves():
+            if not self.is_into_check(move):
+                return True
+        return False
+
+    def is_repeated(self, ply):
+        """
+        Returns whether the position is a draw by repetition for the search,
+        which it is if the position has already occurred twice, or once in
+        the last ply half moves (since repeating it once in the search means
+        either side could repeat it again).
+        Only positions since the last capture or pawn move are looked at,
+        since no earlier position can come back.
+        """
+        key = self.key
+        key_stack = self.key_stack
+        earliest = max(len(key_stack) - self.halfmove_clock, 0)
+        repetitions = 0
+        for index in range(len(key_stack) - 4, earliest - 1, -2):
+            if key_stack[index] == key:
+                if len(key_stack) - index <= ply:
+                    return True
+                repetitions += 1
+                if repetitions >= 2:
+                    return True
+        return False
+
+    def push(self, move):
+        self.score_stack.append(self.score)
+        self.key_stack.append(self.key)
+        key = self.key ^ self.castling_and_en_passant_key()
+
+        # Null moves do not change the score
+        if move:
+            color = self.turn
+            own_values = self.square_values[color]
+            opponent_values = self.square_values[not color]
+            from_square = move.from_square
+            to_square = move.to_square
+            piece_type = self.piece_type_at(from_square)
+
+            if piece_type == chess.KING and self.is_castling(move):
+                # Castling moves may be given either as the king moving two
+                # squares or as the king capturing its own rook
+                rank = chess.square_rank(from_square)
+                if self.is_kingside_castling(move):
+                    king_to, rook_from, rook_to = 6, 7, 5
+                else:
+                    king_to, rook_from, rook_to = 2, 0, 3
+                if chess.square_file(to_square) in (0, 7) and \
+                        self.piece_type_at(to_square) == chess.ROOK:
+                    rook_from = chess.square_file(to_square)
+                king_values = own_values[chess.KING]
+                rook_values = own_values[chess.ROOK]
+                change = (king_values[chess.square(king_to, rank)]
+                          - king_values[from_square]
+                          + rook_values[chess.square(rook_to, rank)]
+                          - rook_values[chess.square(rook_from, rank)])
+                key ^= (piece_key(chess.KING, color, from_square)
+                        ^ piece_key(chess.KING, color, chess.square(king_to, rank))
+                        ^ piece_key(chess.ROOK, color, chess.square(rook_from, rank))
+                        ^ piece_key(chess.ROOK, color, chess.square(rook_to, rank)))
+            else:
+                if move.promotion:
+                    change = (own_values[move.promotion][to_square]
+                              - own_values[piece_type][from_square])
+                    key ^= (piece_key(piece_type, color, from_square)
+                            ^ piece_key(move.promotion, color, to_square))
+                else:
+                    change = (own_values[piece_type][to_square]
+                              - own_values[piece_type][from_square])
+                    key ^= (piece_key(piece_type, color, from_square)
+                            ^ piece_key(piece_type, color, to_square))
+
+                # Taking a piece removes its value from the opponent's total
+                captured_type = self.piece_type_at(to_square)
+                if captured_type:
+                    change += opponent_values[captured_type][to_square]
+                    key ^= piece_key(captured_type, not color, to_square)
+                elif piece_type == chess.PAWN and to_square == self.ep_square:
+                    captured_square = to_square - 8 if color == chess.WHITE else to_square + 8
+                    change += opponent_values[chess.PAWN][captured_square]
+                    key ^= piece_key(chess.PAWN, not color, captured_square)
+
+            if color == chess.WHITE:
+                self.score += change
+            else:
+                self.score -= change
+
+        super().push(move)
+        self.key = key ^ self.castling_and_en_passant_key()
+
+    def pop(self):
+        move = super().pop()
+        self.score = self.score_stack.pop()
+        self.key = self.key_stack.pop()
+        return move
+
+    def copy(self, *, stack=True):
+        board = super().copy(stack=stack)
+        board.square_values = self.square_values
+        board.score = self.score
+        board.score_stack = self.score_stack[len(self.score_stack) - len(board.move_stack):]
+        board.key = self.key
+        board.key_stack = self.key_stack[len(self.key_stack) - len(board.move_stack):]
+        return board
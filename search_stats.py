@@ -0,0 +1,120 @@
+import json
+
+
+class SearchStats:
+    """
+    Counts what a search did, so that changes to the engine can be measured.
+
+    One SearchStats is returned with the result of every search, and the
+    stats of each iteration of iterative deepening, or of each worker process,
+    are combined with merge.
+    """
+    def __init__(self):
+        # Positions visited, including those in quiescence search
+        self.nodes = 0
+        self.quiescence_nodes = 0
+        # Positions statically evaluated
+        self.leaf_evals = 0
+        self.beta_cutoffs = 0
+        # Cutoffs caused by the first move searched
+        self.first_move_cutoffs = 0
+        self.tt_probes = 0
+        self.tt_hits = 0
+        # Pawn structures evaluated, and those found in the pawn hash table
+        self.pawn_probes = 0
+        self.pawn_hits = 0
+        # Positions cut off by null move pruning
+        self.null_move_cutoffs = 0
+        # Moves searched at a reduced depth, and those of them which had to be
+        # searched again at full depth
+        self.reductions = 0
+        self.re_searches = 0
+        # Root searches whose value fell outside their aspiration window
+        self.aspiration_fails = 0
+        # Wall time in seconds and nodes of each completed depth
+        self.depth_times = {}
+        self.depth_nodes = {}
+
+    def merge(self, other):
+        """ Adds the counts of another SearchStats to this one. """
+        self.nodes += other.nodes
+        self.quiescence_nodes += other.quiescence_nodes
+        self.leaf_evals += other.leaf_evals
+        self.beta_cutoffs += other.beta_cutoffs
+        self.first_move_cutoffs += other.first_move_cutoffs
+        self.tt_probes += other.tt_probes
+        self.tt_hits += other.tt_hits
+        self.pawn_probes += other.pawn_probes
+        self.pawn_hits += other.pawn_hits
+        self.null_move_cutoffs += other.null_move_cutoffs
+        self.reductions += other.reductions
+        self.re_searches += other.re_searches
+        self.aspiration_fails += other.aspiration_fails
+
+    def first_move_cutoff_ratio(self):
+        """ Returns the fraction of beta cutoffs caused by the first move searched. """
+        if self.beta_cutoffs == 0:
+            return 0.0
+        return self.first_move_cutoffs / self.beta_cutoffs
+
+    def tt_hit_rate(self):
+        """ Returns the fraction of transposition table probes that found an entry. """
+        if self.tt_probes == 0:
+            return 0.0
+        return self.tt_hits / self.tt_probes
+
+    def pawn_hit_rate(self):
+        """ Returns the fraction of pawn structures found in the pawn hash table. """
+        if self.pawn_probes == 0:
+            return 0.0
+        return self.pawn_hits / self.pawn_probes
+
+    def effective_branching_factor(self):
+        """
+        Returns by how many times the number of nodes grew with each extra half
+        move of depth, on average over the completed depths, or None if fewer
+        than two depths were completed.
+        """
+        depths = sorted(self.depth_nodes)
+        if len(depths) < 2 or not self.depth_nodes[depths[0]]:
+            return None
+        plies = (depths[-1] - depths[0]) * 2
+        growth = self.depth_nodes[depths[-1]] / self.depth_nodes[depths[0]]
+        return growth ** (1 / plies)
+
+    def as_dict(self):
+        """ Returns every count and ratio as a dictionary that can be saved as json. """
+        return {
+            'nodes': self.nodes,
+            'quiescence_nodes': self.quiescence_nodes,
+            'leaf_evals': self.leaf_evals,
+            'beta_cutoffs': self.beta_cutoffs,
+            'first_move_cutoffs': self.first_move_cutoffs,
+            'first_move_cutoff_ratio': self.first_move_cutoff_ratio(),
+            'effective_branching_factor': self.effective_branching_factor(),
+            'tt_probes': self.tt_probes,
+            'tt_hits': self.tt_hits,
+            'tt_hit_rate': self.tt_hit_rate(),
+            'pawn_probes': self.pawn_probes,
+            'pawn_hits': self.pawn_hits,
+            'pawn_hit_rate': self.pawn_hit_rate(),
+            'null_move_cutoffs': self.null_move_cutoffs,
+            'reductions': self.reductions,
+            're_searches': self.re_searches,
+            'aspiration_fails': self.aspiration_fails,
+            'depth_times': {str(depth): duration for depth, duration in self.depth_times.items()},
+            'depth_nodes': {str(depth): nodes for depth, nodes in self.depth_nodes.items()},
+        }
+
+
+class JsonLinesTracer:
+    """
+    A tracing hook for Engine which writes every event it is given to a file
+    as a line of json.
+    """
+    def __init__(self, output_file):
+        self.output_file = output_file
+
+    def __call__(self, event):
+        self.output_file.write(json.dumps(event) + '\n')
+        self.output_file.flush()
@@ -0,0 +1,423 @@
+"""
+Serves many games and analysis requests at once over a local TCP or Unix
+socket, so that the engine can be driven by other programs.
+
+Each request is a line of json with an 'id', which is copied into the reply,
+and an 'op', one of:
+    new_game  {game, fen?, color?}  starts a game, in which the engine plays
+              color ('white' or 'black', by default the side to move)
+    play      {game, moves}         plays the given UCI moves in the game
+    go        {game, time?, depth?} searches for the engine's move in the
+              game, plays it and replies with it
+    analyse   {fen, time?, depth?}  searches a position outside of any game
+    stop      {game}                stops the search of the game, which then
+                                    replies with the best move found so far
+    close_game {game}               forgets the game
+Replies are json lines holding the 'id' and either the result or an 'error'.
+Requests on one connection are handled concurrently, so their replies may
+come back in any order.
+
+Searches run in a bounded pool of worker processes. Every game is pinned to a
+single worker, which keeps the game's Engine, and so its board, transposition
+table and book position, between moves.
+
+Run with python server.py --help for the available options.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import sys
+
+import chess
+
+import resources
+from engine import Engine
+from time_manager import TimeManager
+
+# Depth searched by go and analyse requests which do not give one
+DEFAULT_DEPTH = 2
+
+
+class CancellableTimeManager(TimeManager):
+    """
+    A TimeManager which also stops the search once the server sets the
+    worker's shared cancel flag to the id of the request being searched.
+    """
+    def __init__(self, cancel, request_id, move_time=None):
+        super().__init__(move_time=move_time)
+        self.cancel = cancel
+        self.request_id = request_id
+
+    def cancelled(self):
+        return self.cancel.value == self.request_id
+
+    def out_of_time(self):
+        if super().out_of_time():
+            return True
+        # The countdown has just been reset whenever the clock was read
+        return self.countdown == self.CHECK_INTERVAL and self.cancelled()
+
+    def can_start_iteration(self):
+        return not self.cancelled() and super().can_start_iteration()
+
+
+def search_result(engine, move):
+    """ Returns the reply describing a move the engine has chosen. """
+    reply = {'move': move.uci()}
+    if engine.last_result is None:
+        reply['book'] = True
+        return reply
+    _, value, depth, duration, stats = engine.last_result
+    reply.update({
+        'value': value,
+        'depth': depth,
+        'time': duration,
+        'nodes': stats.nodes,
+        'pv': [pv_move.uci() for pv_move in engine.principal_variation],
+    })
+    return reply
+
+
+def is_number(value):
+    """ Returns whether a json value is a number, which booleans are not. """
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def check_request(request):
+    """
+    Raises ValueError if any field of the request has the wrong type, so that
+    malformed requests are answered with an error rather than failing later.
+    """
+    if 'game' in request and (not isinstance(request['game'], (str, int))
+                              or isinstance(request['game'], bool)):
+        raise ValueError('game must be a string or an integer')
+    if 'fen' in request and not isinstance(request['fen'], str):
+        raise ValueError('fen must be a string')
+    if 'color' in request and request['color'] not in ('white', 'black'):
+        raise ValueError('color must be white or black')
+    if 'moves' in request and not (isinstance(request['moves'], list) and all(
+            isinstance(move_string, str) for move_string in request['moves'])):
+        raise ValueError('moves must be a list of strings')
+    if request.get('depth') is not None and not (
+            is_number(request['depth']) and request['depth'] > 0):
+        raise ValueError('depth must be a positive number')
+    if request.get('time') is not None and not (
+            is_number(request['time']) and request['time'] >= 0):
+        raise ValueError('time must be a number of seconds')
+
+
+def handle_request(engines, cancel, request):
+    """
+    Carries out a request in a worker process, using and updating the
+    worker's engines by game, and returns the reply.
+    """
+    check_request(request)
+    op = request['op']
+    if op == 'new_game':
+        board = chess.Board(request.get('fen', chess.STARTING_FEN))
+        color = board.turn
+        if 'color' in request:
+            color = chess.WHITE if request['color'] == 'white' else chess.BLACK
+        engines[request['game']] = Engine(board, color, verbose=False)
+        return {'fen': board.fen()}
+
+    if op == 'analyse':
+        board = chess.Board(request['fen'])
+        if board.is_game_over():
+            raise ValueError('the game is over')
+        engine = Engine(board, board.turn, tt_size_mb=4, verbose=False)
+        engine.is_opening = False
+        engine.is_middle_game = True
+        depth = request['depth'] if request.get('depth') is not None else DEFAULT_DEPTH
+        time_manager = CancellableTimeManager(cancel, request['id'], request.get('time'))
+        return search_result(engine, engine.generate_move(time_manager, depth))
+
+    engine = engines.get(request['game'])
+    if engine is None:
+        raise ValueError('unknown game ' + str(request['game']))
+
+    if op == 'play':
+        for move_string in request['moves']:
+            move = chess.Move.from_uci(move_string)
+            if move not in engine.board.legal_moves:
+                raise ValueError('illegal move ' + move_string)
+            engine.board.push(move)
+        return {'fen': engine.board.fen()}
+
+    if op == 'go':
+        if engine.board.turn != engine.color:
+            raise ValueError('it is not the engine\'s turn')
+        if engine.board.is_game_over():
+            raise ValueError('the game is over')
+        depth = request['depth'] if request.get('depth') is not None else DEFAULT_DEPTH
+        time_manager = CancellableTimeManager(cancel, request['id'], request.get('time'))
+        move = engine.generate_move(time_manager, depth)
+        reply = search_result(engine, move)
+        engine.board.push(move)
+        reply['fen'] = engine.board.fen()
+        return reply
+
+    if op == 'close_game':
+        engines.pop(request['game']).close()
+        return {}
+
+    raise ValueError('unknown op ' + str(op))
+
+
+class WorkerStopped(Exception):
+    """ Raised when a worker process has stopped, losing every game pinned to it. """
+
+
+def worker_main(connection, cancel):
+    """ Runs in each worker process, carrying out requests until told to exit. """
+    engines = {}
+    while True:
+        request = connection.recv()
+        if request is None:
+            break
+        try:
+            reply = handle_request(engines, cancel, request)
+        except Exception as error:
+            # Nothing a request does may stop the worker, since every game
+            # pinned to it would be lost
+            reply = {'error': str(error)}
+        connection.send(reply)
+
+
+class Worker:
+    """
+    The server's side of a worker process, which carries out one request at a
+    time, in the order they were sent.
+    """
+    def __init__(self):
+        self.connection, worker_connection = multiprocessing.Pipe()
+        self.cancel = multiprocessing.Value('i', 0)
+        self.process = multiprocessing.Process(
+            target=worker_main, args=(worker_connection, self.cancel), daemon=True
+        )
+        self.process.start()
+        self.lock = asyncio.Lock()
+        # The id of the request being carried out, and how many are waiting
+        self.current_request = None
+        self.pending = 0
+        self.games = set()
+
+    async def send(self, request):
+        """
+        Sends a request to the worker and returns its reply.
+        If the caller is cancelled while the worker is carrying the request
+        out, the request is stopped, and the worker is kept locked until its
+        reply has arrived, so that the reply cannot be taken by the next
+        request instead.
+        """
+        self.pending += 1
+        try:
+            await self.lock.acquire()
+            reply = None
+            try:
+                self.current_request = request['id']
+                self.connection.send(request)
+                loop = asyncio.get_running_loop()
+                reply = loop.run_in_executor(None, self.connection.recv)
+                return await asyncio.shield(reply)
+            except asyncio.CancelledError:
+                self.stop(request['id'])
+                raise
+            except (EOFError, OSError) as error:
+                raise WorkerStopped('the worker process stopped') from error
+            finally:
+                if reply is None or reply.done():
+                    self.release(reply)
+                else:
+                    reply.add_done_callback(self.release)
+        finally:
+            self.pending -= 1
+
+    def release(self, reply):
+        """ Unlocks the worker once the reply to its last request has arrived. """
+        # Retrieve the result of a reply nobody is waiting for any more
+        if reply is not None and not reply.cancelled():
+            reply.exception()
+        self.current_request = None
+        self.lock.release()
+
+    def stop(self, request_id):
+        """ Stops the search of the given request if it is being carried out. """
+        with self.cancel.get_lock():
+            self.cancel.value = request_id
+
+    def close(self):
+        try:
+            self.connection.send(None)
+        except OSError:
+            pass
+        self.process.join(5)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+class EngineServer:
+    """
+    Accepts connections and dispatches their requests to a bounded pool of
+    worker processes.
+    Searches are limited to max_time seconds, however long they ask for.
+    """
+    def __init__(self, workers=2, max_time=60):
+        self.num_workers = workers
+        self.max_time = max_time
+        self.workers = []
+        # The worker each game is pinned to, and the id of each game's search
+        self.game_workers = {}
+        self.game_searches = {}
+        self.next_request_id = 1
+        self.server = None
+
+    async def start(self, host='127.0.0.1', port=8765, unix_path=None):
+        """ Starts the workers and begins accepting connections. """
+        # Load the shared resources before forking, so every worker inherits them
+        resources.preload()
+        self.workers = [Worker() for _ in range(self.num_workers)]
+        if unix_path is not None:
+            self.server = await asyncio.start_unix_server(self.handle_client, unix_path)
+        else:
+            self.server = await asyncio.start_server(self.handle_client, host, port)
+        return self.server
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        for worker in self.workers:
+            worker.close()
+
+    async def handle_client(self, reader, writer):
+        """ Handles every request of a connection, each in its own task. """
+        write_lock = asyncio.Lock()
+        tasks = set()
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            task = asyncio.create_task(self.respond(line, writer, write_lock))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        for task in list(tasks):
+            task.cancel()
+        writer.close()
+
+    async def respond(self, line, writer, write_lock):
+        """ Carries out a single request and writes its reply. """
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError('a request must be a json object')
+            request_id = request.get('id')
+            reply = await self.dispatch(request)
+        except (KeyError, ValueError, WorkerStopped) as error:
+            reply = {'error': str(error)}
+        reply['id'] = request_id
+        async with write_lock:
+            writer.write((json.dumps(reply) + '\n').encode())
+            await writer.drain()
+
+    async def send(self, worker, request):
+        """
+        Sends a request to a worker and returns its reply, replacing the
+        worker if its process has stopped.
+        """
+        try:
+            return await worker.send(request)
+        except WorkerStopped:
+            self.replace_worker(worker)
+            raise WorkerStopped('the worker process stopped, and its games were lost')
+
+    def replace_worker(self, worker):
+        """ Starts a new worker in place of one whose process has stopped. """
+        if worker not in self.workers:
+            return
+        self.workers[self.workers.index(worker)] = Worker()
+        for game in worker.games:
+            self.game_workers.pop(game, None)
+            self.game_searches.pop(game, None)
+        worker.connection.close()
+        if worker.process.is_alive():
+            worker.process.terminate()
+
+    async def dispatch(self, request):
+        """ Sends a request to the right worker and returns its reply. """
+        check_request(request)
+        op = request['op']
+        # Requests are numbered by the server, since clients' ids may clash
+        worker_request = dict(request, id=self.next_request_id)
+        self.next_request_id += 1
+        if worker_request.get('time') is not None or op in ('go', 'analyse'):
+            worker_request['time'] = min(request.get('time') or self.max_time, self.max_time)
+
+        if op == 'stop':
+            game = request['game']
+            worker = self.game_workers.get(game)
+            search_id = self.game_searches.get(game)
+            if worker is None or search_id is None:
+                return {'stopped': False}
+            worker.stop(search_id)
+            return {'stopped': True}
+
+        if op == 'analyse':
+            worker = min(self.workers, key=lambda worker: worker.pending)
+            return await self.send(worker, worker_request)
+
+        game = request['game']
+        if op == 'new_game':
+            if game in self.game_workers:
+                raise ValueError('game ' + str(game) + ' already exists')
+            worker = min(self.workers, key=lambda worker: len(worker.games))
+            worker.games.add(game)
+            self.game_workers[game] = worker
+        worker = self.game_workers.get(game)
+        if worker is None:
+            raise ValueError('unknown game ' + str(game))
+
+        if op == 'go':
+            self.game_searches[game] = worker_request['id']
+        try:
+            reply = await self.send(worker, worker_request)
+        finally:
+            if op == 'go':
+                self.game_searches.pop(game, None)
+        if op == 'close_game' or (op == 'new_game' and 'error' in reply):
+            worker.games.discard(game)
+            del self.game_workers[game]
+        return reply
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', type=int, default=8765, help='TCP port to listen on')
+    parser.add_argument('--unix', help='Unix socket to listen on instead of TCP')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(),
+                        help='number of worker processes')
+    parser.add_argument('--max-time', type=float, default=60,
+                        help='most seconds a single search may take')
+    arguments = parser.parse_args(arguments)
+
+    async def serve():
+        engine_server = EngineServer(arguments.workers, arguments.max_time)
+        server = await engine_server.start(arguments.host, arguments.port, arguments.unix)
+        try:
+            await server.serve_forever()
+        finally:
+            await engine_server.close()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,9 +1,34 @@
 import chess
+import chess.pgn
 from game import *
 from engine import *
 import unittest
 import time
 import random
+import io
+import json
+import os
+import tempfile
+import asyncio
+import multiprocessing
+from transposition_table import TranspositionTable
+from move_ordering import MoveOrderer, static_exchange_evaluation
+from search_board import SearchBoard, encode_move, decode_move
+import bitbases
+import parallel_search
+import bitboard_evaluation
+from pawn_structure import (PawnHashTable, evaluate_pawn_structure, DOUBLED_PAWN_PENALTY,
+                            ISOLATED_PAWN_PENALTY, PASSED_PAWN_BONUSES)
+from search_stats import SearchStats, JsonLinesTracer
+from time_manager import TimeManager
+import resources
+from benchmark import PERFT_POSITIONS, perft, compare
+from analysis import run_analysis
+from analysis_cache import AnalysisCache
+from server import DEFAULT_DEPTH, EngineServer
+from tournament import (choose_openings, elo_difference, expected_score,
+                        parse_settings, sprt_bounds, sprt_llr)
+from opening_book import OpeningBook, PolyglotBook, write_polyglot_book
 
 
 class EngineTest(unittest.TestCase):
@@ -29,6 +54,1049 @@ class EngineTest(unittest.TestCase):
         self.assertEqual(engine.invert_index(63), 0)
         self.assertEqual(engine.invert_index(25), 38)
 
+    def test_evaluate_drawn_and_won_positions(self):
+        board = chess.Board()
+        engine = Engine(board, chess.WHITE)
+        for move_string in ['g1f3', 'g8f6', 'f3g1', 'f6g8'] * 2:
+            board.push_uci(move_string)
+        self.assertEqual(engine.evaluate_board(board), 0)
+
+        board = chess.Board('7k/6Q1/6K1/8/8/8/8/8 b - - 0 1')
+        self.assertEqual(engine.evaluate_board(board), 999)
+
+    def test_search_finds_mate_and_stalemate(self):
+        # Qg7 is mate, while Qg6 would be stalemate
+        board = chess.Board('7k/8/5K2/8/8/8/8/6Q1 w - - 0 1')
+        engine = Engine(board, chess.WHITE, verbose=False)
+        search_board = engine.create_search_board()
+        search_board.push_uci('g1g7')
+        self.assertEqual(engine.alpha_beta_minimax(1, False, board=search_board), 999)
+        search_board.pop()
+        search_board.push_uci('g1g6')
+        self.assertEqual(engine.alpha_beta_minimax(1, False, board=search_board), 0)
+
+    def test_stalemate_at_search_horizon(self):
+        # Black to move has no legal moves, however much white is ahead
+        board = chess.Board('7k/5Q2/6K1/8/8/8/P7/8 b - - 0 1')
+        engine = Engine(board, chess.WHITE, verbose=False)
+        search_board = engine.create_search_board()
+        self.assertFalse(search_board.has_legal_move())
+        self.assertEqual(engine.alpha_beta_minimax(0, False, board=search_board), 0)
+        self.assertEqual(engine.quiescence(False, -1000, 1000, search_board, 1), 0)
+
+
+class ResourcesTest(unittest.TestCase):
+    def test_engines_share_resources(self):
+        first = Engine(chess.Board(), chess.WHITE, tt_size_mb=1)
+        second = Engine(chess.Board(), chess.BLACK, tt_size_mb=1)
+        self.assertIs(first.square_values, second.square_values)
+        self.assertIs(first.opening_book, second.opening_book)
+        self.assertIs(first.bitboard_evaluator, second.bitboard_evaluator)
+
+    def test_book_found_from_any_directory(self):
+        working_directory = os.getcwd()
+        with tempfile.TemporaryDirectory() as directory:
+            os.chdir(directory)
+            try:
+                self.assertTrue(os.path.exists(resources.JSON_BOOK_PATH))
+                self.assertTrue(resources.opening_book().find_openings(chess.Board()))
+            finally:
+                os.chdir(working_directory)
+
+    def test_piece_squares_reversed(self):
+        piece_squares = resources.piece_squares()
+        self.assertEqual(piece_squares[chess.KNIGHT][chess.E4],
+                         resources.PIECE_SQUARE_MATRICES[chess.KNIGHT][63 - chess.E4])
+
+
+class TranspositionTableTest(unittest.TestCase):
+    def test_store_and_probe(self):
+        table = TranspositionTable(1)
+        move = chess.Move.from_uci('e2e4')
+        table.store(12345, 1.5, 0.3, TranspositionTable.EXACT, move)
+        entry = table.probe(12345)
+        self.assertEqual(entry.depth, 1.5)
+        self.assertEqual(entry.score, 0.3)
+        self.assertEqual(entry.bound, TranspositionTable.EXACT)
+        self.assertEqual(entry.move, move)
+        self.assertIsNone(table.probe(54321))
+
+    def test_depth_preferred_replacement(self):
+        table = TranspositionTable(1)
+        key = 7
+        colliding_key = key + table.num_buckets
+        table.store(key, 2, 1.0, TranspositionTable.EXACT, None)
+        table.store(colliding_key, 1, 0.5, TranspositionTable.EXACT, None)
+        # The shallower result goes to the always-replace slot, so both remain
+        self.assertEqual(table.probe(key).depth, 2)
+        self.assertEqual(table.probe(colliding_key).depth, 1)
+
+        # Once a new search starts, the old deep entry can be replaced
+        table.new_search()
+        table.store(colliding_key, 0.5, 0.5, TranspositionTable.EXACT, None)
+        self.assertIsNone(table.probe(key))
+
+    def test_search_value_unchanged_by_table(self):
+        board = chess.Board('r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3')
+        engine = Engine(board, chess.WHITE)
+        _, value, _, _, _ = engine.alpha_beta_minimax_from_root(1)
+        # Searching again with the table filled in must give the same value
+        _, repeated_value, _, _, _ = engine.alpha_beta_minimax_from_root(1)
+        self.assertEqual(value, repeated_value)
+
+
+class IterativeDeepeningTest(unittest.TestCase):
+    def test_completes_every_depth(self):
+        board = chess.Board('r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3')
+        engine = Engine(board, chess.WHITE)
+        best_move, _, depth_reached, _, _ = engine.iterative_deepening(1, 60)
+        self.assertEqual(depth_reached, 1)
+        self.assertEqual([iteration[0] for iteration in engine.iterations], [.5, 1])
+        self.assertEqual(engine.principal_variation[0], best_move)
+        # The search must leave the game board as it found it
+        self.assertEqual(len(board.move_stack), 0)
+
+    def test_returns_move_when_out_of_time(self):
+        board = chess.Board()
+        engine = Engine(board, chess.WHITE)
+        best_move, _, depth_reached, _, _ = engine.iterative_deepening(3, 0)
+        self.assertIn(best_move, board.legal_moves)
+        self.assertEqual(depth_reached, .5)
+
+    def test_finds_capture_of_hanging_queen(self):
+        board = chess.Board('rnb1kbnr/pppp1ppp/8/4p3/4P2q/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3')
+        engine = Engine(board, chess.WHITE)
+        best_move, _, _, _, _ = engine.iterative_deepening(1, 60)
+        self.assertEqual(best_move, chess.Move.from_uci('f3h4'))
+
+    def test_principal_variation_starts_with_collected_line(self):
+        board = chess.Board('r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1')
+        engine = Engine(board, chess.WHITE, seed=0)
+        best_move, _, _, _, _ = engine.iterative_deepening(1.5, 60)
+        collected = engine.principal_variation_table.line(0)
+        self.assertEqual(collected[0], best_move)
+        self.assertEqual(engine.principal_variation[:len(collected)], collected)
+        pv_board = board.copy()
+        for move in engine.principal_variation:
+            self.assertTrue(pv_board.is_legal(move))
+            pv_board.push(move)
+
+
+class TimeManagerTest(unittest.TestCase):
+    def test_allocation(self):
+        time_manager = TimeManager(remaining=60, increment=1)
+        self.assertAlmostEqual(time_manager.soft_limit, 60 / 30 + .75 - TimeManager.OVERHEAD)
+        self.assertGreater(time_manager.hard_limit, time_manager.soft_limit)
+        self.assertLessEqual(time_manager.hard_limit, 60 * TimeManager.MAX_REMAINING_FRACTION)
+        self.assertEqual(TimeManager(move_time=3).hard_limit, 3)
+        self.assertIsNone(TimeManager().hard_limit)
+
+    def test_stable_best_move_shrinks_soft_limit(self):
+        time_manager = TimeManager(move_time=10)
+        time_manager.start()
+        move = chess.Move.from_uci('e2e4')
+        time_manager.record_iteration(move)
+        unstable_limit = time_manager.scaled_soft_limit()
+        for _ in range(4):
+            time_manager.record_iteration(move)
+        self.assertLess(time_manager.scaled_soft_limit(), unstable_limit)
+
+    def test_search_stops_at_hard_limit(self):
+        board = chess.Board('r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1')
+        engine = Engine(board, chess.WHITE, verbose=False)
+        time_manager = TimeManager(move_time=.3)
+        # Start every iteration, so that only the hard limit can stop it
+        time_manager.can_start_iteration = lambda: True
+        best_move, _, _, duration, _ = engine.iterative_deepening(
+            10, time_manager=time_manager
+        )
+        self.assertIn(best_move, board.legal_moves)
+        self.assertLess(duration, 1)
+
+
+class MoveOrdererTest(unittest.TestCase):
+    def test_order(self):
+        board = chess.Board('4k3/8/3p4/2q1r3/3P4/2N5/8/3K4 w - - 0 1')
+        orderer = MoveOrderer()
+        hash_move = chess.Move.from_uci('d1c2')
+        killer = chess.Move.from_uci('d1d2')
+        orderer.killers[2][0] = killer
+        moves = orderer.order_moves(board, list(board.legal_moves), 2, hash_move)
+        self.assertEqual(moves[0], hash_move)
+        # The queen is the most valuable victim, and the pawn the least
+        # valuable attacker
+        self.assertEqual(moves[1], chess.Move.from_uci('d4c5'))
+        self.assertEqual(moves[2], chess.Move.from_uci('d4e5'))
+        self.assertEqual(moves[3], killer)
+
+    def test_staged_moves_match_order(self):
+        orderer = MoveOrderer()
+        rng = random.Random(0)
+        for color_history in orderer.history:
+            for index in range(4096):
+                color_history[index] = rng.randrange(100)
+        orderer.killers[2] = [chess.Move.from_uci('e1d1'), chess.Move.from_uci('a2a3')]
+        for fen in ['4k3/8/3p4/2q1r3/3P4/2N5/8/3K4 w - - 0 1',
+                    'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+                    'r3k2r/8/8/2pP4/8/8/1p4P1/R3K2R w KQkq c6 0 1',
+                    # In check
+                    '4k3/8/8/8/8/8/3q4/4K3 w - - 0 1']:
+            board = chess.Board(fen)
+            legal_moves = list(board.legal_moves)
+            # Includes a hash move which is not legal in the position
+            for hash_move in [None, legal_moves[-1], chess.Move.from_uci('h8h1')]:
+                self.assertEqual(
+                    list(orderer.staged_moves(board, 2, hash_move)),
+                    orderer.order_moves(board, legal_moves, 2, hash_move),
+                )
+
+    def test_record_cutoff(self):
+        board = chess.Board()
+        orderer = MoveOrderer()
+        move = chess.Move.from_uci('g1f3')
+        orderer.record_cutoff(board, move, 3, 1.5, 0)
+        orderer.record_cutoff(board, chess.Move.from_uci('b1c3'), 3, 1.5, 4)
+        self.assertEqual(orderer.killers[3], [chess.Move.from_uci('b1c3'), move])
+        self.assertEqual(orderer.history[chess.WHITE][move.from_square * 64 + move.to_square], 9)
+        self.assertEqual(orderer.first_move_cutoff_rate(), .5)
+
+
+class SearchBoardTest(unittest.TestCase):
+    def assert_score_matches(self, engine, search_board):
+        piece_map = search_board.piece_map()
+        expected = (engine.piece_values(chess.WHITE, piece_map)
+                    - engine.piece_values(chess.BLACK, piece_map))
+        self.assertAlmostEqual(search_board.score / 100, expected)
+
+    def test_score_matches_piece_values(self):
+        engine = Engine(chess.Board(), chess.WHITE)
+        rng = random.Random(0)
+        fens = [
+            chess.STARTING_FEN,
+            # Castling on both sides, en passant and promotions are available
+            'r3k2r/pPppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+            'r3k2r/8/8/2pP4/8/8/1p4P1/R3K2R w KQkq c6 0 1',
+        ]
+        for fen in fens:
+            board = SearchBoard(fen, square_values=engine.square_values)
+            for _ in range(60):
+                moves = list(board.legal_moves)
+                if not moves:
+                    break
+                board.push(rng.choice(moves))
+                self.assert_score_matches(engine, board)
+            while board.move_stack:
+                board.pop()
+                self.assert_score_matches(engine, board)
+
+    def test_key_matches_zobrist_hash(self):
+        engine = Engine(chess.Board(), chess.WHITE)
+        rng = random.Random(0)
+        for fen in ['r3k2r/pPppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+                    'r3k2r/8/8/2pP4/8/8/1p4P1/R3K2R w KQkq c6 0 1']:
+            board = SearchBoard(fen, square_values=engine.square_values)
+            for _ in range(60):
+                moves = list(board.legal_moves)
+                if not moves:
+                    break
+                board.push(rng.choice(moves))
+                self.assertEqual(board.key, chess.polyglot.zobrist_hash(board))
+            while board.move_stack:
+                board.pop()
+                self.assertEqual(board.key, chess.polyglot.zobrist_hash(board))
+
+    def test_move_codes(self):
+        for fen in [chess.STARTING_FEN,
+                    'r3k2r/pPppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1']:
+            for move in chess.Board(fen).legal_moves:
+                code = encode_move(move)
+                self.assertLess(code, 1 << 15)
+                self.assertEqual(decode_move(code), move)
+                # Decoding the same code again gives back the same object
+                self.assertIs(decode_move(code), decode_move(code))
+
+    def test_has_legal_move(self):
+        engine = Engine(chess.Board(), chess.WHITE)
+        rng = random.Random(0)
+        for fen in ['r3k2r/pPppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+                    '7k/5Q2/6K1/8/8/8/P7/8 b - - 0 1',
+                    '8/8/8/8/8/5k2/3q4/7K w - - 0 1']:
+            board = SearchBoard(fen, square_values=engine.square_values)
+            for _ in range(40):
+                moves = list(board.legal_moves)
+                self.assertEqual(board.has_legal_move(), bool(moves))
+                if not moves:
+                    break
+                board.push(rng.choice(moves))
+
+    def test_repetition(self):
+        engine = Engine(chess.Board(), chess.WHITE)
+        board = SearchBoard(square_values=engine.square_values)
+        for move_string in ['g1f3', 'g8f6', 'f3g1', 'f6g8']:
+            board.push_uci(move_string)
+        # Repeated once, which is only a draw if it happened within the search
+        self.assertTrue(board.is_repeated(4))
+        self.assertFalse(board.is_repeated(3))
+        for move_string in ['g1f3', 'g8f6', 'f3g1', 'f6g8']:
+            board.push_uci(move_string)
+        self.assertTrue(board.is_repeated(1))
+
+    def test_evaluation_matches(self):
+        board = chess.Board('r3k2r/pPppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1')
+        board.push_uci('b7a8q')
+        for color in chess.COLORS:
+            engine = Engine(board, color)
+            search_board = engine.create_search_board()
+            self.assertAlmostEqual(engine.evaluate_board(search_board),
+                                   engine.evaluate_board(board))
+            self.assertEqual(search_board.copy().score, search_board.score)
+
+
+class OpeningBookTest(unittest.TestCase):
+    OPENINGS = [
+        {'n': 'Short', 'm': ['d2d4', 'g8f6', 'c2c4']},
+        {'n': 'Long', 'm': ['d2d4', 'g8f6', 'c2c4', 'e7e6', 'g1f3']},
+        {'n': 'Other', 'm': ['c2c4', 'e7e6']},
+    ]
+
+    def test_follows_shortest_opening(self):
+        book = OpeningBook(self.OPENINGS)
+        board = chess.Board()
+        board.push_uci('d2d4')
+        self.assertEqual(book.find_openings(board), [(self.OPENINGS[0], 'g8f6')])
+        board.push_uci('g8f6')
+        board.push_uci('c2c4')
+        self.assertEqual(book.find_openings(board), [(self.OPENINGS[1], 'e7e6')])
+        # The board must not be changed by looking it up
+        self.assertEqual(len(board.move_stack), 3)
+
+    def test_finds_transpositions(self):
+        book = OpeningBook(self.OPENINGS)
+        board = chess.Board()
+        for move_string in ['c2c4', 'g8f6', 'd2d4', 'e7e6']:
+            board.push_uci(move_string)
+        self.assertEqual(book.find_openings(board), [(self.OPENINGS[1], 'g1f3')])
+
+    def test_polyglot_book(self):
+        openings = self.OPENINGS + [{'n': 'Castling', 'm': ['e2e4', 'e7e5', 'g1f3', 'b8c6', 'f1c4', 'g8f6', 'e1g1']}]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'book.bin')
+            write_polyglot_book(openings, path)
+            book = PolyglotBook(path)
+            try:
+                board = chess.Board()
+                moves = sorted(move for _, move in book.find_openings(board))
+                self.assertEqual(moves, ['c2c4', 'd2d4', 'e2e4'])
+
+                # Transpositions are found since moves are stored by position
+                for move_string in ['c2c4', 'g8f6', 'd2d4', 'e7e6']:
+                    board.push_uci(move_string)
+                self.assertEqual(book.choose_move(board), (None, 'g1f3'))
+
+                board = chess.Board()
+                for move_string in openings[-1]['m'][:-1]:
+                    board.push_uci(move_string)
+                self.assertEqual(book.choose_move(board), (None, 'e1g1'))
+            finally:
+                book.close()
+
+    def test_out_of_book(self):
+        book = OpeningBook(self.OPENINGS)
+        board = chess.Board()
+        board.push_uci('e2e4')
+        self.assertFalse(book.choose_move(board))
+
+
+class TournamentTest(unittest.TestCase):
+    def test_elo_difference(self):
+        elo, margin = elo_difference(60, 20, 20)
+        self.assertAlmostEqual(expected_score(elo), .7)
+        self.assertGreater(margin, 0)
+        self.assertEqual(elo_difference(5, 0, 0), (None, None))
+
+    def test_sprt(self):
+        lower_bound, upper_bound = sprt_bounds(.05, .05)
+        self.assertAlmostEqual(lower_bound, -upper_bound)
+        self.assertGreater(sprt_llr(600, 300, 100, 0, 5), upper_bound)
+        self.assertLess(sprt_llr(100, 300, 600, 0, 5), lower_bound)
+        self.assertEqual(sprt_llr(0, 10, 0, 0, 5), 0)
+
+    def test_choose_openings(self):
+        openings = [{'m': ['e2e4', 'e7e5', 'g1f3']}, {'m': ['e2e4', 'e7e5', 'f1c4']},
+                    {'m': ['d2d4']}]
+        chosen = choose_openings(openings, 5, 2, random.Random(0))
+        self.assertEqual(sorted(chosen), [['d2d4'], ['e2e4', 'e7e5']])
+
+    def test_parse_settings(self):
+        self.assertEqual(parse_settings(['use_null_move=false', 'search_depth=1.5']),
+                         {'use_null_move': False, 'search_depth': 1.5})
+
+    def test_game_runner_without_input(self):
+        # White mates at once, so the game ends after a single move
+        board = chess.Board('7k/8/5K2/8/8/8/8/6Q1 w - - 0 1')
+        white = Engine(board, chess.WHITE, verbose=False)
+        white.is_opening = False
+        white.is_middle_game = True
+        white.search_depth = 1
+        black = Engine(board, chess.BLACK, verbose=False)
+        runner = GameRunner(board, white, black, verbose=False)
+        self.assertEqual(runner.run_game(), '1-0')
+
+
+class PonderTest(unittest.TestCase):
+    def start_pondering(self):
+        board = chess.Board('r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3')
+        engine = Engine(board, chess.WHITE, seed=1, verbose=False, ponder=True)
+        engine.is_opening = False
+        engine.is_middle_game = True
+        engine.search_depth = 1
+        engine.make_move()
+        engine.start_pondering()
+        return board, engine
+
+    def test_ponder_hit_keeps_search(self):
+        board, engine = self.start_pondering()
+        expected_reply = engine.ponder_move
+        self.assertIsNotNone(engine.ponder_thread)
+        # Pondering is not limited to the engine's search depth
+        time.sleep(.2)
+        self.assertTrue(engine.ponder_thread.is_alive())
+        board.push(expected_reply)
+        engine.stop_pondering(expected_reply)
+        self.assertIsNotNone(engine.ponder_thread)
+        self.assertIn(engine.generate_move(), board.legal_moves)
+        self.assertIsNone(engine.ponder_thread)
+
+    def test_ponder_hit_is_not_slower(self):
+        board, engine = self.start_pondering()
+        expected_reply = engine.ponder_move
+        board.push(expected_reply)
+        engine.stop_pondering(expected_reply)
+        start_time = time.time()
+        engine.generate_move()
+        ponder_duration = time.time() - start_time
+
+        # The same move searched without pondering
+        normal_engine = Engine(board, chess.WHITE, seed=1, verbose=False)
+        normal_engine.is_opening = False
+        normal_engine.is_middle_game = True
+        normal_engine.search_depth = 1
+        start_time = time.time()
+        normal_engine.generate_move()
+        normal_duration = time.time() - start_time
+        self.assertLessEqual(ponder_duration, normal_duration + engine.PONDER_POLL_INTERVAL * 5)
+
+    def test_ponder_miss_discards_search(self):
+        board, engine = self.start_pondering()
+        other_move = next(move for move in board.legal_moves
+                          if move != engine.ponder_move)
+        board.push(other_move)
+        engine.stop_pondering(other_move)
+        self.assertIsNone(engine.ponder_thread)
+        self.assertIsNone(engine.ponder_result)
+        self.assertFalse(engine.abort_search)
+        self.assertIn(engine.generate_move(), board.legal_moves)
+
+
+class AnalysisTest(unittest.TestCase):
+    PGN = ('[Event "mate"]\n\n1. e4 e5 2. Qh5 Nc6 3. Bc4 Nf6 4. Qxf7# 1-0\n\n'
+           '[Event "short"]\n\n1. d4 d5 *\n\n')
+
+    def test_annotates_games_in_order(self):
+        output_file = io.StringIO()
+        games, positions = run_analysis(io.StringIO(self.PGN * 3), output_file, workers=2,
+                                        depth=1, window=2, verbose=False)
+        self.assertEqual((games, positions), (6, 30))
+        output_file.seek(0)
+        events = []
+        while True:
+            game = chess.pgn.read_game(output_file)
+            if game is None:
+                break
+            events.append(game.headers['Event'])
+            self.assertIn('[%eval', game.next().comment)
+        self.assertEqual(events, ['mate', 'short'] * 3)
+
+    def test_json_lines(self):
+        output_file = io.StringIO()
+        run_analysis(io.StringIO(self.PGN), output_file, depth=1,
+                     output_format='json', verbose=False)
+        lines = [json.loads(line) for line in output_file.getvalue().splitlines()]
+        self.assertEqual([(line['game'], line['ply']) for line in lines],
+                         [(0, ply) for ply in range(7)] + [(1, ply) for ply in range(3)])
+        # White mates at once from the last position before the end of the game
+        self.assertEqual((lines[6]['best'], lines[6]['value']), ('h5f7', 999))
+
+
+class AnalysisCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'cache.sqlite')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_keeps_deepest_result(self):
+        cache = AnalysisCache(self.path)
+        board = chess.Board()
+        cache.store(board, chess.Move.from_uci('e2e4'), .3, 2)
+        cache.store(board, chess.Move.from_uci('d2d4'), .1, 1)
+        self.assertEqual(cache.probe(board), (chess.Move.from_uci('e2e4'), .3, 2))
+        cache.store(board, chess.Move.from_uci('g1f3'), .2, 3)
+        cache.close()
+        # Stored results are kept on disk for the next process
+        cache = AnalysisCache(self.path)
+        self.assertEqual(cache.probe(board), (chess.Move.from_uci('g1f3'), .2, 3))
+        self.assertIsNone(cache.probe(chess.Board('4k3/8/8/8/8/8/8/4K3 w - - 0 1')))
+        self.assertEqual(cache.hit_rate(), .5)
+        cache.close()
+
+    def test_skips_shallow_and_history_dependent_results(self):
+        cache = AnalysisCache(self.path)
+        board = chess.Board()
+        cache.store(board, chess.Move.from_uci('e2e4'), .3, 1)
+        # Too shallow a result is neither a hit nor used
+        self.assertIsNone(cache.probe(board, 2))
+        self.assertEqual(cache.hit_rate(), 0)
+        self.assertIsNotNone(cache.probe(board, 1))
+
+        # Once the position has come back, repetitions could change its value
+        for move_string in ['g1f3', 'g8f6', 'f3g1', 'f6g8']:
+            board.push_uci(move_string)
+        self.assertIsNone(cache.probe(board))
+        cache.store(board, chess.Move.from_uci('d2d4'), 0, 3)
+        self.assertEqual(cache.probe(chess.Board()), (chess.Move.from_uci('e2e4'), .3, 1))
+        cache.close()
+
+    def test_evicts_least_recently_used(self):
+        cache = AnalysisCache(self.path, max_entries=2)
+        boards = [chess.Board(fen) for fen in (
+            chess.STARTING_FEN,
+            'rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1',
+            'rnbqkbnr/pppp1ppp/8/4p3/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2',
+        )]
+        for board in boards:
+            cache.store(board, next(iter(board.legal_moves)), 0, 1)
+            time.sleep(.01)
+        cache.probe(boards[0])
+        cache.evict()
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.probe(boards[1]))
+        self.assertIsNotNone(cache.probe(boards[0]))
+        cache.close()
+
+    def test_engine_reuses_results(self):
+        board = chess.Board('r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3')
+        cache = AnalysisCache(self.path)
+        engine = Engine(board, chess.WHITE, seed=0, verbose=False, analysis_cache=cache)
+        move, value, depth, _, stats = engine.cached_search(1.5)
+        self.assertGreater(stats.nodes, 0)
+        # An engine of the other color gets the same result from its side
+        other = Engine(board, chess.BLACK, seed=0, verbose=False, analysis_cache=cache)
+        cached = other.cached_search(1.5)
+        self.assertEqual(cached[:3], (move, -value, depth))
+        self.assertEqual(cached[4].nodes, 0)
+        cache.close()
+
+    def test_shared_by_worker_processes(self):
+        pgn = AnalysisTest.PGN * 2
+        run_analysis(io.StringIO(pgn), io.StringIO(), workers=2, depth=1,
+                     verbose=False, cache_path=self.path)
+        output_file = io.StringIO()
+        run_analysis(io.StringIO(pgn), output_file, workers=2, depth=1,
+                     output_format='json', verbose=False, cache_path=self.path)
+        lines = [json.loads(line) for line in output_file.getvalue().splitlines()]
+        self.assertEqual(sum(line['nodes'] for line in lines), 0)
+
+
+class ServerTest(unittest.TestCase):
+    async def exchange(self, requests):
+        engine_server = EngineServer(workers=2, max_time=5)
+        server = await engine_server.start(port=0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            replies = {}
+            for request in requests:
+                writer.write((json.dumps(request) + '\n').encode())
+                await writer.drain()
+                if request.get('wait', True):
+                    reply = json.loads(await reader.readline())
+                    replies[reply['id']] = reply
+            while len(replies) < len(requests):
+                reply = json.loads(await reader.readline())
+                replies[reply['id']] = reply
+            writer.close()
+            await writer.wait_closed()
+            return replies
+        finally:
+            await engine_server.close()
+
+    def test_games_keep_their_state(self):
+        fen = 'r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3'
+        replies = asyncio.run(self.exchange([
+            {'id': 1, 'op': 'new_game', 'game': 'a', 'fen': fen},
+            {'id': 2, 'op': 'go', 'game': 'a', 'depth': 1},
+            {'id': 3, 'op': 'go', 'game': 'a', 'depth': 1},
+            {'id': 4, 'op': 'analyse', 'fen': '7k/8/5K2/8/8/8/8/6Q1 w - - 0 1', 'depth': 1},
+            {'id': 5, 'op': 'go', 'game': 'b'},
+        ]))
+        board = chess.Board(fen)
+        board.push_uci(replies[2]['move'])
+        self.assertEqual(replies[2]['fen'], board.fen())
+        self.assertIn('error', replies[3])
+        self.assertEqual(replies[4]['move'], 'g1g7')
+        self.assertIn('error', replies[5])
+
+    def test_malformed_requests_keep_worker(self):
+        replies = asyncio.run(self.exchange([
+            {'id': 1, 'op': 'new_game', 'game': 'a'},
+            {'id': 2, 'op': 'play', 'game': 'a', 'moves': 5},
+            {'id': 3, 'op': 'go', 'game': 'a', 'depth': '2'},
+            {'id': 4, 'op': 'play', 'game': ['x'], 'moves': []},
+            {'id': 5, 'op': 'play', 'game': 'a', 'moves': ['e2e4']},
+        ]))
+        for request_id in (2, 3, 4):
+            self.assertIn('error', replies[request_id])
+        self.assertNotIn('error', replies[5])
+
+    def test_replies_after_worker_stops(self):
+        async def exchange():
+            engine_server = EngineServer(workers=1, max_time=5)
+            server = await engine_server.start(port=0)
+            port = server.sockets[0].getsockname()[1]
+            try:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                replies = []
+                for request in ([], {'id': 1, 'op': 'new_game', 'game': 'a'}, None,
+                                {'id': 2, 'op': 'play', 'game': 'a', 'moves': ['e2e4']},
+                                {'id': 3, 'op': 'new_game', 'game': 'b'}):
+                    if request is None:
+                        engine_server.workers[0].process.kill()
+                        engine_server.workers[0].process.join()
+                        continue
+                    writer.write((json.dumps(request) + '\n').encode())
+                    await writer.drain()
+                    replies.append(json.loads(await reader.readline()))
+                writer.close()
+                await writer.wait_closed()
+                return replies
+            finally:
+                await engine_server.close()
+
+        not_object, _, lost_game, new_game = asyncio.run(exchange())
+        self.assertIn('error', not_object)
+        self.assertIn('error', lost_game)
+        self.assertNotIn('error', new_game)
+
+    def test_disconnect_during_search(self):
+        async def exchange():
+            engine_server = EngineServer(workers=1, max_time=30)
+            server = await engine_server.start(port=0)
+            port = server.sockets[0].getsockname()[1]
+            try:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                for request in ({'id': 1, 'op': 'new_game', 'game': 'a', 'fen':
+                                 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1'},
+                                {'id': 2, 'op': 'go', 'game': 'a', 'depth': 20, 'time': 30}):
+                    writer.write((json.dumps(request) + '\n').encode())
+                await writer.drain()
+                await reader.readline()
+                await asyncio.sleep(.2)
+                writer.close()
+                await writer.wait_closed()
+
+                # The abandoned search's reply must not be taken for this one
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                writer.write((json.dumps({'id': 3, 'op': 'new_game', 'game': 'b'}) + '\n').encode())
+                await writer.drain()
+                reply = json.loads(await reader.readline())
+                writer.close()
+                await writer.wait_closed()
+                return reply
+            finally:
+                await engine_server.close()
+
+        start_time = time.time()
+        reply = asyncio.run(exchange())
+        self.assertEqual(reply, {'fen': chess.STARTING_FEN, 'id': 3})
+        self.assertLess(time.time() - start_time, 5)
+
+    def test_depth_is_per_request(self):
+        async def exchange():
+            engine_server = EngineServer(workers=1, max_time=5)
+            server = await engine_server.start(port=0)
+            port = server.sockets[0].getsockname()[1]
+            try:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+
+                async def request(message):
+                    writer.write((json.dumps(message) + '\n').encode())
+                    await writer.drain()
+                    return json.loads(await reader.readline())
+
+                await request({'id': 1, 'op': 'new_game', 'game': 'a', 'color': 'white', 'fen':
+                               'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1'})
+                replies = [await request({'id': 2, 'op': 'go', 'game': 'a', 'depth': 1})]
+                board = chess.Board(replies[0]['fen'])
+                reply = next(iter(board.legal_moves)).uci()
+                await request({'id': 3, 'op': 'play', 'game': 'a', 'moves': [reply]})
+                replies.append(await request({'id': 4, 'op': 'go', 'game': 'a', 'depth': 0}))
+                replies.append(await request({'id': 5, 'op': 'go', 'game': 'a'}))
+                writer.close()
+                await writer.wait_closed()
+                return replies
+            finally:
+                await engine_server.close()
+
+        first, zero_depth, default_depth = asyncio.run(exchange())
+        self.assertEqual(first['depth'], 1)
+        self.assertIn('error', zero_depth)
+        self.assertEqual(default_depth['depth'], DEFAULT_DEPTH)
+
+    def test_stop_ends_search(self):
+        start_time = time.time()
+        replies = asyncio.run(self.exchange([
+            {'id': 1, 'op': 'new_game', 'game': 'a', 'color': 'white',
+             'fen': 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R b KQkq - 0 1'},
+            {'id': 2, 'op': 'play', 'game': 'a', 'moves': ['e8g8']},
+            {'id': 3, 'op': 'go', 'game': 'a', 'depth': 20, 'time': 30, 'wait': False},
+            {'id': 4, 'op': 'stop', 'game': 'a', 'wait': False},
+        ]))
+        self.assertTrue(replies[4]['stopped'])
+        self.assertNotIn('book', replies[3])
+        board = chess.Board(replies[2]['fen'])
+        self.assertIn(chess.Move.from_uci(replies[3]['move']), board.legal_moves)
+        self.assertLess(time.time() - start_time, 5)
+
+
+class ParallelSearchTest(unittest.TestCase):
+    def test_matches_single_process_search(self):
+        board = chess.Board('r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3')
+        engine = Engine(board, chess.WHITE, workers=2)
+        try:
+            _, value, _, _, _ = engine.alpha_beta_minimax_with_multiprocessing(1)
+        finally:
+            engine.close()
+        _, expected_value, _, _, _ = Engine(board, chess.WHITE).alpha_beta_minimax_from_root(1)
+        self.assertEqual(value, expected_value)
+
+    def test_root_move_reports_bounds(self):
+        # Run a worker's side of the search in this process
+        alpha = multiprocessing.Value('d', -1000.0)
+        search_id = multiprocessing.Value('i', 1)
+        parallel_search.init_worker(chess.WHITE, 1, alpha, search_id, 0, {})
+        fen = '4k3/8/2p5/3p4/8/8/8/3QK3 w - - 0 1'
+        _, value, exact, _ = parallel_search.search_root_move(
+            (1, fen, [], 'd1d2', 1, {}))
+        self.assertTrue(exact)
+        # A move searched once a better value is known only gets a bound
+        alpha.value = 50.0
+        _, value, exact, _ = parallel_search.search_root_move(
+            (1, fen, [], 'd1d2', 1, {}))
+        self.assertFalse(exact)
+        self.assertLessEqual(value, 50.0)
+        # Tasks of a search which has been stopped are skipped
+        self.assertIsNone(parallel_search.search_root_move((0, fen, [], 'd1d2', 1, {})))
+
+    def test_workers_use_engine_settings(self):
+        # Quiescence search changes the value of this position at depth 1
+        board = chess.Board('4k3/8/2p5/3p4/8/8/8/3QK3 w - - 0 1')
+        engine = Engine(board, chess.WHITE, workers=2, seed=0)
+        engine.use_quiescence = False
+        try:
+            _, value, _, _, _ = engine.alpha_beta_minimax_with_multiprocessing(1)
+        finally:
+            engine.close()
+        expected_engine = Engine(board, chess.WHITE, seed=0)
+        expected_engine.use_quiescence = False
+        _, expected_value, _, _, _ = expected_engine.alpha_beta_minimax_from_root(1)
+        self.assertEqual(value, expected_value)
+
+
+class QuiescenceTest(unittest.TestCase):
+    def test_static_exchange_evaluation(self):
+        cases = [
+            # A pawn defended only by a rook, taken by a rook
+            ('1k1r4/1pp4p/p7/4p3/8/P5P1/1PP4P/2K1R3 w - - 0 1', 'e1e5', 100),
+            # A queen taking a pawn defended by a pawn
+            ('4k3/8/2p5/3p4/8/8/8/3QK3 w - - 0 1', 'd1d5', -800),
+            # Equal trades of pawns, ending with the rook winning a pawn
+            ('4k3/8/2p5/3p4/4P3/8/8/3RK3 w - - 0 1', 'e4d5', 100),
+        ]
+        for fen, move_string, expected in cases:
+            board = chess.Board(fen)
+            move = chess.Move.from_uci(move_string)
+            self.assertEqual(static_exchange_evaluation(board, move), expected)
+
+    def test_sees_recapture_beyond_horizon(self):
+        # Taking the pawn with the queen loses the queen to the recapture
+        board = chess.Board('4k3/8/2p5/3p4/8/8/8/3QK3 w - - 0 1')
+        engine = Engine(board, chess.WHITE)
+        engine.use_quiescence = False
+        best_move, _, _, _, _ = engine.alpha_beta_minimax_from_root(.5)
+        self.assertEqual(best_move, chess.Move.from_uci('d1d5'))
+
+        engine.use_quiescence = True
+        best_move, _, _, _, _ = engine.alpha_beta_minimax_from_root(.5)
+        self.assertNotEqual(best_move, chess.Move.from_uci('d1d5'))
+
+
+class SelectivityTest(unittest.TestCase):
+    def search(self, fen, depth, use_null_move, use_late_move_reductions):
+        board = chess.Board(fen)
+        engine = Engine(board, board.turn, seed=0, verbose=False)
+        engine.use_null_move = use_null_move
+        engine.use_late_move_reductions = use_late_move_reductions
+        return engine.iterative_deepening(depth, float('inf'))
+
+    def test_reductions_search_fewer_nodes(self):
+        fen = 'r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3'
+        _, _, _, _, full_stats = self.search(fen, 2, False, False)
+        _, _, _, _, stats = self.search(fen, 2, True, True)
+        self.assertGreater(stats.reductions, 0)
+        self.assertLess(stats.nodes, full_stats.nodes)
+
+    def test_still_finds_capture_of_hanging_queen(self):
+        fen = 'rnb1kbnr/pppp1ppp/8/4p3/4P2q/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3'
+        best_move, _, _, _, _ = self.search(fen, 1.5, True, True)
+        self.assertEqual(best_move, chess.Move.from_uci('f3h4'))
+
+    def test_no_null_move_without_pieces(self):
+        board = chess.Board('4k3/4p3/8/8/8/8/3P4/4K3 w - - 0 1')
+        engine = Engine(board, chess.WHITE, verbose=False)
+        self.assertFalse(engine.can_try_null_move(board, 2, False))
+        board = chess.Board('4k3/4p3/8/8/8/8/3P4/R3K3 w - - 0 1')
+        self.assertTrue(engine.can_try_null_move(board, 2, False))
+        self.assertFalse(engine.can_try_null_move(board, 2, True))
+
+
+class PrincipalVariationSearchTest(unittest.TestCase):
+    FEN = 'r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3'
+
+    def create_engine(self, windows):
+        board = chess.Board(self.FEN)
+        engine = Engine(board, chess.WHITE, seed=0, verbose=False)
+        engine.use_null_move = False
+        engine.use_late_move_reductions = False
+        engine.use_principal_variation_search = windows
+        engine.use_aspiration_windows = windows
+        return engine
+
+    def test_same_result_as_full_window(self):
+        full_move, full_val, _, _, full_stats = \
+            self.create_engine(False).iterative_deepening(2, float('inf'))
+        best_move, best_val, _, _, stats = \
+            self.create_engine(True).iterative_deepening(2, float('inf'))
+        self.assertEqual(best_move, full_move)
+        self.assertAlmostEqual(best_val, full_val)
+        self.assertLess(stats.nodes, full_stats.nodes)
+
+    def test_aspiration_window_widens_on_fail(self):
+        engine = self.create_engine(True)
+        expected_move, expected_val, _, _, _ = engine.alpha_beta_minimax_from_root(1)
+        engine = self.create_engine(True)
+        best_move, best_val, _, _, stats = engine.aspiration_search(
+            1, None, None, engine.board, expected_val + 5
+        )
+        self.assertGreater(stats.aspiration_fails, 0)
+        self.assertEqual(best_move, expected_move)
+        self.assertAlmostEqual(best_val, expected_val)
+
+
+class PawnStructureTest(unittest.TestCase):
+    def pawn_structure(self, fen):
+        board = chess.Board(fen)
+        return evaluate_pawn_structure(board.pawns & board.occupied_co[chess.WHITE],
+                                       board.pawns & board.occupied_co[chess.BLACK])
+
+    def test_starting_position_is_even(self):
+        self.assertEqual(self.pawn_structure(chess.STARTING_FEN), 0)
+
+    def test_doubled_isolated_and_passed_pawns(self):
+        # White's pawns on the c file are doubled and isolated, and only the
+        # front one is passed, while black's a pawn is isolated and passed
+        self.assertEqual(self.pawn_structure('4k3/8/8/p7/8/2P5/2P5/4K3 w - - 0 1'),
+                         -DOUBLED_PAWN_PENALTY - 2 * ISOLATED_PAWN_PENALTY
+                         + ISOLATED_PAWN_PENALTY - PASSED_PAWN_BONUSES[3]
+                         + PASSED_PAWN_BONUSES[2])
+
+    def test_table_is_bounded(self):
+        table = PawnHashTable(size_mb=.001)
+        for pawns in range(1000):
+            table.store(pawns, 0, pawns)
+        self.assertLessEqual(len(table.entries) + len(table.old_entries),
+                             table.generation_size * 2)
+        self.assertEqual(table.probe(999, 0), 999)
+        self.assertIsNone(table.probe(0, 0))
+        self.assertEqual(table.hit_rate(), .5)
+
+    def test_search_hits_table(self):
+        board = chess.Board('r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1')
+        engine = Engine(board, chess.WHITE, seed=0, verbose=False)
+        stats = engine.iterative_deepening(1.5, float('inf'))[4]
+        self.assertGreater(stats.pawn_probes, 0)
+        self.assertGreater(stats.pawn_hit_rate(), .5)
+
+
+class BitbaseTest(unittest.TestCase):
+    def random_board(self, random_generator, piece_type):
+        while True:
+            board = chess.Board(None)
+            strong = random_generator.choice(chess.COLORS)
+            squares = random_generator.sample(chess.SQUARES, 3)
+            board.set_piece_at(squares[0], chess.Piece(chess.KING, strong))
+            board.set_piece_at(squares[1], chess.Piece(chess.KING, not strong))
+            board.set_piece_at(squares[2], chess.Piece(piece_type, strong))
+            board.turn = random_generator.choice(chess.COLORS)
+            if board.is_valid():
+                return board, strong
+
+    def test_consistent_with_moves(self):
+        # A position is won for the strong side if it is to move and has a
+        # move to a won position, or if the lone king is checkmated or every
+        # one of its moves leads to a won position
+        endgame_bitbases = resources.endgame_bitbases()
+        random_generator = random.Random(0)
+        for piece_type in (chess.QUEEN, chess.ROOK, chess.PAWN):
+            for _ in range(150):
+                board, strong = self.random_board(random_generator, piece_type)
+                sign = 1 if strong == chess.WHITE else -1
+                results = []
+                for move in board.legal_moves:
+                    board.push(move)
+                    result = bitbases.probe(endgame_bitbases, board)
+                    results.append(board.is_checkmate() or result == sign)
+                    board.pop()
+                if board.turn == strong:
+                    expected = any(results)
+                else:
+                    expected = board.is_checkmate() or (bool(results) and all(results))
+                self.assertEqual(bitbases.probe(endgame_bitbases, board) == sign,
+                                 expected, board.fen())
+
+    def test_probe(self):
+        endgame_bitbases = resources.endgame_bitbases()
+        # The king in front of its pawn on the sixth rank wins, while the
+        # defending king in front of the pawn draws
+        self.assertEqual(bitbases.probe(endgame_bitbases,
+                                        chess.Board('4k3/8/4K3/4P3/8/8/8/8 b - - 0 1')), 1)
+        self.assertEqual(bitbases.probe(endgame_bitbases,
+                                        chess.Board('8/8/8/8/4p3/4k3/8/4K3 w - - 0 1')), -1)
+        self.assertEqual(bitbases.probe(endgame_bitbases,
+                                        chess.Board('8/8/8/8/8/4k3/4P3/4K3 w - - 0 1')), 0)
+        # The rook can be taken
+        self.assertEqual(bitbases.probe(endgame_bitbases,
+                                        chess.Board('8/8/8/8/8/8/6kR/K7 b - - 0 1')), 0)
+        self.assertIsNone(bitbases.probe(endgame_bitbases, chess.Board()))
+
+    def test_engine_mates_with_queen(self):
+        board = chess.Board('8/8/8/3k4/8/8/8/3QK3 w - - 0 1')
+        engines = {color: Engine(board, color, seed=0, verbose=False) for color in chess.COLORS}
+        for engine in engines.values():
+            engine.is_opening = False
+            engine.is_middle_game = True
+        value = engines[chess.WHITE].iterative_deepening(1, float('inf'))[1]
+        self.assertGreater(value, Engine.BITBASE_WIN)
+        while not board.is_game_over(claim_draw=True) and len(board.move_stack) < 60:
+            board.push(engines[board.turn].generate_move())
+        self.assertTrue(board.is_checkmate())
+
+
+class BitboardEvaluatorTest(unittest.TestCase):
+    FENS = [
+        chess.STARTING_FEN,
+        'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+        '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+    ]
+
+    def expected_values(self, engine, boards):
+        values = []
+        for board in boards:
+            piece_map = board.piece_map()
+            values.append(engine.piece_values(engine.color, piece_map)
+                          - engine.piece_values(not engine.color, piece_map))
+        return values
+
+    def test_matches_piece_values(self):
+        boards = [chess.Board(fen) for fen in self.FENS]
+        for color in chess.COLORS:
+            engine = Engine(chess.Board(), color)
+            for board, expected in zip(boards, self.expected_values(engine, boards)):
+                self.assertAlmostEqual(engine.evaluate_material(board), expected)
+
+    @unittest.skipIf(bitboard_evaluation.np is None, 'evaluate_many needs NumPy')
+    def test_evaluate_many_matches_piece_values(self):
+        boards = [chess.Board(fen) for fen in self.FENS]
+        for color in chess.COLORS:
+            engine = Engine(chess.Board(), color)
+            many_values = engine.evaluate_many(boards)
+            for many_value, expected in zip(many_values, self.expected_values(engine, boards)):
+                self.assertAlmostEqual(many_value, expected)
+
+
+class BenchmarkTest(unittest.TestCase):
+    def test_perft(self):
+        for _, fen, expected_counts in PERFT_POSITIONS:
+            self.assertEqual(perft(chess.Board(fen), 2), expected_counts[2])
+
+    def test_seeded_search_is_repeatable(self):
+        board = chess.Board('r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3')
+        node_counts = []
+        for _ in range(2):
+            engine = Engine(board, chess.WHITE, seed=1)
+            _, _, _, _, stats = engine.iterative_deepening(1, float('inf'))
+            node_counts.append(stats.nodes)
+        self.assertEqual(node_counts[0], node_counts[1])
+
+    def test_compare(self):
+        baseline = {'search': [{'position': 'a', 'depth': 1, 'nodes': 100,
+                                'nodes_per_second': 1000, 'time': .1}]}
+        results = {'search': [{'position': 'a', 'depth': 1, 'nodes': 105,
+                               'nodes_per_second': 950, 'time': .1}]}
+        self.assertEqual(compare(results, baseline, .1), [])
+        results['search'][0]['nodes'] = 120
+        self.assertEqual(len(compare(results, baseline, .1)), 1)
+
+
+class SearchStatsTest(unittest.TestCase):
+    def test_search_returns_stats(self):
+        board = chess.Board('r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3')
+        events = []
+        engine = Engine(board, chess.WHITE, trace=events.append)
+        best_move, _, _, _, stats = engine.iterative_deepening(1.5, 60)
+
+        self.assertEqual(sorted(stats.depth_times), [.5, 1, 1.5])
+        self.assertEqual(stats.nodes, sum(stats.depth_nodes.values()))
+        self.assertGreater(stats.leaf_evals, 0)
+        self.assertGreater(stats.beta_cutoffs, 0)
+        self.assertGreater(stats.effective_branching_factor(), 1)
+
+        self.assertEqual([event['event'] for event in events],
+                         ['iteration', 'iteration', 'iteration', 'search'])
+        self.assertEqual(events[-1]['move'], best_move.uci())
+        self.assertEqual(events[-1]['nodes'], stats.nodes)
+
+    def test_merge(self):
+        stats = SearchStats()
+        other = SearchStats()
+        other.nodes = 10
+        other.beta_cutoffs = 4
+        other.first_move_cutoffs = 3
+        stats.merge(other)
+        stats.merge(other)
+        self.assertEqual(stats.nodes, 20)
+        self.assertEqual(stats.first_move_cutoff_ratio(), .75)
+
+    def test_json_lines_tracer(self):
+        output = io.StringIO()
+        tracer = JsonLinesTracer(output)
+        tracer({'event': 'iteration', 'depth': 1})
+        tracer({'event': 'search'})
+        lines = output.getvalue().splitlines()
+        self.assertEqual(json.loads(lines[0]), {'event': 'iteration', 'depth': 1})
+        self.assertEqual(len(lines), 2)
+
 
 # class ChessLibraryTest(unittest.TestCase):
 #     def test_board_push_and_pop_speed(self):
@@ -0,0 +1,97 @@
+import time
+
+
+class TimeManager:
+    """
+    Decides how long the engine may think about a move.
+
+    The time is given either as a fixed number of seconds per move, or as the
+    time left on the engine's clock and the increment added after each move,
+    from which a share of the remaining time is allocated to the move.
+
+    Two limits are worked out: the soft limit, after which no new iteration of
+    iterative deepening is started, and the hard limit, at which the search is
+    stopped wherever it is. The soft limit is stretched while the best move
+    keeps changing between iterations and shrunk once it has been stable for
+    a few iterations.
+    """
+    # Nodes searched between checks of the clock
+    CHECK_INTERVAL = 1024
+    # Moves the remaining time is assumed to have to last for
+    MOVES_TO_GO = 30
+    # Seconds kept back for the time taken to make the move
+    OVERHEAD = .05
+    # The hard limit is this many times the soft limit, but never more than
+    # MAX_REMAINING_FRACTION of the remaining time
+    HARD_LIMIT_FACTOR = 4
+    MAX_REMAINING_FRACTION = .4
+    # Soft limit scale by the number of iterations in a row the best move has
+    # stayed the same, the last applying to any longer run
+    STABILITY_SCALES = (1.5, 1.0, .8, .6, .5)
+    # A new iteration takes longer than every earlier one together, so it is
+    # only started if less than this fraction of the soft limit has been used
+    ITERATION_FRACTION = .5
+
+    def __init__(self, move_time=None, remaining=None, increment=0, moves_to_go=None):
+        if move_time is not None:
+            self.soft_limit = self.hard_limit = move_time
+        elif remaining is not None:
+            moves_to_go = moves_to_go or self.MOVES_TO_GO
+            self.soft_limit = remaining / moves_to_go + increment * .75
+            self.hard_limit = min(self.soft_limit * self.HARD_LIMIT_FACTOR,
+                                  remaining * self.MAX_REMAINING_FRACTION)
+            self.soft_limit = max(min(self.soft_limit, self.hard_limit) - self.OVERHEAD, .01)
+            self.hard_limit = max(self.hard_limit - self.OVERHEAD, .01)
+        else:
+            # No limit at all
+            self.soft_limit = self.hard_limit = None
+
+        self.start_time = None
+        self.hard_deadline = None
+        self.countdown = self.CHECK_INTERVAL
+        self.best_move = None
+        self.stability = 0
+
+    def start(self):
+        """ Starts the clock for the move. """
+        self.start_time = time.time()
+        if self.hard_limit is not None:
+            self.hard_deadline = self.start_time + self.hard_limit
+        self.countdown = self.CHECK_INTERVAL
+        self.best_move = None
+        self.stability = 0
+
+    def elapsed(self):
+        """ Returns the seconds since start was called. """
+        return time.time() - self.start_time
+
+    def out_of_time(self):
+        """
+        Must be called at every node of the search. Returns whether the hard
+        limit has passed, although the clock is only read once every
+        CHECK_INTERVAL calls so that this stays cheap.
+        """
+        self.countdown -= 1
+        if self.countdown > 0:
+            return False
+        self.countdown = self.CHECK_INTERVAL
+        return self.hard_deadline is not None and time.time() >= self.hard_deadline
+
+    def record_iteration(self, best_move):
+        """ Records the best move found by a completed iteration. """
+        if best_move == self.best_move:
+            self.stability += 1
+        else:
+            self.stability = 0
+        self.best_move = best_move
+
+    def scaled_soft_limit(self):
+        """ Returns the soft limit scaled by how stable the best move has been. """
+        scale = self.STABILITY_SCALES[min(self.stability, len(self.STABILITY_SCALES) - 1)]
+        return min(self.soft_limit * scale, self.hard_limit)
+
+    def can_start_iteration(self):
+        """ Returns whether there is enough time left to start another iteration. """
+        if self.soft_limit is None:
+            return True
+        return self.elapsed() < self.scaled_soft_limit() * self.ITERATION_FRACTION
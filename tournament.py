@@ -0,0 +1,349 @@
+"""
+Plays engine against engine matches without any user input, so that changes
+to the engine can be tested over thousands of games.
+
+A candidate engine plays a baseline engine, each of which is an Engine with
+some of its settings (such as use_null_move) changed by --candidate and
+--baseline. Every opening is taken from the opening book and played twice,
+with each engine playing white once. Games are played in parallel by a pool of
+worker processes and written to a PGN file as they finish.
+
+After every game the Elo difference of the candidate is estimated, and a
+sequential probability ratio test (SPRT) of whether the candidate is elo1
+rather than elo0 stronger stops the match as soon as the result is clear.
+
+Run with python tournament.py --help for the available options.
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import random
+import sys
+import time
+
+import chess
+import chess.pgn
+
+import resources
+from engine import Engine
+from game import GameRunner
+
+# Games still going after this many half moves are adjudicated as draws
+MAX_PLIES = 400
+
+
+def choose_openings(openings, count, plies, random_generator=random):
+    """
+    Returns count different move sequences, as lists of UCI strings, of the
+    first plies half moves of randomly chosen openings.
+    Fewer are returned if the openings do not have that many different
+    sequences.
+    """
+    sequences = sorted({tuple(opening['m'][:plies]) for opening in openings
+                        if opening.get('m')})
+    random_generator.shuffle(sequences)
+    return [list(sequence) for sequence in sequences[:count]]
+
+
+def create_engine(board, color, settings, depth, time_limit, seed):
+    """
+    Returns an Engine for playing the given color on the board, with each
+    attribute in settings set to its value.
+    The opening has already been played from the book, so it only searches.
+    """
+    engine = Engine(board, color, seed=seed, verbose=False)
+    engine.is_opening = False
+    engine.is_middle_game = True
+    engine.search_depth = depth
+    engine.time_limit = time_limit
+    for name, value in settings.items():
+        setattr(engine, name, value)
+    return engine
+
+
+def play_game(task):
+    """
+    Plays a single game in a worker process.
+    The task is a (game index, opening moves in UCI, whether the candidate
+    plays white, candidate settings, baseline settings, depth, seconds per
+    move, time control, seed) tuple, where the time control is None or a
+    (seconds on each clock, increment) pair.
+    Returns the game index, the candidate's score (1, .5 or 0) and the game as
+    PGN.
+    """
+    (game_index, opening, candidate_is_white, candidate_settings,
+     baseline_settings, depth, time_limit, time_control, seed) = task
+
+    board = chess.Board()
+    for move_string in opening:
+        board.push_uci(move_string)
+
+    candidate_color = chess.WHITE if candidate_is_white else chess.BLACK
+    candidate = create_engine(board, candidate_color, candidate_settings,
+                              depth, time_limit, seed)
+    baseline = create_engine(board, not candidate_color, baseline_settings,
+                             depth, time_limit, seed)
+    if candidate_is_white:
+        white_player, black_player = candidate, baseline
+    else:
+        white_player, black_player = baseline, candidate
+
+    runner = GameRunner(board, white_player, black_player, verbose=False)
+    clocks = None
+    if time_control is not None:
+        clocks = {chess.WHITE: time_control[0], chess.BLACK: time_control[0]}
+    result = None
+    while not board.is_game_over(claim_draw=True) and len(board.move_stack) < MAX_PLIES:
+        color = board.turn
+        if clocks is not None:
+            player = white_player if color == chess.WHITE else black_player
+            player.remaining_time = clocks[color]
+            player.increment = time_control[1]
+        start_time = time.time()
+        runner.run_half_turn()
+        if clocks is not None:
+            clocks[color] -= time.time() - start_time
+            if clocks[color] < 0:
+                result = '0-1' if color == chess.WHITE else '1-0'
+                break
+            clocks[color] += time_control[1]
+    candidate.close()
+    baseline.close()
+
+    lost_on_time = result is not None
+    if result is None:
+        result = board.result(claim_draw=True)
+    if result == '*':
+        result = '1/2-1/2'
+    if result == '1/2-1/2':
+        score = .5
+    elif (result == '1-0') == candidate_is_white:
+        score = 1
+    else:
+        score = 0
+
+    game = chess.pgn.Game.from_board(board)
+    game.headers['Event'] = 'Tournament'
+    game.headers['Round'] = str(game_index + 1)
+    game.headers['White'] = 'candidate' if candidate_is_white else 'baseline'
+    game.headers['Black'] = 'baseline' if candidate_is_white else 'candidate'
+    game.headers['Result'] = result
+    game.headers['Opening'] = ' '.join(opening)
+    if lost_on_time:
+        game.headers['Termination'] = 'time forfeit'
+    elif len(board.move_stack) >= MAX_PLIES and board.outcome(claim_draw=True) is None:
+        game.headers['Termination'] = 'adjudication'
+    if time_control is not None:
+        game.headers['TimeControl'] = '{:g}+{:g}'.format(*time_control)
+    return game_index, score, str(game)
+
+
+class PgnWriter:
+    """ Writes games to a PGN file as soon as each one finishes. """
+    def __init__(self, output_file):
+        self.output_file = output_file
+
+    def write(self, pgn):
+        self.output_file.write(pgn + '\n\n')
+        self.output_file.flush()
+
+
+def expected_score(elo):
+    """ Returns the expected score of a player elo points stronger. """
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def elo_from_score(score):
+    """ Returns the Elo difference which gives the expected score. """
+    return 400 * math.log10(score / (1 - score))
+
+
+def elo_difference(wins, draws, losses):
+    """
+    Returns the Elo difference given by the results, and the margin of its
+    95% confidence interval, or None for either if they cannot be estimated
+    because every game was won or every game was lost.
+    """
+    games = wins + draws + losses
+    if games == 0:
+        return None, None
+    score = (wins + draws / 2) / games
+    if score <= 0 or score >= 1:
+        return None, None
+
+    variance = (wins * (1 - score) ** 2 + draws * (.5 - score) ** 2
+                + losses * score ** 2) / games
+    margin = 1.96 * math.sqrt(variance / games)
+    low = max(score - margin, 1e-6)
+    high = min(score + margin, 1 - 1e-6)
+    return elo_from_score(score), (elo_from_score(high) - elo_from_score(low)) / 2
+
+
+def sprt_llr(wins, draws, losses, elo0, elo1):
+    """
+    Returns the log likelihood ratio of the candidate being elo1 rather than
+    elo0 stronger, approximating the results as normally distributed.
+    """
+    games = wins + draws + losses
+    if games == 0:
+        return 0.0
+    score = (wins + draws / 2) / games
+    variance = (wins + draws / 4) / games - score ** 2
+    if variance <= 0:
+        return 0.0
+    score0 = expected_score(elo0)
+    score1 = expected_score(elo1)
+    return (score1 - score0) * (2 * score - score0 - score1) / (2 * variance / games)
+
+
+def sprt_bounds(alpha, beta):
+    """
+    Returns the log likelihood ratios below which the test accepts elo0 and
+    above which it accepts elo1, for false positive rate alpha and false
+    negative rate beta.
+    """
+    return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+
+def run_tournament(games, workers=1, depth=2, time_limit=None, opening_plies=8,
+                   candidate_settings=None, baseline_settings=None,
+                   elo0=0, elo1=5, alpha=.05, beta=.05, seed=0,
+                   pgn_file=None, verbose=True, time_control=None):
+    """
+    Plays up to the given number of games between the candidate and the
+    baseline, and returns a dictionary of the wins, draws and losses of the
+    candidate, its estimated Elo difference and the result of the SPRT
+    ('H1' if the candidate is elo1 stronger, 'H0' if it is only elo0
+    stronger, or None if the match ended first).
+    """
+    random_generator = random.Random(seed)
+    openings = choose_openings(resources.openings(), (games + 1) // 2,
+                               opening_plies, random_generator)
+    tasks = [
+        (game_index, openings[game_index // 2], game_index % 2 == 0,
+         candidate_settings or {}, baseline_settings or {}, depth, time_limit,
+         time_control, seed + game_index)
+        for game_index in range(min(games, len(openings) * 2))
+    ]
+
+    writer = PgnWriter(pgn_file) if pgn_file is not None else None
+    lower_bound, upper_bound = sprt_bounds(alpha, beta)
+    wins = draws = losses = 0
+    llr = 0.0
+    decision = None
+
+    # Load the shared resources before forking, so every worker inherits them
+    resources.preload()
+    pool = multiprocessing.Pool(workers)
+    try:
+        for game_index, score, pgn in pool.imap_unordered(play_game, tasks):
+            if score == 1:
+                wins += 1
+            elif score == 0:
+                losses += 1
+            else:
+                draws += 1
+            if writer is not None:
+                writer.write(pgn)
+
+            elo, margin = elo_difference(wins, draws, losses)
+            llr = sprt_llr(wins, draws, losses, elo0, elo1)
+            if verbose:
+                print('Games {:>5}  +{} ={} -{}  Elo {}  LLR {:.2f} [{:.2f}, {:.2f}]'.format(
+                    wins + draws + losses, wins, draws, losses,
+                    'n/a' if elo is None else '{:.1f} +/- {:.1f}'.format(elo, margin),
+                    llr, lower_bound, upper_bound))
+
+            if llr >= upper_bound:
+                decision = 'H1'
+                break
+            if llr <= lower_bound:
+                decision = 'H0'
+                break
+    finally:
+        pool.terminate()
+        pool.join()
+
+    elo, margin = elo_difference(wins, draws, losses)
+    return {
+        'games': wins + draws + losses,
+        'wins': wins,
+        'draws': draws,
+        'losses': losses,
+        'elo': elo,
+        'elo_margin': margin,
+        'llr': llr,
+        'sprt': decision,
+    }
+
+
+def parse_settings(assignments):
+    """
+    Returns the Engine settings given as name=value strings, where each value
+    is read as json if it can be and as a string otherwise.
+    """
+    settings = {}
+    for assignment in assignments:
+        name, _, value = assignment.partition('=')
+        try:
+            settings[name] = json.loads(value)
+        except ValueError:
+            settings[name] = value
+    return settings
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--games', type=int, default=100,
+                        help='most games to play')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(),
+                        help='number of games to play at once')
+    parser.add_argument('--depth', type=float, default=2,
+                        help='greatest depth each move is searched to')
+    parser.add_argument('--time', type=float,
+                        help='seconds each move may be searched for')
+    parser.add_argument('--tc', metavar='SECONDS+INCREMENT',
+                        help='clock of each engine, such as 60+0.5, instead of --time')
+    parser.add_argument('--opening-plies', type=int, default=8,
+                        help='half moves of each book opening to play before searching')
+    parser.add_argument('--candidate', action='append', default=[],
+                        metavar='NAME=VALUE', help='Engine setting of the candidate')
+    parser.add_argument('--baseline', action='append', default=[],
+                        metavar='NAME=VALUE', help='Engine setting of the baseline')
+    parser.add_argument('--elo0', type=float, default=0,
+                        help='Elo difference of the null hypothesis')
+    parser.add_argument('--elo1', type=float, default=5,
+                        help='Elo difference of the alternative hypothesis')
+    parser.add_argument('--alpha', type=float, default=.05,
+                        help='false positive rate of the SPRT')
+    parser.add_argument('--beta', type=float, default=.05,
+                        help='false negative rate of the SPRT')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed for the choice of openings and the engines\' random choices')
+    parser.add_argument('--pgn', help='file to write the games to')
+    arguments = parser.parse_args(arguments)
+
+    time_control = None
+    if arguments.tc:
+        base, _, increment = arguments.tc.partition('+')
+        time_control = (float(base), float(increment or 0))
+
+    pgn_file = open(arguments.pgn, 'w') if arguments.pgn else None
+    try:
+        result = run_tournament(
+            arguments.games, arguments.workers, arguments.depth, arguments.time,
+            arguments.opening_plies, parse_settings(arguments.candidate),
+            parse_settings(arguments.baseline), arguments.elo0, arguments.elo1,
+            arguments.alpha, arguments.beta, arguments.seed, pgn_file,
+            time_control=time_control,
+        )
+    finally:
+        if pgn_file is not None:
+            pgn_file.close()
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,145 @@
+from array import array
+
+from search_board import NO_MOVE, decode_move, encode_move
+
+
+class TranspositionEntry:
+    """
+    A single stored search result.
+    The score is always from the point of view of the engine that stored it,
+    and the bound tells whether that score is exact or only a limit on the
+    real value of the position.
+    """
+    __slots__ = ('key', 'depth', 'score', 'bound', 'move', 'generation')
+
+    def __init__(self, key, depth, score, bound, move, generation):
+        self.key = key
+        self.depth = depth
+        self.score = score
+        self.bound = bound
+        self.move = move
+        self.generation = generation
+
+
+class TranspositionTable:
+    """
+    Remembers positions that have already been searched, keyed by their Zobrist
+    hash, so that positions reached through a different move order do not have
+    to be searched again.
+
+    The table is a fixed number of buckets, each holding two entries:
+    the first slot only gets replaced by a search of equal or greater depth (or
+    by anything once the stored entry is from an older search), and the second
+    slot is always replaced.
+
+    Every field of the entries is kept in its own array, allocated in full up
+    front, so that storing results creates no objects and the table's memory
+    does not grow as it fills. Moves are stored by their code (see
+    search_board.encode_move). The search looks slots up with find and reads
+    the arrays directly, while probe returns a TranspositionEntry copy.
+    """
+    EXACT = 0
+    LOWER_BOUND = 1
+    UPPER_BOUND = 2
+    # The bound of a slot that holds no entry
+    EMPTY = -1
+
+    # Number of bytes used by one entry: its key, depth, score, bound, move
+    # and generation
+    ENTRY_SIZE = 27
+
+    def __init__(self, size_mb=16):
+        self.size_mb = size_mb
+        num_entries = max(2, int(size_mb * 1024 * 1024) // self.ENTRY_SIZE)
+        self.num_buckets = num_entries // 2
+        self.clear()
+
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+
+    def clear(self):
+        """ Removes every stored entry. """
+        num_entries = self.num_buckets * 2
+        self.keys = array('Q', [0]) * num_entries
+        self.depths = array('f', [0]) * num_entries
+        self.scores = array('d', [0]) * num_entries
+        self.bounds = array('b', [self.EMPTY]) * num_entries
+        self.moves = array('H', [NO_MOVE]) * num_entries
+        # Incremented at the start of every search so that deep but stale
+        # entries stop blocking the depth-preferred slot
+        self.generations = array('L', [0]) * num_entries
+        self.generation = 0
+
+    def new_search(self):
+        """ Marks every entry currently in the table as coming from an older search. """
+        self.generation += 1
+
+    def find(self, key):
+        """
+        Returns the index of the slot holding the entry for the given Zobrist
+        key, or -1 if the position has not been stored.
+        """
+        self.probes += 1
+        index = (key % self.num_buckets) * 2
+        keys = self.keys
+        bounds = self.bounds
+        if keys[index] == key and bounds[index] != self.EMPTY:
+            self.hits += 1
+            return index
+        index += 1
+        if keys[index] == key and bounds[index] != self.EMPTY:
+            self.hits += 1
+            return index
+        return -1
+
+    def move_at(self, index):
+        """ Returns the best move stored in the slot, or None if it has none. """
+        code = self.moves[index]
+        return decode_move(code) if code != NO_MOVE else None
+
+    def probe(self, key):
+        """
+        Returns a TranspositionEntry with the result stored for the given
+        Zobrist key, or None if the position has not been stored.
+        """
+        index = self.find(key)
+        if index < 0:
+            return None
+        return TranspositionEntry(
+            key, self.depths[index], self.scores[index], self.bounds[index],
+            self.move_at(index), self.generations[index]
+        )
+
+    def store(self, key, depth, score, bound, move):
+        """ Stores a search result for the given Zobrist key. """
+        self.stores += 1
+        index = (key % self.num_buckets) * 2
+        code = encode_move(move) if move is not None else NO_MOVE
+        deep_empty = self.bounds[index] == self.EMPTY
+        same_key = not deep_empty and self.keys[index] == key
+
+        if same_key and code == NO_MOVE:
+            # Keep the best move of an earlier search of this position if the
+            # new search did not find one
+            code = self.moves[index]
+
+        if not (deep_empty or same_key or depth >= self.depths[index]
+                or self.generations[index] != self.generation):
+            index += 1
+        self.keys[index] = key
+        self.depths[index] = depth
+        self.scores[index] = score
+        self.bounds[index] = bound
+        self.moves[index] = code
+        self.generations[index] = self.generation
+
+    def hit_rate(self):
+        """ Returns the fraction of probes that found a stored entry. """
+        if self.probes == 0:
+            return 0.0
+        return self.hits / self.probes
+
+    def usage(self):
+        """ Returns the fraction of slots that currently hold an entry. """
+        return 1 - self.bounds.count(self.EMPTY) / len(self.bounds)